@@ -1,7 +1,27 @@
-from .core import ObsidianBackuper
-from .cli import main
-from .tui import run_tui
-from .exceptions import ObsidianBackupError
+from importlib import import_module
+from .exceptions import ObsidianBackupError, DecryptionError
 
 __version__ = "1.0.2"
-__all__ = ["ObsidianBackuper", "ObsidianDecryptor", "main", "run_tui", "ObsidianBackupError", "DecryptionError"]
\ No newline at end of file
+__all__ = ["ObsidianBackuper", "ObsidianDecryptor", "main", "run_tui", "ObsidianBackupError", "DecryptionError"]
+
+# Imported on first access, so that ``import obsidian_backuper.cli`` (and
+# with it every CLI run) doesn't load Textual, cryptography and the archive
+# code before it knows which of them the command needs.
+_LAZY = {
+    "ObsidianBackuper": ".core",
+    "ObsidianDecryptor": ".obsidian_decryptor",
+    "main": ".cli",
+    "run_tui": ".tui",
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,122 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, List, Optional, TypeVar
+from .core import ObsidianBackuper
+from .obsidian_decryptor import ObsidianDecryptor
+from .exceptions import OperationCancelled
+from .progress import ProgressCallback, ProgressEvent
+from . import compression
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_shared_executor: Optional[ThreadPoolExecutor] = None
+_shared_lock = threading.Lock()
+
+
+def default_max_jobs() -> int:
+    return max(2, os.cpu_count() or 1)
+
+
+def shared_executor(max_jobs: Optional[int] = None) -> ThreadPoolExecutor:
+    """Process-wide pool running the blocking parts of async operations.
+
+    Created on first use with ``max_jobs`` workers (default: CPU count, at
+    least 2); jobs beyond that wait in its queue. ``max_jobs`` is ignored
+    once the pool exists.
+    """
+    global _shared_executor
+    with _shared_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=max_jobs or default_max_jobs(),
+                                                  thread_name_prefix="obsidian-backup")
+        return _shared_executor
+
+
+async def run_cancellable(func: Callable[..., T], *args, progress: Optional[ProgressCallback] = None,
+                          executor: Optional[Executor] = None, **kwargs) -> T:
+    """Run ``func(*args, progress=..., **kwargs)`` on ``executor`` without blocking the loop.
+
+    ``func`` must report through its ``progress`` callback, which is what
+    makes it cancellable: when the awaiting task is cancelled, the next
+    progress report raises :class:`OperationCancelled` inside ``func``, whose
+    usual failure handling removes partial output, and the task only
+    finishes once ``func`` has stopped. ``progress`` itself is called on the
+    event loop.
+    """
+    loop = asyncio.get_running_loop()
+    cancel = threading.Event()
+
+    def on_progress(event: ProgressEvent):
+        # The final event comes after the output is complete; let it through.
+        if cancel.is_set() and not event.finished:
+            raise OperationCancelled("Operation cancelled")
+        if progress is not None:
+            loop.call_soon_threadsafe(progress, event)
+
+    future = (executor or shared_executor()).submit(func, *args, progress=on_progress, **kwargs)
+    waiter = asyncio.wrap_future(future)
+    try:
+        return await asyncio.shield(waiter)
+    except asyncio.CancelledError:
+        cancel.set()
+        logger.info(f"Cancelling {getattr(func, '__name__', func)}")
+        if not future.cancel():
+            try:
+                await waiter
+            except Exception:
+                pass
+        raise
+
+
+class AsyncObsidianBackuper:
+    """Asyncio front end to :class:`ObsidianBackuper`.
+
+    Each call runs the blocking scan/compress/encrypt pipeline on a shared
+    bounded thread pool (or ``executor``), so many backups and restores can
+    be awaited concurrently while at most ``max_jobs`` of them run. Cancelling
+    the awaiting task stops the operation within one progress interval and
+    removes its partial archive or restored vault.
+    """
+
+    def __init__(self, vault_path: str, require_directory: bool = True,
+                 executor: Optional[Executor] = None):
+        self.backuper = ObsidianBackuper(vault_path, require_directory)
+        self.executor = executor
+
+    async def create_backup(self, encrypt: bool = False, password: Optional[str] = None,
+                            codec: str = compression.DEFAULT_CODEC, threads: Optional[int] = None,
+                            incremental: bool = False, archive_format: str = "tar",
+                            progress: Optional[ProgressCallback] = None, catalog_files: bool = False) -> str:
+        return await run_cancellable(
+            self.backuper.create_backup, encrypt=encrypt, password=password, codec=codec, threads=threads,
+            incremental=incremental, archive_format=archive_format, catalog_files=catalog_files,
+            progress=progress, executor=self.executor,
+        )
+
+    async def restore_backup(self, target_dir: str, password: Optional[str] = None,
+                             paths: Optional[List[str]] = None, workers: Optional[int] = None,
+                             progress: Optional[ProgressCallback] = None) -> str:
+        return await run_cancellable(
+            self.backuper.restore_backup, target_dir, password=password, paths=paths, workers=workers,
+            progress=progress, executor=self.executor,
+        )
+
+    async def decrypt_backup(self, output_dir: Optional[str] = None, password: Optional[str] = None,
+                             progress: Optional[ProgressCallback] = None) -> str:
+        return await run_cancellable(
+            self.backuper.decrypt_backup, output_dir, password=password,
+            progress=progress, executor=self.executor,
+        )
+
+
+async def decrypt(encrypted_file_path: str, password: str, output_dir: Optional[str] = None,
+                  progress: Optional[ProgressCallback] = None, executor: Optional[Executor] = None) -> str:
+    """Async :meth:`ObsidianDecryptor.decrypt`; partial plaintext is removed on cancellation."""
+    decryptor = ObsidianDecryptor(encrypted_file_path)
+    return await run_cancellable(decryptor.decrypt, password, output_dir=output_dir,
+                                 progress=progress, executor=executor)
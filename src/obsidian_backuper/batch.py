@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+from .core import ObsidianBackuper
+from .options import ARCHIVE_FORMATS
+from .exceptions import ConfigError
+from .ignore import SkipStats
+from . import compression
+
+logger = logging.getLogger(__name__)
+
+CONFIG_KEYS = {"path", "password", "password_env", "encrypt", "codec", "incremental", "format",
+               "exclude", "include", "default_excludes", "adaptive_compression",
+               "zstd_dictionary", "cipher", "keyfiles", "catalog_files"}
+
+
+class VaultJob(NamedTuple):
+    vault: str
+    password: Optional[str] = None
+    encrypt: bool = True
+    codec: str = compression.DEFAULT_CODEC
+    incremental: bool = False
+    archive_format: str = "tar"
+    exclude: Sequence[str] = ()
+    include: Sequence[str] = ()
+    default_excludes: bool = True
+    adaptive_compression: bool = True
+    zstd_dictionary: bool = False
+    cipher: Optional[str] = None
+    keyfiles: Sequence[str] = ()
+    catalog_files: bool = False
+
+
+class VaultResult(NamedTuple):
+    vault: str
+    archive: Optional[str]
+    seconds: float
+    size: int = 0
+    error: Optional[str] = None
+    skipped: SkipStats = SkipStats()
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BatchSummary(NamedTuple):
+    results: List[VaultResult]
+    seconds: float
+
+    @property
+    def succeeded(self) -> List[VaultResult]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> List[VaultResult]:
+        return [result for result in self.results if not result.ok]
+
+    def format(self) -> str:
+        lines = [f"Backed up {len(self.succeeded)}/{len(self.results)} vaults in {self.seconds:.1f}s"]
+        for result in self.results:
+            if result.ok:
+                lines.append(f"  OK    {result.vault}  {result.seconds:.1f}s  "
+                             f"{result.size / 1e6:.1f} MB  {result.archive}")
+                if result.skipped.dirs or result.skipped.files:
+                    lines.append(f"        {result.skipped.format()}")
+            else:
+                lines.append(f"  FAIL  {result.vault}  {result.seconds:.1f}s  {result.error}")
+        return "\n".join(lines)
+
+
+def _job_from_config(entry, defaults: dict, base_dir: str, password: Optional[str]) -> VaultJob:
+    if isinstance(entry, str):
+        entry = {"path": entry}
+    if not isinstance(entry, dict) or "path" not in entry:
+        raise ConfigError(f"Vault entry must be a path or an object with a 'path': {entry!r}")
+    options = {**defaults, **entry}
+    unknown = set(options) - CONFIG_KEYS
+    if unknown:
+        raise ConfigError(f"Unknown vault config keys: {', '.join(sorted(unknown))}")
+
+    if "password_env" in options:
+        password = os.getenv(options["password_env"])
+        if password is None:
+            raise ConfigError(f"Environment variable {options['password_env']} not set "
+                              f"(password for {options['path']})")
+    password = options.get("password", password)
+    return VaultJob(
+        vault=os.path.join(base_dir, os.path.expanduser(options["path"])),
+        password=password,
+        encrypt=bool(options.get("encrypt", True)),
+        codec=compression.validate_codec(options.get("codec", compression.DEFAULT_CODEC)),
+        incremental=bool(options.get("incremental", False)),
+        archive_format=options.get("format", "tar"),
+        exclude=tuple(options.get("exclude", ())),
+        include=tuple(options.get("include", ())),
+        default_excludes=bool(options.get("default_excludes", True)),
+        adaptive_compression=bool(options.get("adaptive_compression", True)),
+        zstd_dictionary=bool(options.get("zstd_dictionary", False)),
+        cipher=options.get("cipher"),
+        keyfiles=tuple(os.path.join(base_dir, os.path.expanduser(keyfile))
+                       for keyfile in options.get("keyfiles", ())),
+        catalog_files=bool(options.get("catalog_files", False)),
+    )
+
+
+def load_vault_config(path: str, password: Optional[str] = None) -> List[VaultJob]:
+    """Read a JSON list of vaults to back up.
+
+    The file holds either a list of entries or ``{"defaults": {...},
+    "vaults": [...]}``. An entry is a vault path or an object with ``path``
+    and any of ``password``, ``password_env``, ``encrypt``, ``codec``,
+    ``incremental``, ``format``, ``exclude``, ``include``,
+    ``default_excludes``, ``adaptive_compression``, ``zstd_dictionary``,
+    ``cipher``, ``keyfiles`` and ``catalog_files``. Relative paths are resolved against the
+    config file; ``password`` is used where an entry sets none.
+    """
+    try:
+        with open(path) as f:
+            raw = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot read vault config {path}: {str(e)}")
+    if isinstance(raw, list):
+        raw = {"vaults": raw}
+    if not isinstance(raw, dict) or not isinstance(raw.get("vaults"), list):
+        raise ConfigError(f"Vault config must contain a 'vaults' list: {path}")
+    defaults = raw.get("defaults", {})
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [_job_from_config(entry, defaults, base_dir, password) for entry in raw["vaults"]]
+
+
+def _run_job(job: VaultJob, threads: Optional[int]) -> VaultResult:
+    started = time.perf_counter()
+    try:
+        if job.archive_format not in ARCHIVE_FORMATS:
+            raise ConfigError(f"Unknown archive format: {job.archive_format}")
+        backuper = ObsidianBackuper(job.vault, exclude=job.exclude, include=job.include,
+                                    default_excludes=job.default_excludes,
+                                    adaptive_compression=job.adaptive_compression,
+                                    zstd_dictionary=job.zstd_dictionary, cipher=job.cipher,
+                                    keyfiles=job.keyfiles)
+        archive = backuper.create_backup(
+            encrypt=job.encrypt,
+            password=job.password,
+            codec=job.codec,
+            threads=threads,
+            incremental=job.incremental,
+            archive_format=job.archive_format,
+            catalog_files=job.catalog_files,
+        )
+        return VaultResult(job.vault, archive, time.perf_counter() - started, os.path.getsize(archive),
+                           skipped=backuper.skipped)
+    except Exception as e:
+        logger.error(f"Backup of {job.vault} failed: {str(e)}")
+        return VaultResult(job.vault, None, time.perf_counter() - started, error=str(e))
+
+
+def backup_vaults(jobs: Iterable[VaultJob], workers: Optional[int] = None,
+                  threads: Optional[int] = None) -> BatchSummary:
+    """Back up several vaults on a bounded thread pool.
+
+    A failing vault is reported in its :class:`VaultResult` and does not
+    stop the others. Vaults sharing a password share one derived key, so
+    the KDF runs once per password rather than once per vault. Unless
+    ``threads`` is given, the CPU cores are split between concurrent
+    vaults for compression.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return BatchSummary([], 0.0)
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or max(2, cpus), len(jobs)))
+    threads = threads or max(1, cpus // workers)
+
+    started = time.perf_counter()
+    logger.info(f"Backing up {len(jobs)} vaults with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda job: _run_job(job, threads), jobs))
+    summary = BatchSummary(results, time.perf_counter() - started)
+    logger.info(f"Backed up {len(summary.succeeded)}/{len(results)} vaults in {summary.seconds:.1f}s")
+    return summary
@@ -0,0 +1,436 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from .core import ObsidianBackuper
+from .exceptions import ConfigError, ObsidianBackupError
+from .crypto import clear_key_cache
+from . import compression
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+RESULT_VERSION = 1
+CASES = ("backup", "encrypt", "decrypt", "restore")
+PASSWORD = "benchmark-password"
+DEFAULT_THRESHOLD = 0.10
+# Metrics where a higher value in the current run is a regression.
+COMPARED_METRICS = ("wall_s", "cpu_s", "peak_rss_bytes", "bytes_written")
+
+# Attachments are random bytes behind a real file signature, so they are as
+# incompressible as the media files found in real vaults.
+ATTACHMENT_TYPES = {
+    ".png": b"\x89PNG\r\n\x1a\n",
+    ".jpg": b"\xff\xd8\xff\xe0",
+    ".pdf": b"%PDF-1.7\n",
+}
+
+
+class VaultSpec(NamedTuple):
+    """Shape of a synthetic vault; the same spec and seed give the same vault."""
+    notes: int = 1000
+    note_size: int = 4096
+    note_size_sigma: float = 1.0
+    attachments: int = 50
+    attachment_size: int = 256 * 1024
+    depth: int = 3
+    fanout: int = 4
+    seed: int = 0
+
+
+def _directories(spec: VaultSpec) -> List[str]:
+    dirs = [""]
+    level = [""]
+    for depth in range(spec.depth):
+        level = [f"{parent}/folder{depth}_{i}".lstrip("/") for parent in level for i in range(spec.fanout)]
+        dirs.extend(level)
+    return dirs
+
+
+def _note_text(rng: random.Random, vocabulary: List[str], titles: List[str], size: int) -> str:
+    parts = [f"# {rng.choice(titles)}\n\ntags: #{rng.choice(vocabulary)} #{rng.choice(vocabulary)}\n\n"]
+    length = len(parts[0])
+    while length < size:
+        words = rng.choices(vocabulary, k=rng.randint(20, 80))
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), f"[[{rng.choice(titles)}]]")
+        line = ("- " if rng.random() < 0.2 else "") + " ".join(words) + ".\n\n"
+        parts.append(line)
+        length += len(line)
+    return "".join(parts)[:size]
+
+
+def generate_vault(path: str, spec: VaultSpec = VaultSpec()) -> Dict[str, int]:
+    """Write a synthetic Obsidian vault described by ``spec`` into ``path``.
+
+    Note sizes follow a log-normal distribution around ``spec.note_size``.
+    Returns the number of files and bytes written.
+    """
+    rng = random.Random(spec.seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    vocabulary = ["".join(rng.choices(alphabet, k=rng.randint(2, 10))) for _ in range(2000)]
+    titles = [" ".join(rng.choices(vocabulary, k=3)).title() for _ in range(max(spec.notes, 1))]
+    dirs = _directories(spec)
+
+    os.makedirs(os.path.join(path, ".obsidian"), exist_ok=True)
+    with open(os.path.join(path, ".obsidian", "app.json"), "w") as f:
+        json.dump({"attachmentFolderPath": "./", "showLineNumber": True}, f)
+    files, total = 1, os.path.getsize(os.path.join(path, ".obsidian", "app.json"))
+    for rel in dirs[1:]:
+        os.makedirs(os.path.join(path, rel), exist_ok=True)
+
+    for i in range(spec.notes):
+        size = max(64, int(rng.lognormvariate(0, spec.note_size_sigma) * spec.note_size))
+        data = _note_text(rng, vocabulary, titles, size).encode()
+        with open(os.path.join(path, rng.choice(dirs), f"{titles[i]} {i}.md"), "wb") as f:
+            f.write(data)
+        files += 1
+        total += len(data)
+
+    extensions = sorted(ATTACHMENT_TYPES)
+    for i in range(spec.attachments):
+        ext = rng.choice(extensions)
+        size = max(64, int(rng.lognormvariate(0, 0.5) * spec.attachment_size))
+        data = ATTACHMENT_TYPES[ext] + rng.randbytes(size)
+        with open(os.path.join(path, rng.choice(dirs), f"attachment_{i}{ext}"), "wb") as f:
+            f.write(data)
+        files += 1
+        total += len(data)
+    return {"files": files, "bytes": total}
+
+
+def _tree_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, _, filenames in os.walk(path) for name in filenames)
+
+
+def _peak_rss() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run_case(case: str, vault: str, archive: Optional[str], codec: str,
+              threads: Optional[int], report_rss: bool) -> dict:
+    """Run one benchmark case and clean up everything it wrote."""
+    backup_dir = os.path.dirname(vault)
+    before = set(os.listdir(backup_dir))
+    output_dir = tempfile.mkdtemp(prefix="out.", dir=os.path.dirname(backup_dir))
+    # Every sample pays for key derivation, as a real backup run would.
+    clear_key_cache()
+    try:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if case == "backup":
+            ObsidianBackuper(vault).create_backup(codec=codec, threads=threads)
+        elif case == "encrypt":
+            ObsidianBackuper(vault).create_backup(encrypt=True, password=PASSWORD,
+                                                  codec=codec, threads=threads)
+        elif case == "decrypt":
+            ObsidianBackuper(archive, require_directory=False).decrypt_backup(output_dir, password=PASSWORD)
+        elif case == "restore":
+            ObsidianBackuper(archive, require_directory=False).restore_backup(
+                output_dir, password=PASSWORD, workers=threads
+            )
+        else:
+            raise ConfigError(f"Unknown benchmark case: {case}")
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+        created = [os.path.join(backup_dir, name) for name in set(os.listdir(backup_dir)) - before]
+        written = _tree_size(output_dir) + sum(_tree_size(path) for path in created)
+        for path in created:
+            os.unlink(path)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {
+        "wall_s": wall,
+        "cpu_s": cpu,
+        "peak_rss_bytes": _peak_rss() if report_rss else None,
+        "bytes_written": written,
+    }
+
+
+def _run_isolated(*args) -> dict:
+    # A fresh interpreter per sample keeps peak RSS from leaking between cases.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_run_case, *args, True).result()
+
+
+def _summarize(samples: List[dict], vault_bytes: int) -> dict:
+    wall = min(sample["wall_s"] for sample in samples)
+    rss = [sample["peak_rss_bytes"] for sample in samples if sample["peak_rss_bytes"] is not None]
+    return {
+        "wall_s": wall,
+        "cpu_s": min(sample["cpu_s"] for sample in samples),
+        "throughput_mb_s": vault_bytes / wall / 1e6 if wall else None,
+        "peak_rss_bytes": max(rss) if rss else None,
+        "bytes_written": samples[-1]["bytes_written"],
+        "samples": samples,
+    }
+
+
+def run_benchmarks(spec: VaultSpec = VaultSpec(), cases: Sequence[str] = CASES,
+                   codec: str = compression.DEFAULT_CODEC, threads: Optional[int] = None,
+                   repeat: int = 3, workdir: Optional[str] = None, isolate: bool = True) -> dict:
+    """Generate a vault from ``spec`` and time each case ``repeat`` times.
+
+    Each case reports its best wall and CPU time, throughput over the vault
+    size, bytes written and, when ``isolate`` runs every sample in its own
+    process, peak RSS. Encrypted runs include key derivation.
+    """
+    for case in cases:
+        if case not in CASES:
+            raise ConfigError(f"Unknown benchmark case: {case} (expected one of {', '.join(CASES)})")
+    compression.validate_codec(codec)
+    if repeat < 1:
+        raise ConfigError("Benchmark repeat count must be at least 1")
+
+    root = tempfile.mkdtemp(prefix="obsidian_bench.", dir=workdir)
+    try:
+        vault = os.path.join(root, "vaults", "vault")
+        os.makedirs(vault)
+        logger.info(f"Generating synthetic vault: {spec}")
+        vault_stats = generate_vault(vault, spec)
+
+        archive = None
+        if {"decrypt", "restore"} & set(cases):
+            backup = ObsidianBackuper(vault).create_backup(encrypt=True, password=PASSWORD, codec=codec)
+            os.makedirs(os.path.join(root, "input"))
+            for path in os.listdir(os.path.dirname(vault)):
+                if path != "vault":
+                    shutil.move(os.path.join(root, "vaults", path), os.path.join(root, "input", path))
+            archive = os.path.join(root, "input", os.path.basename(backup))
+
+        results = {}
+        for case in cases:
+            samples = []
+            for _ in range(repeat):
+                args = (case, vault, archive, codec, threads)
+                samples.append(_run_isolated(*args) if isolate else _run_case(*args, False))
+            results[case] = _summarize(samples, vault_stats["bytes"])
+            logger.info(f"{case}: {results[case]['wall_s']:.3f}s, "
+                        f"{results[case]['throughput_mb_s']:.1f} MB/s")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "version": RESULT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "spec": spec._asdict(),
+        "vault": vault_stats,
+        "options": {"codec": codec, "threads": threads, "repeat": repeat, "isolate": isolate},
+        "results": results,
+    }
+
+
+NOTE_METHODS = ("gzip", "zstd", "zstd+dict")
+
+
+def _time_best(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_note_compression(spec: VaultSpec = VaultSpec(attachments=0), repeat: int = 3,
+                               workdir: Optional[str] = None) -> dict:
+    """Compress every note of a synthetic vault on its own with gzip, zstd and zstd with a trained dictionary.
+
+    This is the small-block case of random-access formats. The dictionary's
+    size is included in its compressed bytes, and its training time is
+    reported separately.
+    """
+    if repeat < 1:
+        raise ConfigError("Benchmark repeat count must be at least 1")
+    root = tempfile.mkdtemp(prefix="obsidian_bench.", dir=workdir)
+    try:
+        vault = os.path.join(root, "vault")
+        os.makedirs(vault)
+        generate_vault(vault, spec._replace(attachments=0))
+        notes = []
+        for dirpath, _, filenames in os.walk(vault):
+            for name in sorted(filenames):
+                if name.endswith(".md"):
+                    with open(os.path.join(dirpath, name), "rb") as f:
+                        notes.append(f.read())
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    raw = sum(map(len, notes))
+
+    started = time.perf_counter()
+    dictionary = compression.train_dictionary(notes)
+    train_s = time.perf_counter() - started
+    if dictionary is None:
+        raise ConfigError("Too few notes to train a dictionary; raise --notes")
+
+    results = {}
+    for method in NOTE_METHODS:
+        codec, extra = ("zstd", dictionary) if method == "zstd+dict" else (method, None)
+        compressed = [compression.compress_block(note, codec, dictionary=extra) for note in notes]
+        compress_s = _time_best(lambda: [compression.compress_block(note, codec, dictionary=extra)
+                                         for note in notes], repeat)
+        decompress_s = _time_best(lambda: [compression.decompress_block(block, codec, dictionary=extra)
+                                           for block in compressed], repeat)
+        size = sum(map(len, compressed)) + (len(dictionary) if extra else 0)
+        results[method] = {
+            "bytes": size,
+            "ratio": raw / size,
+            "compress_mb_s": raw / compress_s / 1e6 if compress_s else None,
+            "decompress_mb_s": raw / decompress_s / 1e6 if decompress_s else None,
+        }
+    return {
+        "notes": len(notes),
+        "bytes": raw,
+        "dictionary_bytes": len(dictionary),
+        "train_s": train_s,
+        "results": results,
+    }
+
+
+def _print_note_results(report: dict):
+    print(f"Notes: {report['notes']}, {report['bytes'] / 1e6:.1f} MB; "
+          f"dictionary {report['dictionary_bytes'] / 1024:.0f} KiB trained in {report['train_s']:.2f}s")
+    for method, result in report["results"].items():
+        print(f"{method:>10}: ratio {result['ratio']:5.2f}  {result['bytes'] / 1e6:8.2f} MB  "
+              f"compress {result['compress_mb_s']:8.1f} MB/s  decompress {result['decompress_mb_s']:8.1f} MB/s")
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """Return the metrics of ``current`` that got worse than ``baseline`` by more than ``threshold``."""
+    if baseline.get("spec") != current.get("spec") or baseline.get("options", {}).get("codec") != \
+            current.get("options", {}).get("codec"):
+        raise ConfigError("Benchmark results were produced with different vault specs or codecs")
+    regressions = []
+    for case, result in current["results"].items():
+        base = baseline["results"].get(case)
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change > threshold:
+                regressions.append({"case": case, "metric": metric, "baseline": old,
+                                    "current": new, "change": change})
+    return regressions
+
+
+def _print_results(report: dict):
+    print(f"Vault: {report['vault']['files']} files, {report['vault']['bytes'] / 1e6:.1f} MB")
+    for case, result in report["results"].items():
+        rss = result["peak_rss_bytes"]
+        print(f"{case:>8}: {result['wall_s']:8.3f}s wall {result['cpu_s']:8.3f}s cpu "
+              f"{result['throughput_mb_s']:8.1f} MB/s "
+              f"{(f'{rss / 2**20:.1f} MiB' if rss else 'n/a'):>10} peak RSS "
+              f"{result['bytes_written'] / 1e6:8.1f} MB written")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Obsidian Backup benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Generate a synthetic vault and benchmark backup operations")
+    defaults = VaultSpec()
+    run.add_argument("--notes", type=int, default=defaults.notes)
+    run.add_argument("--note-size", type=int, default=defaults.note_size, help="Median note size in bytes")
+    run.add_argument("--note-size-sigma", type=float, default=defaults.note_size_sigma,
+                     help="Log-normal sigma of note sizes")
+    run.add_argument("--attachments", type=int, default=defaults.attachments)
+    run.add_argument("--attachment-size", type=int, default=defaults.attachment_size,
+                     help="Median attachment size in bytes")
+    run.add_argument("--depth", type=int, default=defaults.depth, help="Folder nesting depth")
+    run.add_argument("--fanout", type=int, default=defaults.fanout, help="Subfolders per folder")
+    run.add_argument("--seed", type=int, default=defaults.seed)
+    run.add_argument("--cases", default=",".join(CASES), help="Comma-separated cases to run")
+    run.add_argument("--codec", choices=compression.CODECS, default=compression.DEFAULT_CODEC)
+    run.add_argument("--threads", type=int, default=None)
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--workdir", help="Directory for the generated vault (default: system temp)")
+    run.add_argument("--no-isolate", action="store_true",
+                     help="Run in this process (faster, but no peak RSS)")
+    run.add_argument("--output", help="Write the JSON report to this file")
+
+    notes = commands.add_parser("notes", help="Compare per-note gzip, zstd and zstd with a trained dictionary")
+    notes.add_argument("--notes", type=int, default=defaults.notes)
+    notes.add_argument("--note-size", type=int, default=defaults.note_size, help="Median note size in bytes")
+    notes.add_argument("--seed", type=int, default=defaults.seed)
+    notes.add_argument("--repeat", type=int, default=3)
+    notes.add_argument("--output", help="Write the JSON report to this file")
+
+    cmp = commands.add_parser("compare", help="Compare two JSON reports and flag regressions")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                     help="Allowed relative slowdown before flagging (default: 0.10)")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "run":
+            spec = VaultSpec(args.notes, args.note_size, args.note_size_sigma, args.attachments,
+                             args.attachment_size, args.depth, args.fanout, args.seed)
+            report = run_benchmarks(spec, [case for case in args.cases.split(",") if case],
+                                    codec=args.codec, threads=args.threads, repeat=args.repeat,
+                                    workdir=args.workdir, isolate=not args.no_isolate)
+            _print_results(report)
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(report, f, indent=2)
+            return 0
+
+        if args.command == "notes":
+            report = benchmark_note_compression(
+                VaultSpec(notes=args.notes, note_size=args.note_size, attachments=0, seed=args.seed),
+                repeat=args.repeat)
+            _print_note_results(report)
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(report, f, indent=2)
+            return 0
+
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} "
+                  f"(+{r['change']:.1%})")
+        if not regressions:
+            print("No regressions")
+        return 1 if regressions else 0
+    except (ObsidianBackupError, OSError, ValueError) as e:
+        logging.error(f"Benchmark failed: {str(e)}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+from .exceptions import ArchiveError, ConfigError
+from .manifest import Manifest, manifest_path_for
+
+logger = logging.getLogger(__name__)
+
+CATALOG_NAME = "obsidian_backup_catalog.sqlite"
+CATALOG_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    archive TEXT NOT NULL UNIQUE,
+    vault TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    parent TEXT,
+    codec TEXT,
+    format TEXT NOT NULL,
+    encrypted INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    file_count INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_vault_time ON snapshots (vault, created_at);
+CREATE TABLE IF NOT EXISTS files (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT,
+    PRIMARY KEY (snapshot_id, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+"""
+
+
+class SnapshotRecord(NamedTuple):
+    archive: str
+    vault: str
+    created_at: str
+    kind: str
+    parent: Optional[str]
+    codec: Optional[str]
+    format: str
+    encrypted: bool
+    size: int
+    file_count: int
+    total_bytes: int
+
+
+_COLUMNS = ", ".join(SnapshotRecord._fields)
+
+
+def catalog_path_for(backup_dir: str) -> str:
+    return os.path.join(backup_dir, CATALOG_NAME)
+
+
+def format_snapshots(records: Iterable[SnapshotRecord]) -> str:
+    lines = []
+    for record in records:
+        lines.append(f"{record.created_at}  {record.kind:<11}  {record.codec or '-':<5}  "
+                     f"{record.file_count:>6} files  {record.size / 1e6:>9.1f} MB  {record.archive}")
+    return "\n".join(lines) if lines else "No backups in the catalog"
+
+
+class Catalog:
+    """SQLite index of the backups in one backup directory.
+
+    Holds one row per archive (time, size, codec, file count) and,
+    optionally, the vault's file listing at that point, so listing,
+    searching and pruning never open the archives. File listings are
+    stored in plain text, so they are opt-in for encrypted backups.
+    """
+
+    def __init__(self, backup_dir: str):
+        self.backup_dir = os.path.abspath(os.path.expanduser(backup_dir))
+        self.path = catalog_path_for(self.backup_dir)
+        try:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("PRAGMA foreign_keys = ON")
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version > CATALOG_VERSION:
+                raise ArchiveError(f"Unsupported backup catalog version: {version}")
+            with self._db:
+                self._db.executescript(_SCHEMA)
+                self._db.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+        except sqlite3.Error as e:
+            raise ArchiveError(f"Cannot open backup catalog {self.path}: {str(e)}")
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def record(self, manifest: Manifest, archive_path: str, codec: Optional[str], archive_format: str,
+               encrypted: bool, with_files: bool = False):
+        """Add (or replace) the entry for a freshly written archive."""
+        files = manifest.files
+        with self._db:
+            self._db.execute("DELETE FROM snapshots WHERE archive = ?", (manifest.archive,))
+            cursor = self._db.execute(
+                f"INSERT INTO snapshots ({_COLUMNS}) VALUES ({', '.join('?' * len(SnapshotRecord._fields))})",
+                (manifest.archive, manifest.vault, manifest.created_at, manifest.kind, manifest.parent,
+                 codec, archive_format, int(encrypted), os.path.getsize(archive_path), len(files),
+                 sum(entry.size for entry in files.values())),
+            )
+            if with_files:
+                self._db.executemany(
+                    "INSERT INTO files (snapshot_id, path, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?)",
+                    ((cursor.lastrowid, path, entry.size, entry.mtime_ns, entry.digest)
+                     for path, entry in files.items()),
+                )
+
+    def snapshots(self, vault: Optional[str] = None, since: Optional[str] = None,
+                  until: Optional[str] = None) -> List[SnapshotRecord]:
+        """Snapshots, oldest first, optionally limited to a vault and an ISO time range."""
+        query = f"SELECT {_COLUMNS} FROM snapshots WHERE 1 = 1"
+        params = []
+        if vault:
+            query += " AND vault = ?"
+            params.append(vault)
+        if since:
+            query += " AND created_at >= ?"
+            params.append(since)
+        if until:
+            query += " AND created_at <= ?"
+            params.append(until)
+        rows = self._db.execute(query + " ORDER BY created_at, archive", params).fetchall()
+        return [SnapshotRecord(*row[:7], bool(row[7]), *row[8:]) for row in rows]
+
+    def find(self, pattern: str, vault: Optional[str] = None) -> Dict[str, List[str]]:
+        """Map each snapshot (with a file listing) to its vault paths matching glob ``pattern``."""
+        query = ("SELECT s.archive, f.path FROM files f JOIN snapshots s ON s.id = f.snapshot_id "
+                 "WHERE f.path GLOB ?")
+        params = [pattern]
+        if vault:
+            query += " AND s.vault = ?"
+            params.append(vault)
+        matches: Dict[str, List[str]] = {}
+        for archive, path in self._db.execute(query + " ORDER BY s.created_at, f.path", params):
+            matches.setdefault(archive, []).append(path)
+        return matches
+
+    def forget(self, archives: Iterable[str]):
+        with self._db:
+            self._db.executemany("DELETE FROM snapshots WHERE archive = ?", ((name,) for name in archives))
+
+    def prune(self, vault: Optional[str] = None, keep_hourly: int = 0, keep_daily: int = 0,
+              dry_run: bool = False) -> List[SnapshotRecord]:
+        """Delete snapshots not kept by the retention rules; returns the removed ones.
+
+        For each of the last ``keep_hourly`` hours and ``keep_daily`` days
+        that have backups, the newest backup is kept, per vault. Backups an
+        incremental one still depends on are always kept. The archives and
+        manifests are deleted along with their catalog entries.
+        """
+        if keep_hourly <= 0 and keep_daily <= 0:
+            raise ConfigError("Pruning needs --keep-hourly and/or --keep-daily")
+        records = self.snapshots(vault)
+        by_vault: Dict[str, List[SnapshotRecord]] = {}
+        for record in records:
+            by_vault.setdefault(record.vault, []).append(record)
+
+        keep: Set[str] = set()
+        for vault_records in by_vault.values():
+            newest_first = sorted(vault_records, key=lambda r: r.created_at, reverse=True)
+            for count, bucket in ((keep_hourly, "%Y-%m-%d %H"), (keep_daily, "%Y-%m-%d")):
+                seen = set()
+                for record in newest_first:
+                    if len(seen) >= count:
+                        break
+                    key = datetime.fromisoformat(record.created_at).strftime(bucket)
+                    if key not in seen:
+                        seen.add(key)
+                        keep.add(record.archive)
+
+        by_archive = {record.archive: record for record in records}
+        for archive in list(keep):
+            parent = by_archive[archive].parent
+            while parent and parent not in keep:
+                keep.add(parent)
+                parent = by_archive[parent].parent if parent in by_archive else None
+
+        removed = [record for record in records if record.archive not in keep]
+        if dry_run:
+            return removed
+        for record in removed:
+            archive_path = os.path.join(self.backup_dir, record.archive)
+            for path in (archive_path, manifest_path_for(archive_path)):
+                if os.path.lexists(path):
+                    os.unlink(path)
+            logger.info(f"Pruned backup {record.archive}")
+        self.forget(record.archive for record in removed)
+        return removed
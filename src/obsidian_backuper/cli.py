@@ -1,17 +1,24 @@
 import argparse
 import os
-import dotenv
+import sys
 import logging
+from contextlib import ExitStack
 from typing import Optional
-from .core import ObsidianBackuper
-from .tui import run_tui
 from .exceptions import (
     ObsidianBackupError,
     VaultValidationError,
     EncryptionError,
     DecryptionError
 )
-from .obsidian_decryptor import ObsidianDecryptor
+from .options import (
+    ARCHIVE_FORMATS, AUTO_CIPHER, CIPHER_NAMES, CODECS, DEFAULT_CODEC, DEFAULT_DEBOUNCE,
+    DEFAULT_VERIFY_LEVEL, VERIFY_LEVELS
+)
+from .progress import ProgressEvent, format_progress
+
+# Every command runs this module, so it only imports what building the parser
+# needs. Textual, cryptography and the archive code are imported by the
+# branches of main() that use them: --help, --list or --prune never load them.
 
 
 def setup_logging():
@@ -32,46 +39,305 @@ def get_env_var(name: str, default: Optional[str] = None) -> Optional[str]:
     return value
 
 
+def print_progress(event: ProgressEvent):
+    """Progress callback redrawing a single status line on stderr."""
+    sys.stderr.write("\r\033[K" + format_progress(event) + ("\n" if event.finished else ""))
+    sys.stderr.flush()
+
+
 def main():
     setup_logging()
-    dotenv.load_dotenv()
 
     parser = argparse.ArgumentParser(description="Obsidian Backup Tool")
     parser.add_argument("--vault", help="Path to vault directory (for encrypt) or to encrypted archive (for decrypt)")
     parser.add_argument("--password", help="Encryption/decryption password")
+    parser.add_argument("--keyfile", action="append", default=[], metavar="FILE",
+                        help="Keyfile that can decrypt new backups, alongside or instead of --password; "
+                             "also opens existing ones (repeatable)")
+    parser.add_argument("--new-password", help="With --rekey, the password that will open the archives")
+    parser.add_argument("--new-keyfile", action="append", default=[], metavar="FILE",
+                        help="With --rekey, a keyfile that will open the archives (repeatable)")
+    parser.add_argument("--add-recipients", action="store_true",
+                        help="With --rekey, keep the current passwords and keyfiles and add the new ones")
+    parser.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC,
+                        help="Compression codec for new backups (default: %(default)s)")
+    parser.add_argument("--cipher", choices=(AUTO_CIPHER,) + CIPHER_NAMES, default=AUTO_CIPHER,
+                        help="Cipher for new backups; 'auto' picks the faster one on this CPU (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Compression threads, or file writer threads for --restore (default: based on CPU cores)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only archive files changed since the previous backup of this vault")
+    parser.add_argument("--format", dest="archive_format", choices=ARCHIVE_FORMATS, default="tar",
+                        help="Archive format: tar stream or indexed archive with random-access restore")
+    parser.add_argument("--path", action="append", metavar="PATTERN",
+                        help="Only restore vault paths matching this glob (repeatable), e.g. 'Daily/2026-10-*.md'")
+    parser.add_argument("--repo", help="Store a deduplicated snapshot in this chunk repository instead of an archive; "
+                                       "with --list or --restore, list or restore its snapshots")
+    parser.add_argument("--snapshot", metavar="ID",
+                        help="With --restore --repo, the snapshot to restore (default: the latest, of --vault if given)")
+    parser.add_argument("--vaults", nargs="+", metavar="VAULT",
+                        help="Back up several vault directories in one run (with --encrypt)")
+    parser.add_argument("--vaults-config", metavar="FILE",
+                        help="JSON file listing vaults to back up (with --encrypt)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Vaults backed up in parallel with --vaults/--vaults-config")
+    parser.add_argument("--git-export", metavar="FILE",
+                        help="With --git-snapshot, also export the repository as an encrypted bundle (needs --password)")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help="Seconds without edits before --watch takes a snapshot (default: %(default)s)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="gitignore-style pattern of vault paths to leave out of backups (repeatable)")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="Pattern to back up even if excluded, like '!PATTERN' in .obsidianbackupignore")
+    parser.add_argument("--no-default-excludes", action="store_true",
+                        help="Also back up workspace files, .trash, .git and node_modules")
+    parser.add_argument("--compress-all", action="store_true",
+                        help="Also compress images, PDFs, videos and archives instead of storing them as they are")
+    parser.add_argument("--zstd-dict", action="store_true",
+                        help="With --format indexed --codec zstd, train a dictionary on the notes and "
+                             "compress with it in smaller blocks")
+    parser.add_argument("--catalog-files", action="store_true",
+                        help="Also record the vault's file list in the backup catalog (stored unencrypted)")
+    parser.add_argument("--backup-dir", metavar="DIR",
+                        help="Directory holding the backups for --list/--find/--prune (default: next to --vault)")
+    parser.add_argument("--since", metavar="TIME", help="With --list, only backups at or after this ISO date/time")
+    parser.add_argument("--until", metavar="TIME", help="With --list, only backups at or before this ISO date/time")
+    parser.add_argument("--keep-hourly", type=int, default=0, metavar="N",
+                        help="With --prune, keep the newest backup of each of the last N hours")
+    parser.add_argument("--keep-daily", type=int, default=0, metavar="N",
+                        help="With --prune, keep the newest backup of each of the last N days")
+    parser.add_argument("--dry-run", action="store_true", help="With --prune, only show what would be deleted")
+    parser.add_argument("--verify-level", choices=VERIFY_LEVELS, default=DEFAULT_VERIFY_LEVEL,
+                        help="How deep --verify checks: authentication only, decompression, tar parsing "
+                             "or file hashes against the manifest (default: %(default)s)")
+    parser.add_argument("--progress", action="store_true",
+                        help="Show files, bytes, throughput and ETA while running")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print wall/CPU time, bytes and files per phase (scan, compress, encrypt, ...) when done")
+    parser.add_argument("--profile-json", metavar="FILE", help="Write the per-phase profile to FILE as JSON")
+    parser.add_argument("--profile-dump", metavar="FILE",
+                        help="Write a cProfile dump of the run to FILE (read it with pstats or snakeviz)")
 
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--encrypt", action="store_true", help="Create and encrypt backup")
     group.add_argument("--decrypt", action="store_true", help="Decrypt backup archive")
+    group.add_argument("--restore", metavar="TARGET_DIR", help="Restore backup archive into TARGET_DIR")
+    group.add_argument("--git-snapshot", metavar="REPO_DIR",
+                       help="Commit the vault into a bare git repository outside it (created on first use)")
+    group.add_argument("--watch", action="store_true",
+                       help="Watch the vault and take encrypted incremental backups as it changes")
+    group.add_argument("--verify", nargs="+", metavar="ARCHIVE",
+                       help="Check that backup archives are intact without writing anything")
+    group.add_argument("--list", action="store_true", help="List backups from the catalog")
+    group.add_argument("--find", metavar="PATTERN",
+                       help="Find backups containing vault paths matching this glob (needs --catalog-files backups)")
+    group.add_argument("--prune", action="store_true",
+                       help="Delete backups not kept by --keep-hourly/--keep-daily")
+    group.add_argument("--calibrate-ciphers", action="store_true",
+                       help="Measure the throughput of each cipher on this CPU and refresh the cached choice")
+    group.add_argument("--rekey", nargs="+", metavar="ARCHIVE",
+                       help="Change the password/keyfiles of encrypted backups by rewriting only their key header")
+    group.add_argument("--generate-keyfile", metavar="FILE", help="Write a new random keyfile to FILE")
     group.add_argument("--tui", action="store_true", help="Launch Textual User Interface")
 
     args = parser.parse_args()
+    import dotenv
+    dotenv.load_dotenv()
 
+    progress = print_progress if args.progress else None
+    backup_options = dict(exclude=args.exclude, include=args.include, default_excludes=not args.no_default_excludes,
+                          adaptive_compression=not args.compress_all, zstd_dictionary=args.zstd_dict,
+                          cipher=args.cipher, keyfiles=args.keyfile)
+    profiling = ExitStack()
+    if args.profile or args.profile_json or args.profile_dump:
+        from .profiling import profile
+        profiler = profiling.enter_context(profile(args.profile_json, args.profile_dump))
     try:
         if args.tui:
+            from .tui import run_tui
             run_tui()
+        elif args.encrypt and (args.vaults or args.vaults_config):
+            from .batch import VaultJob, backup_vaults, load_vault_config
+            jobs = [
+                VaultJob(vault, password=args.password, codec=args.codec,
+                         incremental=args.incremental, archive_format=args.archive_format, **backup_options)
+                for vault in args.vaults or []
+            ]
+            if args.vaults_config:
+                jobs.extend(load_vault_config(args.vaults_config, password=args.password))
+            if args.catalog_files:
+                jobs = [job._replace(catalog_files=True) for job in jobs]
+            summary = backup_vaults(jobs, workers=args.jobs, threads=args.threads)
+            print(summary.format())
+            if summary.failed:
+                exit(1)
+
         elif args.encrypt:
-            if not args.vault or not args.password:
-                parser.error("--vault and --password are required for encryption")
+            if not args.vault or not (args.password or args.keyfile):
+                parser.error("--vault and --password (or --keyfile) are required for encryption")
+            from .core import ObsidianBackuper
 
             if not os.path.isdir(os.path.expanduser(args.vault)):
                 logging.error(f"Vault path must be a directory for encryption: {args.vault}")
                 exit(1)
 
-            backuper = ObsidianBackuper(vault_path=args.vault)
+            backuper = ObsidianBackuper(vault_path=args.vault, **backup_options)
+            if args.repo:
+                snapshot_id = backuper.create_snapshot(args.repo, password=args.password)
+                logging.info(f"Snapshot {snapshot_id} stored in repository: {args.repo}")
+                return
+
             backup_path = backuper.create_backup(
                 encrypt=True,
-                password=args.password
+                password=args.password,
+                codec=args.codec,
+                threads=args.threads,
+                incremental=args.incremental,
+                archive_format=args.archive_format,
+                progress=progress,
+                catalog_files=args.catalog_files
             )
             logging.info(f"Encrypted backup created at: {backup_path}")
 
         elif args.decrypt:
-            if not args.vault or not args.password:
-                parser.error("--vault and --password are required for decryption")
+            if not args.vault or not (args.password or args.keyfile):
+                parser.error("--vault and --password (or --keyfile) are required for decryption")
+            from .obsidian_decryptor import ObsidianDecryptor
 
             decryptor = ObsidianDecryptor(encrypted_file_path=args.vault)
-            decrypted_path = decryptor.decrypt(password=args.password)
+            decrypted_path = decryptor.decrypt(password=args.password, progress=progress, keyfiles=args.keyfile)
             logging.info(f"File decrypted to: {decrypted_path}")
+
+        elif args.restore and args.repo:
+            if not args.password:
+                parser.error("--password is required to restore from --repo")
+            from .exceptions import ArchiveError
+            from .repository import Repository
+
+            repository = Repository(args.repo, args.password)
+            snapshot_id = args.snapshot
+            if not snapshot_id:
+                vault = os.path.abspath(os.path.expanduser(args.vault)) if args.vault else None
+                latest = repository.latest_snapshot(vault)
+                if latest is None:
+                    raise ArchiveError(f"No snapshot to restore in repository: {args.repo}")
+                snapshot_id = latest["id"]
+            restored_path = repository.restore(snapshot_id, args.restore)
+            logging.info(f"Snapshot {snapshot_id} restored to: {restored_path}")
+
+        elif args.restore:
+            if not args.vault:
+                parser.error("--vault (path to backup archive) is required for restore")
+            from .core import ObsidianBackuper
+
+            backuper = ObsidianBackuper(vault_path=args.vault, require_directory=False, keyfiles=args.keyfile)
+            restored_path = backuper.restore_backup(
+                args.restore,
+                password=args.password,
+                paths=args.path,
+                workers=args.threads,
+                progress=progress
+            )
+            logging.info(f"Backup restored to: {restored_path}")
+
+        elif args.git_snapshot:
+            if not args.vault:
+                parser.error("--vault is required for git snapshots")
+            if args.git_export and not args.password:
+                parser.error("--password is required for --git-export")
+            from .core import ObsidianBackuper
+
+            backuper = ObsidianBackuper(vault_path=args.vault)
+            commit = backuper.create_git_snapshot(
+                args.git_snapshot,
+                export_path=args.git_export,
+                password=args.password
+            )
+            if commit:
+                logging.info(f"Git snapshot {commit} stored in: {args.git_snapshot}")
+            else:
+                logging.info("No changes since the last git snapshot")
+
+        elif args.watch:
+            if not args.vault or not (args.password or args.keyfile):
+                parser.error("--vault and --password (or --keyfile) are required for watch mode")
+            from .core import ObsidianBackuper
+            from .watch import VaultWatcher
+
+            watcher = VaultWatcher(
+                ObsidianBackuper(vault_path=args.vault, **backup_options),
+                args.password,
+                codec=args.codec,
+                threads=args.threads,
+                archive_format=args.archive_format,
+                debounce=args.debounce,
+                catalog_files=args.catalog_files
+            )
+            watcher.run()
+
+        elif args.verify:
+            from .verify import format_results, verify_archives
+            results = verify_archives(args.verify, password=args.password,
+                                      level=args.verify_level, workers=args.jobs, keyfiles=args.keyfile)
+            print(format_results(results))
+            if not all(result.ok for result in results):
+                exit(1)
+
+        elif args.list and args.repo:
+            if not args.password:
+                parser.error("--password is required to list --repo snapshots")
+            from .repository import Repository
+
+            repository = Repository(args.repo, args.password)
+            vault = os.path.abspath(os.path.expanduser(args.vault)) if args.vault else None
+            for snapshot_id in repository.snapshot_ids():
+                snapshot = repository.load_snapshot(snapshot_id)
+                if vault is None or snapshot["vault"] == vault:
+                    print(f"{snapshot_id}  {snapshot['created_at']}  {len(snapshot['files'])} files  "
+                          f"{snapshot['vault']}")
+
+        elif args.list or args.find or args.prune:
+            if not args.vault and not args.backup_dir:
+                parser.error("--vault or --backup-dir is required for catalog commands")
+            from .catalog import Catalog, format_snapshots
+
+            vault = os.path.abspath(os.path.expanduser(args.vault)) if args.vault else None
+            with Catalog(args.backup_dir or os.path.dirname(vault)) as catalog:
+                if args.list:
+                    print(format_snapshots(catalog.snapshots(vault, since=args.since, until=args.until)))
+                elif args.find:
+                    matches = catalog.find(args.find, vault)
+                    for archive, paths in matches.items():
+                        print(archive)
+                        for path in paths:
+                            print(f"  {path}")
+                    if not matches:
+                        print(f"No cataloged backup contains {args.find}")
+                else:
+                    removed = catalog.prune(vault, keep_hourly=args.keep_hourly,
+                                            keep_daily=args.keep_daily, dry_run=args.dry_run)
+                    verb = "Would delete" if args.dry_run else "Deleted"
+                    print(f"{verb} {len(removed)} backups")
+                    if removed:
+                        print(format_snapshots(removed))
+        elif args.calibrate_ciphers:
+            from .crypto import calibrate, format_calibration
+            print(format_calibration(calibrate(refresh=True)))
+        elif args.rekey:
+            if not (args.password or args.keyfile):
+                parser.error("--password or --keyfile is required to open the archives for --rekey")
+            if not (args.new_password or args.new_keyfile):
+                parser.error("--new-password or --new-keyfile is required for --rekey")
+            from .core import ObsidianBackuper
+            for archive in args.rekey:
+                backuper = ObsidianBackuper(vault_path=archive, require_directory=False, keyfiles=args.keyfile)
+                backuper.rekey_backup(password=args.password, new_password=args.new_password,
+                                      new_keyfiles=args.new_keyfile, keep_existing=args.add_recipients)
+                logging.info(f"Changed the keys of {archive}")
+        elif args.generate_keyfile:
+            from .crypto import generate_keyfile
+            generate_keyfile(args.generate_keyfile)
+            logging.info(f"Keyfile written to {args.generate_keyfile}; keep a copy somewhere safe")
         else:
             parser.print_help()
 
@@ -90,6 +356,10 @@ def main():
     except Exception as e:
         logging.error(f"Unexpected error: {str(e)}", exc_info=True)
         exit(1)
+    finally:
+        profiling.close()
+        if args.profile:
+            print(profiler.format(), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,339 @@
+import io
+import os
+import gzip
+import math
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import BinaryIO, List, Optional
+from .exceptions import ConfigError
+from .options import CODECS, DEFAULT_CODEC
+from .profiling import span
+
+EXTENSIONS = {
+    "gzip": ".tar.gz",
+    "zstd": ".tar.zst",
+    "none": ".tar",
+}
+BLOCK_SIZE = 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Already-compressed formats: recompressing them costs CPU and saves nothing.
+INCOMPRESSIBLE_EXTENSIONS = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".heic", ".avif",
+    ".pdf", ".epub", ".docx", ".xlsx", ".pptx",
+    ".mp4", ".mov", ".mkv", ".webm", ".mp3", ".m4a", ".ogg", ".opus", ".flac",
+    ".zip", ".7z", ".rar", ".gz", ".bz2", ".xz", ".zst",
+})
+SAMPLE_SIZE = 16 * 1024
+# Smaller files are always compressed: too short to sample, too cheap to matter.
+MIN_SAMPLE_SIZE = 4096
+ENTROPY_THRESHOLD = 7.5  # bits per byte; random data is close to 8
+# Smallest tar entry stored without compression. Each switch between stored
+# and compressed data starts a new gzip member, which loses the compression
+# window of the notes around it. That costs more than deflating a small file
+# saves.
+MIN_STORED_SIZE = 64 * 1024
+
+# Trained zstd dictionaries let small blocks of notes compress as well as
+# large ones: front matter, headings and link syntax repeat across notes.
+DICT_SIZE = 64 * 1024
+MIN_DICT_SIZE = 8 * 1024
+DICT_SAMPLE_BYTES = 100 * DICT_SIZE
+DICT_SAMPLE_EXTENSIONS = (".md", ".canvas", ".json")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def default_threads() -> int:
+    return os.cpu_count() or 1
+
+
+def validate_codec(codec: str) -> str:
+    if codec not in CODECS:
+        raise ConfigError(f"Unknown compression codec: {codec} (expected one of {', '.join(CODECS)})")
+    return codec
+
+
+def detect_codec(prefix: bytes) -> str:
+    """Guess the codec of a stream from its first bytes."""
+    if prefix.startswith(GZIP_MAGIC):
+        return "gzip"
+    if prefix.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return "none"
+
+
+def sample_entropy(sample: bytes) -> float:
+    """Shannon entropy of ``sample`` in bits per byte."""
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(count / total * math.log2(count / total) for count in Counter(sample).values())
+
+
+def is_compressible(name: str, sample: bytes) -> bool:
+    """Whether a file is worth compressing, from its name and its first bytes."""
+    if os.path.splitext(name)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return False
+    if len(sample) < MIN_SAMPLE_SIZE:
+        return True
+    return sample_entropy(sample[:SAMPLE_SIZE]) < ENTROPY_THRESHOLD
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ConfigError("The zstd codec requires the 'zstandard' package "
+                          "(pip install obsidian_backuper[zstd])")
+    return zstandard
+
+
+class _NonClosingWriter(io.RawIOBase):
+    """Pass writes through to ``dst`` without closing it on close()."""
+
+    def __init__(self, dst: BinaryIO):
+        self._dst = dst
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def write(self, data) -> int:
+        if self._dst is not None:
+            self._dst.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def abort(self):
+        """Drop everything written from now on, and close."""
+        self._dst = None
+        self.close()
+
+
+class _ZstdWriter(io.RawIOBase):
+    """zstd stream writer that can be closed without writing out its last frame."""
+
+    def __init__(self, dst: BinaryIO, compressor):
+        self._sink = _NonClosingWriter(dst)
+        self._writer = compressor.stream_writer(self._sink, closefd=False)
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._writer.tell()
+
+    def write(self, data) -> int:
+        self._writer.write(data)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._writer.close()
+        finally:
+            super().close()
+
+    def abort(self):
+        """Release the compressor, dropping what it still holds."""
+        self._sink.abort()
+        self.close()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Compress fixed-size blocks as independent gzip members on a thread pool.
+
+    A concatenation of gzip members is itself a valid gzip stream, so the
+    output stays readable by gunzip, tarfile and the gzip module. zlib
+    releases the GIL while compressing, so blocks compress in parallel.
+    """
+
+    def __init__(self, dst: BinaryIO, level: int = GZIP_LEVEL,
+                 threads: Optional[int] = None, block_size: int = BLOCK_SIZE):
+        self._dst = dst
+        self._level = level
+        self._compress_level = level
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._members = 0
+        self._position = 0
+        threads = threads or default_threads()
+        self._executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self._in_flight = deque()
+        self._max_in_flight = threads * 2
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        """Uncompressed bytes written so far."""
+        return self._position
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+        return len(data)
+
+    def set_stored(self, stored: bool):
+        """Write what follows uncompressed (deflate level 0) until switched back.
+
+        Buffered data is first emitted as its own member, so the switch
+        takes effect at the current position.
+        """
+        level = 0 if stored else self._compress_level
+        if level == self._level:
+            return
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        self._level = level
+
+    @staticmethod
+    def _compress(block: bytes, level: int) -> bytes:
+        with span("compress", bytes=len(block)):
+            return gzip.compress(block, level, mtime=0)
+
+    def _submit(self, block: bytes):
+        self._members += 1
+        if self._executor is None:
+            self._dst.write(self._compress(block, self._level))
+            return
+        self._in_flight.append(self._executor.submit(self._compress, block, self._level))
+        while len(self._in_flight) > self._max_in_flight:
+            self._dst.write(self._in_flight.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._members:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._in_flight:
+                self._dst.write(self._in_flight.popleft().result())
+        finally:
+            self.abort()
+
+    def abort(self):
+        """Shut down the thread pool, dropping the blocks not yet written."""
+        self._buffer.clear()
+        self._in_flight.clear()
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+        super().close()
+
+
+def open_writer(dst: BinaryIO, codec: str = DEFAULT_CODEC, threads: Optional[int] = None,
+                level: Optional[int] = None) -> BinaryIO:
+    """Return a stream compressing into ``dst``; closing it leaves ``dst`` open."""
+    validate_codec(codec)
+    if codec == "gzip":
+        return ParallelGzipWriter(dst, level=GZIP_LEVEL if level is None else level, threads=threads)
+    if codec == "zstd":
+        zstandard = _zstandard()
+        compressor = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL if level is None else level,
+            threads=threads or default_threads(),
+        )
+        return _ZstdWriter(dst, compressor)
+    return _NonClosingWriter(dst)
+
+
+def abort_writer(writer: BinaryIO):
+    """Close ``writer`` (from :func:`open_writer`) without writing out the data it still holds.
+
+    For a failed archive: the thread pools are released, and nothing more
+    reaches the destination, which is being abandoned.
+    """
+    writer.abort()
+
+
+def set_stored(writer: BinaryIO, stored: bool) -> bool:
+    """Store the data next written to ``writer`` (from :func:`open_writer`) uncompressed.
+
+    Only gzip streams switch: zstd already emits incompressible data as raw
+    blocks at almost no cost, and ``none`` stores everything. Returns whether
+    what follows is written stored.
+    """
+    if isinstance(writer, ParallelGzipWriter):
+        writer.set_stored(stored)
+        return stored
+    return False
+
+
+def open_reader(src: BinaryIO, codec: str = DEFAULT_CODEC) -> BinaryIO:
+    """Return a stream of the decompressed contents of ``src``."""
+    validate_codec(codec)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=src, mode="rb")
+    if codec == "zstd":
+        zstandard = _zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(src, read_across_frames=True, closefd=False)
+    return src
+
+
+def train_dictionary(samples: List[bytes], size: Optional[int] = None) -> Optional[bytes]:
+    """Train a zstd dictionary on ``samples``; None if they are too few or too similar to learn from.
+
+    By default the dictionary is about 1/32 of the sample size, between
+    ``MIN_DICT_SIZE`` and ``DICT_SIZE``, so small vaults don't pay for a
+    dictionary larger than what it saves.
+    """
+    zstandard = _zstandard()
+    if size is None:
+        size = max(MIN_DICT_SIZE, min(DICT_SIZE, sum(map(len, samples)) // 32))
+    try:
+        return zstandard.train_dictionary(size, samples, level=ZSTD_LEVEL).as_bytes()
+    except zstandard.ZstdError:
+        return None
+
+
+@lru_cache(maxsize=8)
+def _zstd_dict(dictionary: Optional[bytes], level: Optional[int] = None):
+    """Loaded (and, for compression, precomputed) dictionary; loading it per block would dominate small blocks."""
+    if not dictionary:
+        return None
+    dict_data = _zstandard().ZstdCompressionDict(dictionary)
+    if level is not None:
+        dict_data.precompute_compress(level=level)
+    return dict_data
+
+
+def compress_block(data: bytes, codec: str = DEFAULT_CODEC, level: Optional[int] = None,
+                   dictionary: Optional[bytes] = None) -> bytes:
+    """Compress one independent block (used by formats with random access).
+
+    ``dictionary`` (zstd only) comes from :func:`train_dictionary`; the
+    same one is needed to decompress.
+    """
+    validate_codec(codec)
+    if codec == "none":
+        return data
+    with span("compress", bytes=len(data)):
+        if codec == "gzip":
+            return gzip.compress(data, GZIP_LEVEL if level is None else level, mtime=0)
+        level = ZSTD_LEVEL if level is None else level
+        return _zstandard().ZstdCompressor(level=level, dict_data=_zstd_dict(dictionary, level)).compress(data)
+
+
+def decompress_block(data: bytes, codec: str = DEFAULT_CODEC, dictionary: Optional[bytes] = None) -> bytes:
+    validate_codec(codec)
+    if codec == "none":
+        return data
+    with span("decompress", bytes=len(data)):
+        if codec == "gzip":
+            return gzip.decompress(data)
+        return _zstandard().ZstdDecompressor(dict_data=_zstd_dict(dictionary)).decompress(data)
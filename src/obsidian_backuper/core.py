@@ -1,23 +1,78 @@
+import io
 import os
+import stat
+import errno
 import shutil
+import sqlite3
 import tarfile
 import tempfile
 import logging
+from concurrent.futures import Future
+from contextlib import closing, contextmanager
 from datetime import datetime
-from typing import Optional
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
 from .exceptions import (
     VaultValidationError,
     EncryptionError,
     ArchiveError,
-    ObsidianBackupError
+    ConfigError,
+    ObsidianBackupError,
+    OperationCancelled
 )
-from .crypto import CryptoVault
+from .catalog import Catalog
+from .crypto import CryptoVault, rekey_file
+from .indexed import IndexedArchiveReader, IndexedArchiveWriter, match_paths
+from . import indexed
+from .ignore import IgnoreRules, SkipStats
+from .manifest import FileEntry, Manifest, MANIFEST_SUFFIX, manifest_path_for, new_hasher
+from .options import ARCHIVE_FORMATS
+from .profiling import span
+from .restore import TarStreamExtractor
+from .scanner import SMALL_FILE_SIZE, make_tarinfo, read_ahead
+from .progress import CountingReader, CountingWriter, Progress, ProgressCallback
+from . import compression
 
 logger = logging.getLogger(__name__)
 
+# PAX header marking tar entries stored without compression.
+PAX_CODEC = "OBSIDIANBACKUP.codec"
+
+
+class _HashingReader:
+    """File wrapper hashing everything read through it."""
+
+    def __init__(self, f: BinaryIO, hasher, progress: Optional[Progress] = None):
+        self._f = f
+        self._hasher = hasher
+        self._progress = progress
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self._hasher.update(data)
+        if self._progress is not None:
+            self._progress.add(read=len(data))
+        return data
+
+
 class ObsidianBackuper:
-    def __init__(self, vault_path: str, require_directory: bool = True):
+    def __init__(self, vault_path: str, require_directory: bool = True,
+                 exclude: Iterable[str] = (), include: Iterable[str] = (), default_excludes: bool = True,
+                 adaptive_compression: bool = True, zstd_dictionary: bool = False,
+                 cipher: Optional[str] = None, keyfiles: Iterable[str] = ()):
         self.vault_path = self._validate_vault_path(vault_path, require_directory)
+        self.exclude = list(exclude)
+        self.include = list(include)
+        self.default_excludes = default_excludes
+        # Store already-compressed attachments instead of recompressing them.
+        self.adaptive_compression = adaptive_compression
+        # Train a zstd dictionary on the notes for indexed zstd archives.
+        self.zstd_dictionary = zstd_dictionary
+        # Cipher suite for new encrypted backups ("auto" picks the faster one on this CPU).
+        self.cipher = cipher
+        # Keyfiles that can decrypt new encrypted backups, alongside (or instead of) the password.
+        self.keyfiles = list(keyfiles)
+        # What the exclusion rules left out of the latest backup scan.
+        self.skipped = SkipStats()
 
     def _validate_vault_path(self, path: str, require_directory: bool = True) -> str:
         expanded_path = os.path.expanduser(path)
@@ -27,64 +82,628 @@ class ObsidianBackuper:
             raise VaultValidationError(f"Path is not a directory: {expanded_path}")
         return expanded_path
     
+    def ignore_rules(self) -> IgnoreRules:
+        """Default excludes, the vault's ``.obsidianbackupignore``, then ``exclude``/``include``."""
+        return IgnoreRules.for_vault(self.vault_path, self.exclude, self.include, self.default_excludes)
+
+    def _scan(self, tracker: Progress) -> Manifest:
+        with span("scan") as timer:
+            manifest = Manifest.scan(self.vault_path, tracker, self.ignore_rules())
+            timer.add(files=len(manifest.files))
+        self.skipped = manifest.skipped
+        if manifest.skipped.dirs or manifest.skipped.files:
+            logger.info(f"Exclusion rules {manifest.skipped.format()}")
+        return manifest
+
     def _validate_backup_file(self, path: str) -> str:
         if not os.path.isfile(path):
             raise ArchiveError(f"Backup path is not a file: {path}")
         return path
 
-    def create_backup(self, encrypt: bool = False, password: Optional[str] = None) -> str:
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = f"obsidian_backup_{timestamp}.tar.gz"
-            vault_dir = os.path.dirname(os.path.abspath(self.vault_path))
-            final_path = os.path.join(vault_dir, backup_name)
-
-            if os.path.exists(final_path):
-                raise ArchiveError(f"Backup file already exists: {final_path}")
+    def create_backup(self, encrypt: bool = False, password: Optional[str] = None,
+                      codec: str = compression.DEFAULT_CODEC, threads: Optional[int] = None,
+                      incremental: bool = False, archive_format: str = "tar",
+                      progress: Optional[ProgressCallback] = None, catalog_files: bool = False) -> str:
+        """Create a backup archive next to the vault and return its path.
 
+        ``progress`` is called (throttled) with :class:`ProgressEvent`
+        snapshots of files scanned and bytes read, compressed and encrypted.
+        The backup is recorded in the backup directory's :class:`Catalog`,
+        with the vault's file listing if ``catalog_files`` is set.
+        """
+        tracker = Progress(progress)
+        with self._backup_errors():
+            crypto = self._backup_crypto(encrypt, password, codec, archive_format)
+            backup_dir = os.path.dirname(os.path.abspath(self.vault_path))
             logger.info(f"Starting backup for vault: {self.vault_path}")
 
-            with tempfile.TemporaryDirectory(dir=vault_dir) as tmpdir:
-                backup_path = os.path.join(tmpdir, backup_name)
-                logger.debug(f"Using temp dir: {tmpdir}")
+            manifest = self._scan(tracker)
+            paths = manifest.all_paths()
+            if incremental:
+                previous = self._find_latest_manifest(backup_dir, manifest.vault, crypto)
+                if previous is None:
+                    logger.info("No previous backup manifest found, creating a full backup")
+                else:
+                    paths = self._make_incremental(manifest, previous)
+            return self._write_backup(backup_dir, manifest, paths, crypto, codec, threads,
+                                      archive_format, tracker, catalog_files)
 
-                try:
-                    with tarfile.open(backup_path, "w:gz") as tar:
-                        tar.add(self.vault_path, arcname=os.path.basename(self.vault_path))
-                    logger.debug(f"Temporary archive created: {backup_path}")
-                except (tarfile.TarError, OSError) as e:
-                    raise ArchiveError(f"Archive creation failed: {str(e)}")
-
-                if encrypt:
-                    if not password:
-                        raise EncryptionError("Encryption password required")
-                    try:
-                        crypto = CryptoVault(password)
-                        encrypted_path = backup_path + ".enc"
-                        crypto.encrypt_file(backup_path, encrypted_path)
-                        backup_path = encrypted_path
-                        final_path += ".enc"
-                        logger.debug(f"File encrypted: {backup_path}")
-                    except Exception as e:
-                        raise EncryptionError(f"Encryption failed: {str(e)}")
+    def create_backup_from_changes(self, previous: Optional[Manifest], changed_paths: Optional[Iterable[str]],
+                                   encrypt: bool = False, password: Optional[str] = None,
+                                   codec: str = compression.DEFAULT_CODEC, threads: Optional[int] = None,
+                                   archive_format: str = "tar",
+                                   progress: Optional[ProgressCallback] = None, catalog_files: bool = False
+                                   ) -> Tuple[Optional[str], Manifest]:
+        """Incremental backup on top of ``previous`` that only re-reads ``changed_paths``.
+
+        ``changed_paths`` are vault-relative paths known to have changed
+        (e.g. from file system events); nothing else is stat'ed. With
+        ``changed_paths`` None the whole vault is stat-walked and compared
+        against ``previous`` instead. Without a ``previous`` manifest a full
+        backup is made. Returns the archive
+        path, or None if nothing actually changed, and the manifest to pass
+        as ``previous`` next time.
+        """
+        tracker = Progress(progress)
+        with self._backup_errors():
+            crypto = self._backup_crypto(encrypt, password, codec, archive_format)
+            backup_dir = os.path.dirname(os.path.abspath(self.vault_path))
+            if previous is None:
+                manifest = self._scan(tracker)
+                paths = manifest.all_paths()
+            else:
+                if changed_paths is None:
+                    manifest = self._scan(tracker)
+                else:
+                    with span("scan"):
+                        manifest = Manifest.rescan(previous, changed_paths, self.ignore_rules())
+                paths = self._make_incremental(manifest, previous)
+                if not paths and not manifest.deleted:
+                    logger.info(f"No changes in {self.vault_path} since {previous.archive}")
+                    return None, previous
+            archive = self._write_backup(backup_dir, manifest, paths, crypto, codec, threads,
+                                         archive_format, tracker, catalog_files)
+            return archive, manifest
+
+    def latest_manifest(self, password: Optional[str] = None) -> Optional[Manifest]:
+        """Manifest of the newest backup of this vault, or None if there is none."""
+        vault = os.path.abspath(self.vault_path)
+        crypto = self._crypto(password)
+        return self._find_latest_manifest(os.path.dirname(vault), vault, crypto)
 
-                shutil.copy2(backup_path, final_path)
-                logger.info(f"Backup successfully created at: {final_path}")
+    def create_git_snapshot(self, repository_path: str, export_path: Optional[str] = None,
+                            password: Optional[str] = None) -> Optional[str]:
+        """Commit the vault into a bare git repository outside it.
 
-            return final_path
+        The repository is created on first use. With ``export_path`` the
+        whole repository is also written there as an encrypted git bundle.
+        Returns the commit id, or None if nothing changed.
+        """
+        if export_path and not password:
+            raise EncryptionError("Encryption password required for the bundle export")
+        from .git_snapshot import GitSnapshotRepository
+        repository = GitSnapshotRepository.open_or_init(repository_path)
+        commit = repository.snapshot(self.vault_path)
+        if export_path:
+            repository.export_bundle(export_path, password)
+        return commit
 
+    @contextmanager
+    def _backup_errors(self) -> Iterator[None]:
+        try:
+            yield
+        except OperationCancelled:
+            logger.info("Backup cancelled")
+            raise
         except Exception as e:
             logger.error(f"Backup failed: {str(e)}")
             if isinstance(e, ObsidianBackupError):
                 raise
             raise ArchiveError(f"Unexpected backup error: {str(e)}")
 
-    def decrypt_backup(self, output_dir: str = None, password: Optional[str] = None) -> str:
+    def _backup_crypto(self, encrypt: bool, password: Optional[str], codec: str,
+                       archive_format: str) -> Optional[CryptoVault]:
+        compression.validate_codec(codec)
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ConfigError(f"Unknown archive format: {archive_format}")
+        if archive_format == "indexed" and not encrypt:
+            raise ConfigError("Indexed archives are always encrypted")
+        if self.zstd_dictionary and (archive_format != "indexed" or codec != "zstd"):
+            raise ConfigError("A trained zstd dictionary needs the indexed format and the zstd codec")
+        if not encrypt:
+            return None
+        if not password and not self.keyfiles:
+            raise EncryptionError("Encryption password required")
+        return self._crypto(password)
+
+    def _crypto(self, password: Optional[str]) -> Optional[CryptoVault]:
+        """Credentials for this backuper's password and keyfiles, or None if there are none."""
+        if not password and not self.keyfiles:
+            return None
+        return CryptoVault(password, cipher=self.cipher, keyfiles=self.keyfiles)
+
+    def _make_incremental(self, manifest: Manifest, previous: Manifest) -> List[str]:
+        with span("diff", files=len(manifest.files)):
+            paths, manifest.deleted = manifest.diff(previous)
+        manifest.kind = "incremental"
+        manifest.parent = previous.archive
+        logger.info(f"Incremental backup on top of {previous.archive}: "
+                    f"{len(paths)} changed, {len(manifest.deleted)} deleted")
+        return paths
+
+    def _write_backup(self, backup_dir: str, manifest: Manifest, paths: List[str],
+                      crypto: Optional[CryptoVault], codec: str, threads: Optional[int],
+                      archive_format: str, tracker: Progress, catalog_files: bool = False) -> str:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = "_incr" if manifest.kind == "incremental" else ""
+        if archive_format == "indexed":
+            extension = indexed.EXTENSION
+        else:
+            extension = compression.EXTENSIONS[codec] + (".enc" if crypto else "")
+        stem = f"obsidian_backup_{timestamp}{suffix}"
+
+        files = [manifest.files[rel] for rel in paths if rel in manifest.files]
+        total = sum(entry.size for entry in files)
+        tracker.start("backup", bytes_total=total, files_total=len(files))
+        with self._temp_output(os.path.join(backup_dir, f"{stem}{extension}")) as tmp_path:
+            with span("archive", bytes=total, files=len(files)), self._synced_output(tmp_path) as out:
+                if archive_format == "indexed":
+                    self._write_indexed_archive(out, manifest, paths, crypto, codec, tracker)
+                else:
+                    self._write_archive(out, manifest, paths, crypto, codec, threads, tracker)
+            final_path = self._publish_backup(tmp_path, backup_dir, stem, extension)
+        manifest.archive = os.path.basename(final_path)
+        with span("manifest"), self._atomic_output(manifest_path_for(final_path)) as out:
+            self._write_manifest(out, manifest, crypto)
+        with span("catalog"):
+            self._record_in_catalog(backup_dir, manifest, final_path, codec, archive_format,
+                                    crypto is not None, catalog_files)
+
+        tracker.finish()
+        logger.info(f"Backup successfully created at: {final_path}")
+        return final_path
+
+    def _record_in_catalog(self, backup_dir: str, manifest: Manifest, archive_path: str,
+                           codec: str, archive_format: str, encrypted: bool, with_files: bool):
+        # The catalog is only an index: a backup is not failed over it.
+        try:
+            with Catalog(backup_dir) as catalog:
+                catalog.record(manifest, archive_path, codec, archive_format, encrypted, with_files)
+        except (ArchiveError, sqlite3.Error) as e:
+            logger.warning(f"Could not record {manifest.archive} in the backup catalog: {str(e)}")
+
+    def create_snapshot(self, repository_path: str, password: Optional[str] = None) -> str:
+        """Store a deduplicated snapshot of the vault in a chunk repository.
+
+        The repository is created on first use. Returns the snapshot id.
+        """
+        if not password:
+            raise EncryptionError("Encryption password required")
+        from .repository import Repository
+        try:
+            logger.info(f"Starting snapshot of {self.vault_path} into repository {repository_path}")
+            repository = Repository.open_or_init(repository_path, password)
+            return repository.backup(self.vault_path, self.ignore_rules())
+        except OSError as e:
+            raise ArchiveError(f"Snapshot failed: {str(e)}")
+
+    def _publish_backup(self, tmp_path: str, backup_dir: str, stem: str, extension: str) -> str:
+        """Give the complete archive at ``tmp_path`` an unused name and return it.
+
+        The name is claimed with a hard link, so nothing exists under an
+        archive name before its data is complete. Vaults sharing a parent
+        directory can be backed up concurrently within the same second, so a
+        numeric suffix is added on collision.
+        """
+        for attempt in range(1000):
+            name = f"{stem}_{attempt}{extension}" if attempt else f"{stem}{extension}"
+            path = os.path.join(backup_dir, name)
+            if os.path.exists(manifest_path_for(path)):
+                continue
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                continue
+            except OSError as e:
+                if e.errno not in (errno.EPERM, errno.ENOTSUP):
+                    raise
+                # No hard links on this file system (FAT, some network shares):
+                # claim the name and rename over it at once.
+                try:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+                except FileExistsError:
+                    continue
+                os.replace(tmp_path, path)
+                return path
+            os.unlink(tmp_path)
+            return path
+        raise ArchiveError(f"Cannot find an unused backup name for {stem} in {backup_dir}")
+
+    @contextmanager
+    def _temp_output(self, final_path: str) -> Iterator[str]:
+        """Temporary path next to ``final_path``, removed on exit unless it was renamed."""
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(final_path)}.", suffix=".part",
+            dir=os.path.dirname(final_path)
+        )
+        os.close(fd)
+        logger.debug(f"Writing to temporary file: {tmp_path}")
+        try:
+            yield tmp_path
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @contextmanager
+    def _synced_output(self, path: str) -> Iterator[BinaryIO]:
+        """Open ``path`` for writing; flushed and fsynced when the block completes."""
+        with open(path, "wb") as out:
+            yield out
+            with span("sync"):
+                out.flush()
+                os.fsync(out.fileno())
+
+    @contextmanager
+    def _atomic_output(self, final_path: str) -> Iterator[BinaryIO]:
+        """Write under a temporary name next to ``final_path``, renamed into place when complete."""
+        with self._temp_output(final_path) as tmp_path:
+            with self._synced_output(tmp_path) as out:
+                yield out
+            os.replace(tmp_path, final_path)
+
+    def _read_ahead(self, manifest: Manifest, paths: List[str]) -> Iterator[Future]:
+        """Futures of ``(data, digest)`` for the small regular files among ``paths``, in order."""
+        small = []
+        for rel in paths:
+            st = manifest.stats.get(rel)
+            if st is not None and stat.S_ISREG(st.st_mode) and st.st_size <= SMALL_FILE_SIZE:
+                small.append((os.path.join(self.vault_path, *rel.split("/")), st.st_size))
+        return read_ahead(small, new_hasher)
+
+    def _is_read_ahead(self, manifest: Manifest, rel: str) -> bool:
+        st = manifest.stats.get(rel)
+        return st is not None and stat.S_ISREG(st.st_mode) and st.st_size <= SMALL_FILE_SIZE
+
+    def _write_archive(self, out: BinaryIO, manifest: Manifest, paths: List[str],
+                       crypto: Optional[CryptoVault] = None,
+                       codec: str = compression.DEFAULT_CODEC, threads: Optional[int] = None,
+                       progress: Optional[Progress] = None):
+        """Stream tar -> compression -> (encryption) -> ``out`` in a single pass.
+
+        Entries are added in ``paths`` order from the scan's ``lstat``
+        results, while a thread pool reads small files ahead of the writer.
+        """
+        progress = progress or Progress()
+        sink = crypto.writer(CountingWriter(out, progress, "encrypted"), metadata={"codec": codec},
+                             threads=threads) if crypto else out
+        compressor = None
+        complete = False
+        try:
+            try:
+                compressor = compression.open_writer(CountingWriter(sink, progress, "compressed"),
+                                                     codec, threads=threads)
+                # Mode "w" (unlike "w|") writes every header and data block through
+                # unbuffered, so a stored/compressed switch lands on the entry boundary.
+                with tarfile.open(fileobj=compressor, mode="w") as tar, \
+                        closing(self._read_ahead(manifest, paths)) as reads:
+                    tar.add(self.vault_path, arcname=manifest.root, recursive=False)
+                    for rel in paths:
+                        read = next(reads) if self._is_read_ahead(manifest, rel) else None
+                        self._add_entry(tar, manifest, rel, progress, read, compressor, codec)
+                complete = True
+            finally:
+                # Closed before the sink it writes to. A failed archive is
+                # abandoned, so its compressor only releases its threads.
+                if compressor is not None:
+                    if complete:
+                        compressor.close()
+                    else:
+                        compression.abort_writer(compressor)
+        except (tarfile.TarError, OSError) as e:
+            raise ArchiveError(f"Archive creation failed: {str(e)}")
+        finally:
+            if crypto:
+                sink.close()
+
+    def _file_disappeared(self, manifest: Manifest, rel: str):
+        # Notes can be deleted while the backup runs; the next run will
+        # record the deletion.
+        logger.warning(f"File disappeared during backup: {os.path.join(self.vault_path, *rel.split('/'))}")
+        manifest.files.pop(rel, None)
+        manifest.dirs.discard(rel)
+        if manifest.kind == "incremental":
+            manifest.deleted.append(rel)
+
+    def _stored(self, rel: str, sample: bytes, codec: str, switch_size: Optional[int] = None) -> bool:
+        """Whether to store a file uncompressed: attachments that are compressed already.
+
+        In a tar stream, pass the entry size as ``switch_size``: switching
+        starts a new gzip member, which costs more than compressing a small file.
+        """
+        if switch_size is not None and switch_size < compression.MIN_STORED_SIZE:
+            return False
+        return self.adaptive_compression and codec != "none" and not compression.is_compressible(rel, sample)
+
+    def _add_entry(self, tar: tarfile.TarFile, manifest: Manifest, rel: str,
+                   progress: Optional[Progress] = None, read: Optional[Future] = None,
+                   compressor: Optional[BinaryIO] = None, codec: str = "none"):
+        full = os.path.join(self.vault_path, *rel.split("/"))
+        arcname = f"{manifest.root}/{rel}"
+        try:
+            if read is not None:
+                data, digest = read.result()
+                st = manifest.stats[rel]
+                tarinfo = make_tarinfo(arcname, st)
+                tarinfo.size = len(data)
+                self._set_entry_codec(tarinfo, compressor, self._stored(rel, data, codec, tarinfo.size))
+                tar.addfile(tarinfo, io.BytesIO(data))
+                if progress is not None:
+                    progress.add(read=len(data), files=1)
+                manifest.files[rel] = FileEntry(len(data), st.st_mtime_ns, digest)
+                return
+            st = manifest.stats.get(rel) or os.lstat(full)
+            if stat.S_ISREG(st.st_mode):
+                # Large files are re-stat'ed: tarfile copies exactly tarinfo.size bytes.
+                st = os.lstat(full)
+            tarinfo = make_tarinfo(arcname, st, os.readlink(full) if stat.S_ISLNK(st.st_mode) else "")
+            if tarinfo is None:
+                tarinfo = tar.gettarinfo(full, arcname=arcname)
+            if tarinfo is None:
+                logger.warning(f"Skipping unsupported file type: {full}")
+                manifest.files.pop(rel, None)
+                return
+            if not tarinfo.isreg():
+                self._set_entry_codec(tarinfo, compressor, False)
+                tar.addfile(tarinfo)
+                return
+            hasher = new_hasher()
+            with open(full, "rb") as f:
+                stored = self._stored(rel, f.read(compression.SAMPLE_SIZE), codec, tarinfo.size)
+                f.seek(0)
+                self._set_entry_codec(tarinfo, compressor, stored)
+                tar.addfile(tarinfo, _HashingReader(f, hasher, progress))
+            if progress is not None:
+                progress.add(files=1)
+        except FileNotFoundError:
+            self._file_disappeared(manifest, rel)
+            return
+        manifest.files[rel] = manifest.files[rel]._replace(digest=hasher.hexdigest())
+
+    def _train_dictionary(self, manifest: Manifest, paths: List[str]) -> Optional[bytes]:
+        """zstd dictionary trained on an even sample of the notes in ``paths``."""
+        notes = []
+        for rel in paths:
+            st = manifest.stats.get(rel)
+            if st is not None and stat.S_ISREG(st.st_mode) and st.st_size <= SMALL_FILE_SIZE and \
+                    os.path.splitext(rel)[1].lower() in compression.DICT_SAMPLE_EXTENSIONS:
+                notes.append(rel)
+        total = sum(manifest.stats[rel].st_size for rel in notes)
+        step = max(1, -(-total // compression.DICT_SAMPLE_BYTES))
+        samples = []
+        for rel in notes[::step]:
+            try:
+                with open(os.path.join(self.vault_path, *rel.split("/")), "rb") as f:
+                    samples.append(f.read())
+            except FileNotFoundError:
+                continue
+        dictionary = compression.train_dictionary(samples) if samples else None
+        if dictionary is None:
+            logger.warning("Too few notes to train a compression dictionary, compressing without one")
+        else:
+            logger.info(f"Trained a {len(dictionary) // 1024} KiB compression dictionary on {len(samples)} notes")
+        return dictionary
+
+    @staticmethod
+    def _set_entry_codec(tarinfo: tarfile.TarInfo, compressor: Optional[BinaryIO], stored: bool):
+        """Switch the stream to stored or compressed for the next entry and record it if it switched."""
+        if compressor is not None and compression.set_stored(compressor, stored):
+            tarinfo.pax_headers[PAX_CODEC] = "none"
+
+    def _write_indexed_archive(self, out: BinaryIO, manifest: Manifest, paths: List[str],
+                               crypto: CryptoVault, codec: str = compression.DEFAULT_CODEC,
+                               progress: Optional[Progress] = None):
+        progress = progress or Progress()
+        dictionary = None
+        if self.zstd_dictionary and codec == "zstd":
+            with span("dictionary"):
+                dictionary = self._train_dictionary(manifest, paths)
+        writer = IndexedArchiveWriter(CountingWriter(out, progress, "encrypted"), crypto,
+                                      manifest.root, codec=codec, dictionary=dictionary)
+        try:
+            with closing(self._read_ahead(manifest, paths)) as reads:
+                for rel in paths:
+                    full = os.path.join(self.vault_path, *rel.split("/"))
+                    try:
+                        if self._is_read_ahead(manifest, rel):
+                            data, digest = next(reads).result()
+                            writer.add_file(rel, manifest.stats[rel], io.BytesIO(data),
+                                            stored=self._stored(rel, data, codec))
+                            progress.add(read=len(data), files=1)
+                            manifest.files[rel] = FileEntry(len(data), manifest.stats[rel].st_mtime_ns, digest)
+                            continue
+                        st = os.lstat(full)
+                        if stat.S_ISDIR(st.st_mode):
+                            writer.add_directory(rel, st)
+                        elif stat.S_ISLNK(st.st_mode):
+                            writer.add_symlink(rel, st, os.readlink(full))
+                        elif stat.S_ISREG(st.st_mode):
+                            hasher = new_hasher()
+                            with open(full, "rb") as f:
+                                stored = self._stored(rel, f.read(compression.SAMPLE_SIZE), codec)
+                                f.seek(0)
+                                writer.add_file(rel, st, _HashingReader(f, hasher, progress), stored=stored)
+                            progress.add(files=1)
+                            manifest.files[rel] = manifest.files[rel]._replace(digest=hasher.hexdigest())
+                        else:
+                            logger.warning(f"Skipping unsupported file type: {full}")
+                            manifest.files.pop(rel, None)
+                    except FileNotFoundError:
+                        self._file_disappeared(manifest, rel)
+            writer.close()
+        except OSError as e:
+            raise ArchiveError(f"Archive creation failed: {str(e)}")
+
+    def _write_manifest(self, out: BinaryIO, manifest: Manifest, crypto: Optional[CryptoVault] = None):
+        data = manifest.to_bytes()
+        if crypto:
+            with crypto.writer(out, metadata={"type": "manifest"}) as writer:
+                writer.write(data)
+        else:
+            out.write(data)
+
+    @staticmethod
+    def read_manifest(path: str, crypto: Optional[CryptoVault] = None) -> Manifest:
+        """Read the (possibly encrypted) manifest file at ``path``."""
+        with open(path, "rb") as f:
+            if path.endswith(".enc"):
+                if crypto is None:
+                    raise EncryptionError(f"Password required to read manifest: {path}")
+                return Manifest.from_bytes(crypto.reader(f).read())
+            return Manifest.from_bytes(f.read())
+
+    def _find_latest_manifest(self, backup_dir: str, vault: str,
+                              crypto: Optional[CryptoVault] = None) -> Optional[Manifest]:
+        suffixes = (MANIFEST_SUFFIX, MANIFEST_SUFFIX + ".enc") if crypto else (MANIFEST_SUFFIX,)
+        names = sorted(
+            (name for name in os.listdir(backup_dir)
+             if name.startswith("obsidian_backup_") and name.endswith(suffixes)),
+            reverse=True
+        )
+        for name in names:
+            try:
+                manifest = self.read_manifest(os.path.join(backup_dir, name), crypto)
+            except ObsidianBackupError as e:
+                logger.warning(f"Ignoring unreadable manifest {name}: {str(e)}")
+                continue
+            if manifest.vault == vault and manifest.archive and \
+                    os.path.exists(os.path.join(backup_dir, manifest.archive)):
+                return manifest
+        return None
+
+    def restore_backup(self, target_dir: str, password: Optional[str] = None,
+                       paths: Optional[List[str]] = None, workers: Optional[int] = None,
+                       progress: Optional[ProgressCallback] = None) -> str:
+        """Restore this backup archive into ``target_dir``.
+
+        For an incremental backup the full base archive and every increment
+        up to this one are extracted in order, applying each increment's
+        deletions. ``paths`` optionally limits the restore to vault-relative
+        glob patterns; indexed archives then only read the blocks holding
+        the matching files. Tar archives are decrypted, decompressed and
+        extracted in a single streaming pass, with up to ``workers`` threads
+        writing small files. ``progress`` counts archive bytes read. If the
+        restore is cancelled, a vault directory it created is removed again.
+        Returns the path of the restored vault.
+        """
+        archive_path = os.path.abspath(self._validate_backup_file(self.vault_path))
+        crypto = self._crypto(password)
+        if archive_path.endswith((".enc", indexed.EXTENSION)) and crypto is None:
+            raise EncryptionError("Password required for decryption")
+
+        chain = self._resolve_chain(archive_path, crypto)
+        last_manifest = chain[-1][1]
+        restored = os.path.join(target_dir, last_manifest.root) if last_manifest else target_dir
+        created = last_manifest is not None and not os.path.lexists(restored)
+        tracker = Progress(progress)
+        tracker.start("restore", bytes_total=sum(os.path.getsize(path) for path, _ in chain))
+        os.makedirs(target_dir, exist_ok=True)
+        try:
+            for path, manifest in chain:
+                logger.info(f"Restoring {os.path.basename(path)}")
+                # Deletions first: a path that changed type (or was deleted and
+                # re-created) since the previous backup is in both lists.
+                deleted = [rel for rel in manifest.deleted if match_paths(rel, paths)] if manifest else []
+                if deleted:
+                    self._apply_tombstones(os.path.join(target_dir, manifest.root), deleted)
+                with span("extract", bytes=os.path.getsize(path)):
+                    self._extract_archive(path, target_dir, crypto, paths, workers, tracker)
+        except OperationCancelled:
+            logger.info("Restore cancelled")
+            if created and os.path.isdir(restored):
+                shutil.rmtree(restored)
+            raise
+        tracker.finish()
+
+        logger.info(f"Backup restored to: {restored}")
+        return restored
+
+    def _resolve_chain(self, archive_path: str,
+                       crypto: Optional[CryptoVault] = None) -> List[Tuple[str, Optional[Manifest]]]:
+        """Return ``[(archive, manifest), ...]`` from the full base up to ``archive_path``."""
+        chain = []
+        seen = set()
+        path = archive_path
+        while True:
+            seen.add(path)
+            manifest_path = manifest_path_for(path)
+            manifest = self.read_manifest(manifest_path, crypto) if os.path.exists(manifest_path) else None
+            chain.append((path, manifest))
+            if manifest is None or manifest.kind == "full":
+                break
+            if not manifest.parent:
+                raise ArchiveError(f"Incremental backup has no parent: {path}")
+            path = os.path.join(os.path.dirname(path), manifest.parent)
+            if path in seen:
+                raise ArchiveError(f"Backup chain loops at: {path}")
+            if not os.path.isfile(path):
+                raise ArchiveError(f"Missing parent backup in chain: {path}")
+        chain.reverse()
+        return chain
+
+    @contextmanager
+    def _open_archive(self, path: str, crypto: Optional[CryptoVault] = None,
+                      progress: Optional[Progress] = None) -> Iterator[BinaryIO]:
+        """Yield the decrypted, decompressed tar stream of the archive at ``path``."""
+        with open(path, "rb") as f:
+            if path.endswith(".enc"):
+                if crypto is None:
+                    raise EncryptionError("Password required for decryption")
+                plain = crypto.reader(CountingReader(f, progress) if progress else f)
+                codec = plain.metadata.get("codec", compression.DEFAULT_CODEC)
+            else:
+                codec = compression.detect_codec(f.read(4))
+                f.seek(0)
+                plain = CountingReader(f, progress) if progress else f
+            yield compression.open_reader(plain, codec)
+
+    def _extract_archive(self, path: str, target_dir: str, crypto: Optional[CryptoVault] = None,
+                         paths: Optional[List[str]] = None, workers: Optional[int] = None,
+                         progress: Optional[Progress] = None):
+        try:
+            if path.endswith(indexed.EXTENSION):
+                if crypto is None:
+                    raise EncryptionError("Password required for decryption")
+                with IndexedArchiveReader(path, crypto) as reader:
+                    reader.extract(target_dir, paths)
+                if progress:
+                    progress.add(read=os.path.getsize(path))
+                return
+            with self._open_archive(path, crypto, progress) as stream:
+                with tarfile.open(fileobj=stream, mode="r|") as tar:
+                    TarStreamExtractor(target_dir, paths, workers).extract(tar)
+        except (tarfile.TarError, OSError) as e:
+            raise ArchiveError(f"Archive extraction failed: {str(e)}")
+
+    def _apply_tombstones(self, vault_dir: str, deleted: List[str]):
+        base = os.path.abspath(vault_dir)
+        # Reverse order removes children before their parent directories.
+        for rel in sorted(deleted, reverse=True):
+            target = os.path.normpath(os.path.join(base, *rel.split("/")))
+            if os.path.commonpath([base, target]) != base or target == base:
+                raise ArchiveError(f"Unsafe path in backup manifest: {rel}")
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            elif os.path.lexists(target):
+                os.unlink(target)
+
+    def decrypt_backup(self, output_dir: str = None, password: Optional[str] = None,
+                       progress: Optional[ProgressCallback] = None) -> str:
         if not os.path.exists(self.vault_path):
             raise ArchiveError(f"Backup file not found: {self.vault_path}")
         if not os.path.isfile(self.vault_path):
             raise ArchiveError(f"Path is not a file: {self.vault_path}")
-        if not password:
+        crypto = self._crypto(password)
+        if crypto is None:
             raise EncryptionError("Password required for decryption")
 
         if output_dir is None:
@@ -94,13 +713,43 @@ class ObsidianBackuper:
         temp_path = os.path.join(output_dir, f"tmp_{decrypted_name}")
         final_path = os.path.join(output_dir, decrypted_name)
 
-        if not password:
-            raise EncryptionError("Password required for decryption")
-
-        crypto = CryptoVault(password)
-        crypto.decrypt_file(self.vault_path, temp_path)
+        crypto.decrypt_file(self.vault_path, temp_path, progress=progress)
         logger.debug(f"File decrypted to temporary: {temp_path}")
 
-        shutil.move(temp_path, final_path)
+        with span("move"):
+            shutil.move(temp_path, final_path)
         logger.info(f"Backup decrypted to: {final_path}")
-        return final_path
\ No newline at end of file
+        return final_path
+
+    def rekey_backup(self, password: Optional[str] = None, new_password: Optional[str] = None,
+                     new_keyfiles: Iterable[str] = (), keep_existing: bool = False) -> str:
+        """Change who can decrypt this encrypted backup, without re-encrypting it.
+
+        The archive's data key is unwrapped with ``password`` and this
+        backuper's keyfiles, then wrapped for ``new_password`` and
+        ``new_keyfiles`` (in addition to the current recipients with
+        ``keep_existing``). Only the key header of the archive and of its
+        manifest is rewritten, in place. Returns the archive path.
+        """
+        archive_path = self._validate_backup_file(self.vault_path)
+        if not archive_path.endswith((".enc", indexed.EXTENSION)):
+            raise ArchiveError(f"Not an encrypted backup: {archive_path}")
+        crypto = self._crypto(password)
+        if crypto is None:
+            raise EncryptionError("Password required for decryption")
+        new_crypto = CryptoVault(new_password, keyfiles=new_keyfiles)
+        manifest_path = manifest_path_for(archive_path)
+        has_manifest = os.path.exists(manifest_path)
+        if has_manifest:
+            # Fail before touching the archive if the manifest won't open.
+            with open(manifest_path, "rb") as f:
+                crypto.reader(f).close()
+
+        if archive_path.endswith(indexed.EXTENSION):
+            indexed.rekey_archive(archive_path, crypto, new_crypto, keep_existing)
+        else:
+            rekey_file(archive_path, crypto, new_crypto, keep_existing)
+        if has_manifest:
+            rekey_file(manifest_path, crypto, new_crypto, keep_existing)
+        logger.info(f"Changed the keys of {archive_path}")
+        return archive_path
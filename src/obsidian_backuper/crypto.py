@@ -1,78 +1,739 @@
+import io
 import os
+import json
 import base64
+import struct
+import time
+import hashlib
+import logging
+import platform
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Deque, Dict, Iterable, List, Optional, Tuple, Union
+import cryptography
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
-from .exceptions import EncryptionError
+from .compression import default_threads
+from .exceptions import EncryptionError, OperationCancelled
+from .options import AUTO_CIPHER
+from .profiling import span
+from .progress import CountingWriter, Progress, ProgressCallback
+
+logger = logging.getLogger(__name__)
 
 LENGTH = 32
 ITERATIONS = 480000
+SALT_SIZE = 16
+KEY_CACHE_SIZE = 64
+
+# Parameters are written to every header, so defaults can be tuned (or the
+# default KDF changed) without breaking files written earlier.
+DEFAULT_KDF = "pbkdf2-sha256"
+KDF_DEFAULTS = {
+    "pbkdf2-sha256": {"iterations": ITERATIONS},
+    "scrypt": {"n": 2 ** 17, "r": 8, "p": 1},
+    "argon2id": {"iterations": 3, "lanes": 4, "memory_cost": 64 * 1024},
+}
+
+# Streaming format: MAGIC | version (u8) | header length (u16) | JSON header,
+# followed by AES-GCM segments of SEGMENT_SIZE plaintext bytes each. Every
+# segment gets its own nonce (random prefix | counter | last flag) and tag,
+# and authenticates the whole header as associated data.
+# Version 2 (envelope encryption) encrypts the segments with a random data
+# key. A key area after the JSON header holds that key wrapped once per
+# recipient (password or keyfile). The key area is not part of the
+# associated data, so a rekey rewrites only the key area, in place.
+MAGIC = b"OBKENC"
+FORMAT_VERSION = 1
+ENVELOPE_FORMAT_VERSION = 2
+DATA_KEY_SIZE = 32
+# Key area: capacity (u32) | used (u32) | JSON list of recipients | zero padding.
+KEY_AREA_SIZE = 4096
+MAX_KEY_AREA_SIZE = 1024 * 1024
+KEYFILE_SIZE = 32
+SEGMENT_SIZE = 1024 * 1024
+NONCE_PREFIX_SIZE = 7
+MAX_SEGMENT_SIZE = 64 * 1024 * 1024
+TAG_SIZE = 16
+MAX_SEGMENTS = 2 ** 32
+
+_PREFIX = struct.Struct(">6sBH")
+_NONCE_SUFFIX = struct.Struct(">IB")
+_KEY_AREA = struct.Struct(">II")
+_KEYFILE_INFO = b"obsidian_backuper keyfile"
+
+# AEAD suites with 256-bit keys and 96-bit nonces, so they share the segment
+# layout. The suite is recorded in every header; headers without one were
+# written with AES-256-GCM. AES-GCM wins on CPUs with AES instructions,
+# ChaCha20-Poly1305 on those without; "auto" measures which.
+CIPHERS: Dict[str, type] = {
+    "aes-256-gcm": AESGCM,
+    "chacha20-poly1305": ChaCha20Poly1305,
+}
+DEFAULT_CIPHER = "aes-256-gcm"
+CALIBRATION_FILE = "cipher_calibration.json"
+CALIBRATION_SECONDS = 0.05
+
+
+def _segment_nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    if index >= MAX_SEGMENTS:
+        raise EncryptionError("Too many segments for a single file")
+    return prefix + _NONCE_SUFFIX.pack(index, 1 if last else 0)
+
+
+def cipher_suite(name: Optional[str]) -> type:
+    """AEAD class of the suite ``name`` (None means the pre-suite default)."""
+    try:
+        return CIPHERS[name or DEFAULT_CIPHER]
+    except KeyError:
+        raise EncryptionError(f"Unsupported cipher: {name}")
+
+
+def benchmark_ciphers(seconds: float = CALIBRATION_SECONDS, size: int = SEGMENT_SIZE) -> Dict[str, float]:
+    """Encryption throughput of each suite in MB/s, measuring each for about ``seconds``."""
+    data = os.urandom(size)
+    nonce = os.urandom(12)
+    results = {}
+    for name, suite in CIPHERS.items():
+        aead = suite(os.urandom(LENGTH))
+        aead.encrypt(nonce, data, None)
+        rounds = 0
+        started = time.perf_counter()
+        while True:
+            aead.encrypt(nonce, data, None)
+            rounds += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= seconds:
+                break
+        results[name] = rounds * size / elapsed / 1e6
+    return results
+
+
+def calibration_cache_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "obsidian_backuper", CALIBRATION_FILE)
 
-class CryptoVault:
-    def __init__(self, password: str, salt: bytes = None):
-        if not password:
-            raise EncryptionError("Password cannot be empty")
-        self.password = password
-        self.salt = salt or os.urandom(16)
-        self.key = self._derive_key(password)
 
-    def _derive_key(self, password: str) -> bytes:
+def _machine_id() -> List[str]:
+    # Results are only reused on the same host, CPU architecture and library.
+    return [platform.node(), platform.machine(), platform.processor(), cryptography.__version__]
+
+
+def calibrate(refresh: bool = False) -> Dict[str, float]:
+    """Cipher throughputs for this machine, measured once and cached on disk."""
+    path = calibration_cache_path()
+    if not refresh:
         try:
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=LENGTH,
-                salt=self.salt,
-                iterations=ITERATIONS,
-                backend=default_backend()
-            )
-            return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+            with open(path) as f:
+                cached = json.load(f)
+            if cached.get("machine") == _machine_id() and set(cached.get("results", {})) == set(CIPHERS):
+                return cached["results"]
+        except (OSError, ValueError, AttributeError):
+            pass
+    results = benchmark_ciphers()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"machine": _machine_id(), "results": results}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.debug(f"Cannot cache cipher calibration in {path}: {str(e)}")
+    return results
+
+
+_auto_cipher: Optional[str] = None
+
+
+def resolve_cipher(name: Optional[str]) -> str:
+    """Validate a suite name, replacing ``auto`` with the fastest suite on this CPU."""
+    global _auto_cipher
+    name = name or DEFAULT_CIPHER
+    if name != AUTO_CIPHER:
+        cipher_suite(name)
+        return name
+    if _auto_cipher is None:
+        results = calibrate()
+        _auto_cipher = max(results, key=results.get)
+        logger.debug(f"Cipher calibration picked {_auto_cipher}: {results}")
+    return _auto_cipher
+
+
+def format_calibration(results: Dict[str, float]) -> str:
+    fastest = max(results, key=results.get)
+    return "\n".join(f"{name:>18}: {speed:8.1f} MB/s{'  (auto)' if name == fastest else ''}"
+                     for name, speed in results.items())
+
+
+class _SegmentPool:
+    """Runs segment jobs on a thread pool (created on first use), or inline for one thread.
+
+    AES-GCM releases the GIL, so segments are sealed and opened in parallel.
+    """
+
+    def __init__(self, threads: Optional[int]):
+        self.threads = threads or default_threads()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, func, *args, inline: bool = False) -> Future:
+        if self.threads > 1 and not inline:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="crypto")
+            return self._executor.submit(func, *args)
+        future = Future()
+        try:
+            future.set_result(func(*args))
         except Exception as e:
-            raise EncryptionError(f"Key derivation failed: {str(e)}")
+            future.set_exception(e)
+        return future
 
-    def encrypt_file(self, input_path: str, output_path: str):
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+class EncryptingWriter(io.RawIOBase):
+    """Write-only stream that encrypts everything written to it into ``dst``.
+
+    Segments are encrypted on ``threads`` threads and written in order, with
+    at most two segments per thread in flight.
+    """
+
+    def __init__(self, aead, header: bytes, nonce_prefix: bytes,
+                 dst: BinaryIO, segment_size: int = SEGMENT_SIZE, threads: Optional[int] = None,
+                 key_area: bytes = b""):
+        self._aead = aead
+        self._header = header
+        self._nonce_prefix = nonce_prefix
+        self._dst = dst
+        self._segment_size = segment_size
+        self._buffer = bytearray()
+        self._index = 0
+        self._pool = _SegmentPool(threads)
+        self._in_flight: Deque[Future] = deque()
+        self._max_in_flight = self._pool.threads * 2
+        dst.write(header + key_area)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += data
+        # Keep at least one byte buffered so the final segment is only
+        # emitted by close() and can carry the "last" flag.
+        while len(self._buffer) > self._segment_size:
+            self._emit(bytes(self._buffer[:self._segment_size]), last=False)
+            del self._buffer[:self._segment_size]
+        return len(data)
+
+    def _emit(self, plaintext: bytes, last: bool):
+        nonce = _segment_nonce(self._nonce_prefix, self._index, last)
+        # A lone final segment (small files) is sealed inline, without starting the pool.
+        self._in_flight.append(self._pool.submit(self._seal, nonce, plaintext,
+                                                 inline=last and not self._in_flight))
+        self._index += 1
+        while len(self._in_flight) > (0 if last else self._max_in_flight):
+            self._dst.write(self._in_flight.popleft().result())
+
+    def _seal(self, nonce: bytes, plaintext: bytes) -> bytes:
+        with span("encrypt", bytes=len(plaintext)):
+            return self._aead.encrypt(nonce, plaintext, self._header)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._emit(bytes(self._buffer), last=True)
+                self._buffer.clear()
+            finally:
+                self._pool.shutdown()
+        super().close()
+
+
+class DecryptingReader(io.RawIOBase):
+    """Read-only stream yielding the plaintext of a segmented ``src``.
+
+    Up to two segments per thread are read ahead and decrypted on
+    ``threads`` threads; plaintext is returned in order.
+    """
+
+    def __init__(self, aead, header: bytes, nonce_prefix: bytes,
+                 src: BinaryIO, segment_size: int, metadata: Optional[dict] = None,
+                 threads: Optional[int] = None):
+        self.metadata = metadata or {}
+        self._aead = aead
+        self._header = header
+        self._nonce_prefix = nonce_prefix
+        self._src = src
+        self._ct_size = segment_size + TAG_SIZE
+        self._index = 0
+        self._pending = src.read(self._ct_size)
+        self._pool = _SegmentPool(threads)
+        self._in_flight: Deque[Tuple[Future, bool]] = deque()
+        self._max_in_flight = self._pool.threads * 2
+        self._plain = b""
+        self._pos = 0
+        self._done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self):
+        while self._pending and len(self._in_flight) < self._max_in_flight:
+            following = self._src.read(self._ct_size)
+            last = not following
+            nonce = _segment_nonce(self._nonce_prefix, self._index, last)
+            future = self._pool.submit(self._open, nonce, self._pending,
+                                       inline=last and not self._in_flight)
+            self._in_flight.append((future, last))
+            self._index += 1
+            self._pending = following
+
+    def _open(self, nonce: bytes, ciphertext: bytes) -> bytes:
+        with span("decrypt", bytes=len(ciphertext)):
+            return self._aead.decrypt(nonce, ciphertext, self._header)
+
+    def _next_segment(self):
+        self._fill()
+        if not self._in_flight:
+            raise EncryptionError("Encrypted file is truncated")
+        future, last = self._in_flight.popleft()
         try:
-            if not os.path.exists(input_path):
-                raise EncryptionError(f"Input file not found: {input_path}")
+            self._plain = future.result()
+        except InvalidTag:
+            raise EncryptionError("Invalid password or corrupted file")
+        self._pos = 0
+        self._done = last
+        if last:
+            self._pool.shutdown()
 
-            fernet = Fernet(self.key)
-            with open(input_path, 'rb') as f:
-                data = f.read()
+    def readinto(self, buffer) -> int:
+        while self._pos >= len(self._plain):
+            if self._done:
+                return 0
+            self._next_segment()
+        size = min(len(buffer), len(self._plain) - self._pos)
+        buffer[:size] = self._plain[self._pos:self._pos + size]
+        self._pos += size
+        return size
 
-            encrypted = fernet.encrypt(data)
+    def close(self):
+        self._pool.shutdown()
+        super().close()
 
-            with open(output_path, 'wb') as f:
-                f.write(self.salt + encrypted)
 
-        except (IOError, InvalidToken) as e:
-            raise EncryptionError(f"Encryption failed: {str(e)}")
+def kdf_params(name: str = DEFAULT_KDF, **overrides) -> dict:
+    """Return the parameters of KDF ``name`` (defaults updated with ``overrides``)."""
+    if name not in KDF_DEFAULTS:
+        raise EncryptionError(f"Unsupported key derivation function: {name}")
+    return {"name": name, **KDF_DEFAULTS[name], **overrides}
+
 
-    
-    def decrypt_file(self, input_path: str, output_path: str):
+def _run_kdf(password: bytes, salt: bytes, params: dict) -> bytes:
+    name = params.get("name")
+    if name == "pbkdf2-sha256":
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=LENGTH,
+            salt=salt,
+            iterations=params["iterations"],
+            backend=default_backend()
+        )
+    elif name == "scrypt":
+        kdf = Scrypt(salt=salt, length=LENGTH, n=params["n"], r=params["r"], p=params["p"])
+    elif name == "argon2id":
         try:
-            if not os.path.exists(input_path):
-                raise EncryptionError(f"Encrypted file not found: {input_path}")
+            from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+        except ImportError:
+            raise EncryptionError("argon2id requires cryptography>=44")
+        kdf = Argon2id(salt=salt, length=LENGTH, iterations=params["iterations"],
+                       lanes=params["lanes"], memory_cost=params["memory_cost"])
+    else:
+        raise EncryptionError(f"Unsupported key derivation function: {name}")
+    return kdf.derive(password)
+
+
+_key_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_key_locks: Dict[tuple, threading.Lock] = {}
+_session_salts: Dict[tuple, bytes] = {}
+_cache_lock = threading.Lock()
+
 
-            with open(input_path, 'rb') as f:
-                salt = f.read(16)
-                encrypted = f.read()
+def _password_id(password: str) -> bytes:
+    return hashlib.sha256(password.encode()).digest()
 
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=LENGTH,
-                salt=salt,
-                iterations=ITERATIONS,
-                backend=default_backend()
-            )
 
-            key = base64.urlsafe_b64encode(kdf.derive(self.password.encode()))
-            fernet = Fernet(key)
-            decrypted = fernet.decrypt(encrypted)
+def _params_id(params: dict) -> tuple:
+    return tuple(sorted((k, v) for k, v in params.items() if k != "salt"))
 
-            with open(output_path, 'wb') as f:
-                f.write(decrypted)
 
+def derive_key(password: str, salt: bytes, params: Optional[dict] = None) -> bytes:
+    """Derive a raw key, reusing keys already derived in this process.
+
+    The cache is keyed by (password, salt, KDF parameters), so decrypting
+    many files written in one session, or encrypting several archives with
+    the same password, runs the KDF once.
+    """
+    params = params or kdf_params()
+    cache_key = (_password_id(password), salt, _params_id(params))
+    with _cache_lock:
+        if cache_key in _key_cache:
+            _key_cache.move_to_end(cache_key)
+            return _key_cache[cache_key]
+        key_lock = _key_locks.setdefault(cache_key, threading.Lock())
+
+    # Concurrent callers asking for the same key wait for one derivation.
+    with key_lock:
+        with _cache_lock:
+            if cache_key in _key_cache:
+                return _key_cache[cache_key]
+        try:
+            with span("kdf"):
+                key = _run_kdf(password.encode(), salt, params)
+        except EncryptionError:
+            raise
+        except Exception as e:
+            raise EncryptionError(f"Key derivation failed: {str(e)}")
+        with _cache_lock:
+            _key_cache[cache_key] = key
+            while len(_key_cache) > KEY_CACHE_SIZE:
+                _key_cache.popitem(last=False)
+            _key_locks.pop(cache_key, None)
+        return key
+
+
+def clear_key_cache():
+    with _cache_lock:
+        _key_cache.clear()
+        _session_salts.clear()
+
+
+def _session_salt(password: str, params: dict) -> bytes:
+    """Random salt shared by all vaults created with this password in this process."""
+    with _cache_lock:
+        return _session_salts.setdefault((_password_id(password), _params_id(params)),
+                                         os.urandom(SALT_SIZE))
+
+
+def generate_keyfile(path: str):
+    """Write a new random keyfile to ``path`` (readable by the owner only), refusing to overwrite."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except OSError as e:
+        raise EncryptionError(f"Cannot create keyfile {path}: {str(e)}")
+    with os.fdopen(fd, "wb") as f:
+        f.write(os.urandom(KEYFILE_SIZE))
+
+
+def _keyfile_key(path: str) -> bytes:
+    try:
+        with open(os.path.expanduser(path), "rb") as f:
+            secret = f.read()
+    except OSError as e:
+        raise EncryptionError(f"Cannot read keyfile {path}: {str(e)}")
+    if len(secret) < KEYFILE_SIZE:
+        raise EncryptionError(f"Keyfile {path} is shorter than {KEYFILE_SIZE} bytes")
+    return HKDF(algorithm=hashes.SHA256(), length=LENGTH, salt=None, info=_KEYFILE_INFO).derive(secret)
+
+
+def _keyfile_id(key: bytes) -> str:
+    return hashlib.sha256(b"id" + key).hexdigest()[:16]
+
+
+def pack_key_area(recipients: List[dict], capacity: int = KEY_AREA_SIZE) -> bytes:
+    body = json.dumps(recipients, separators=(",", ":")).encode()
+    if len(body) > capacity:
+        raise EncryptionError(f"Too many recipients for the {capacity}-byte key header")
+    return _KEY_AREA.pack(capacity, len(body)) + body + bytes(capacity - len(body))
+
+
+def read_key_area(src: BinaryIO) -> Tuple[List[dict], int]:
+    """Recipients and capacity of the key area at the current position of ``src``."""
+    raw = src.read(_KEY_AREA.size)
+    if len(raw) < _KEY_AREA.size:
+        raise EncryptionError("Encrypted file is truncated")
+    capacity, used = _KEY_AREA.unpack(raw)
+    if capacity > MAX_KEY_AREA_SIZE or used > capacity:
+        raise EncryptionError("Corrupted encryption header")
+    area = src.read(capacity)
+    try:
+        recipients = json.loads(area[:used])
+    except ValueError:
+        raise EncryptionError("Corrupted encryption header")
+    if len(area) < capacity or not isinstance(recipients, list):
+        raise EncryptionError("Corrupted encryption header")
+    return recipients, capacity
+
+
+class CryptoVault:
+    """Credentials (a password and/or keyfiles) and the settings for new encrypted files.
+
+    New files are encrypted with a random data key, wrapped for every
+    credential of the vault; any one of them can decrypt.
+    """
+
+    def __init__(self, password: Optional[str] = None, salt: bytes = None,
+                 kdf: Optional[Union[str, dict]] = None, cipher: Optional[str] = None,
+                 keyfiles: Iterable[str] = ()):
+        keyfile_keys = [_keyfile_key(path) for path in keyfiles]
+        if not password and not keyfile_keys:
+            raise EncryptionError("Password cannot be empty")
+        self.password = password or None
+        self.keyfile_keys: Dict[str, bytes] = {_keyfile_id(key): key for key in keyfile_keys}
+        # Suite for new files; reading always follows the file's header.
+        self.cipher = resolve_cipher(cipher)
+        self.kdf = kdf_params(kdf or DEFAULT_KDF) if not isinstance(kdf, dict) else dict(kdf)
+        self.kdf.pop("salt", None)
+        self.salt = salt or (_session_salt(password, self.kdf) if password else os.urandom(SALT_SIZE))
+
+    @property
+    def raw_key(self) -> bytes:
+        """Password-derived key for ``salt``, derived on first use."""
+        if not self.password:
+            raise EncryptionError("Password required for decryption")
+        return derive_key(self.password, self.salt, self.kdf)
+
+    @property
+    def key(self) -> bytes:
+        return base64.urlsafe_b64encode(self.raw_key)
+
+    def kdf_header(self) -> dict:
+        """KDF name, parameters and salt, as stored in file headers."""
+        return {**self.kdf, "salt": base64.b64encode(self.salt).decode()}
+
+    def key_for_header(self, kdf: dict) -> bytes:
+        """Derive the key described by a header written with :meth:`kdf_header`."""
+        try:
+            params = dict(kdf)
+            salt = base64.b64decode(params.pop("salt"))
+        except (KeyError, TypeError, ValueError):
+            raise EncryptionError("Corrupted encryption header")
+        if not self.password:
+            raise EncryptionError("Password required for decryption")
+        return derive_key(self.password, salt, params)
+
+    def wrap_data_key(self, data_key: bytes, aad: bytes) -> List[dict]:
+        """Recipient entries holding ``data_key`` encrypted for each credential, bound to ``aad``."""
+        credentials = []
+        if self.password:
+            credentials.append(({"type": "password", "kdf": self.kdf_header()}, self.raw_key))
+        credentials.extend(({"type": "keyfile", "id": key_id}, key) for key_id, key in self.keyfile_keys.items())
+        recipients = []
+        for entry, key in credentials:
+            nonce = os.urandom(12)
+            wrapped = AESGCM(key).encrypt(nonce, data_key, aad)
+            recipients.append({**entry, "nonce": base64.b64encode(nonce).decode(),
+                               "key": base64.b64encode(wrapped).decode()})
+        return recipients
+
+    def unwrap_data_key(self, recipients: List[dict], aad: bytes) -> bytes:
+        """The data key from the first recipient entry this vault's credentials open."""
+        for entry in recipients:
+            if not isinstance(entry, dict):
+                continue
+            if entry.get("type") == "password" and self.password:
+                key = self.key_for_header(entry.get("kdf"))
+            elif entry.get("type") == "keyfile":
+                key = self.keyfile_keys.get(entry.get("id"))
+            else:
+                key = None
+            if key is None:
+                continue
+            try:
+                return AESGCM(key).decrypt(base64.b64decode(entry["nonce"]), base64.b64decode(entry["key"]), aad)
+            except (InvalidTag, KeyError, TypeError, ValueError):
+                continue
+        raise EncryptionError("Invalid password or corrupted file")
+
+    def new_key_area(self, aad: bytes) -> Tuple[bytes, bytes]:
+        """A fresh random data key and the key area wrapping it for this vault's credentials."""
+        data_key = os.urandom(DATA_KEY_SIZE)
+        return data_key, pack_key_area(self.wrap_data_key(data_key, aad))
+
+    def open_key_area(self, src: BinaryIO, aad: bytes) -> bytes:
+        """Read the key area at the current position of ``src`` and return its data key."""
+        recipients, _ = read_key_area(src)
+        return self.unwrap_data_key(recipients, aad)
+
+    def aead(self, key: Optional[bytes] = None, cipher: Optional[str] = None):
+        """AEAD of ``cipher`` (default: this vault's suite) keyed with ``key`` (default: :attr:`raw_key`)."""
+        return cipher_suite(cipher or self.cipher)(key or self.raw_key)
+
+    def writer(self, dst: BinaryIO, segment_size: int = SEGMENT_SIZE,
+               metadata: Optional[dict] = None, threads: Optional[int] = None) -> EncryptingWriter:
+        """Return a stream that encrypts data written to it into ``dst``.
+
+        ``metadata`` is stored (authenticated, not encrypted) in the header,
+        e.g. the compression codec of the archive. Segments are encrypted
+        on ``threads`` threads (default: one per CPU core).
+        """
+        nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+        meta = json.dumps({
+            **(metadata or {}),
+            "cipher": self.cipher,
+            "segment_size": segment_size,
+            "nonce_prefix": base64.b64encode(nonce_prefix).decode(),
+        }, separators=(",", ":")).encode()
+        header = _PREFIX.pack(MAGIC, ENVELOPE_FORMAT_VERSION, len(meta)) + meta
+        data_key, key_area = self.new_key_area(header)
+        return EncryptingWriter(self.aead(data_key), header, nonce_prefix, dst, segment_size, threads, key_area)
+
+    def reader(self, src: BinaryIO, threads: Optional[int] = None) -> io.RawIOBase:
+        """Return a stream of the plaintext stored in ``src``.
+
+        The header metadata is available as the stream's ``metadata``.
+        Segments are decrypted on ``threads`` threads, reading ahead of
+        the consumer.
+        Legacy Fernet files (salt followed by a Fernet token) cannot be
+        streamed and are decrypted in memory.
+        """
+        prefix = src.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size or not prefix.startswith(MAGIC):
+            legacy = io.BytesIO(self._decrypt_legacy(prefix + src.read()))
+            legacy.metadata = {}
+            return legacy
+
+        _, version, meta_len = _PREFIX.unpack(prefix)
+        if version not in (FORMAT_VERSION, ENVELOPE_FORMAT_VERSION):
+            raise EncryptionError(f"Unsupported encryption format version: {version}")
+        meta_raw = src.read(meta_len)
+        try:
+            meta = json.loads(meta_raw)
+            if version == FORMAT_VERSION:
+                # Headers written before KDF parameters were recorded only carry a salt.
+                kdf = meta.get("kdf") or {**kdf_params(), "salt": meta["salt"]}
+            nonce_prefix = base64.b64decode(meta["nonce_prefix"])
+            segment_size = int(meta["segment_size"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise EncryptionError("Corrupted encryption header")
+        if len(nonce_prefix) != NONCE_PREFIX_SIZE or not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise EncryptionError("Corrupted encryption header")
+
+        header = prefix + meta_raw
+        key = self.key_for_header(kdf) if version == FORMAT_VERSION else self.open_key_area(src, header)
+        aead = self.aead(key, meta.get("cipher", DEFAULT_CIPHER))
+        return DecryptingReader(aead, header, nonce_prefix, src, segment_size, meta, threads)
+
+    def _decrypt_legacy(self, data: bytes) -> bytes:
+        salt, token = data[:SALT_SIZE], data[SALT_SIZE:]
+        if not self.password:
+            raise EncryptionError("Password required for decryption")
+        try:
+            key = base64.urlsafe_b64encode(derive_key(self.password, salt, kdf_params()))
+            return Fernet(key).decrypt(token)
         except InvalidToken:
             raise EncryptionError("Invalid password or corrupted file")
+
+    def encrypt_stream(self, src: BinaryIO, dst: BinaryIO, chunk_size: int = SEGMENT_SIZE,
+                       progress: Optional[Progress] = None):
+        progress = progress or Progress()
+        with self.writer(CountingWriter(dst, progress, "encrypted")) as writer:
+            while chunk := src.read(chunk_size):
+                writer.write(chunk)
+                progress.add(read=len(chunk))
+
+    def decrypt_stream(self, src: BinaryIO, dst: BinaryIO, chunk_size: int = SEGMENT_SIZE,
+                       progress: Optional[Progress] = None):
+        reader = self.reader(src)
+        position = 0
+        while chunk := reader.read(chunk_size):
+            dst.write(chunk)
+            if progress is not None:
+                # Count ciphertext consumed, which is what the file size refers to.
+                new_position = src.tell()
+                progress.add(read=new_position - position)
+                position = new_position
+
+    def encrypt_file(self, input_path: str, output_path: str,
+                     progress: Optional[ProgressCallback] = None):
+        try:
+            if not os.path.exists(input_path):
+                raise EncryptionError(f"Input file not found: {input_path}")
+
+            tracker = Progress(progress)
+            tracker.start("encrypt", bytes_total=os.path.getsize(input_path))
+            with span("encrypt_file", bytes=os.path.getsize(input_path)), \
+                    open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+                self.encrypt_stream(src, dst, progress=tracker)
+            tracker.finish()
+
+        except IOError as e:
+            raise EncryptionError(f"Encryption failed: {str(e)}")
+
+    def decrypt_file(self, input_path: str, output_path: str,
+                     progress: Optional[ProgressCallback] = None):
+        if not os.path.exists(input_path):
+            raise EncryptionError(f"Encrypted file not found: {input_path}")
+
+        tracker = Progress(progress)
+        try:
+            tracker.start("decrypt", bytes_total=os.path.getsize(input_path))
+            with span("decrypt_file", bytes=os.path.getsize(input_path)), \
+                    open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+                self.decrypt_stream(src, dst, progress=tracker)
+            tracker.finish()
         except Exception as e:
+            # Segments are authenticated one at a time, so never leave
+            # partially decrypted plaintext behind.
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+            if isinstance(e, (EncryptionError, OperationCancelled)):
+                raise
             raise EncryptionError(f"Decryption failed: {str(e)}")
+
+
+def rekey_key_area(f: BinaryIO, header: bytes, vault: CryptoVault, new_vault: CryptoVault,
+                   keep_existing: bool = False, backup_path: Optional[str] = None):
+    """Rewrite the key area at the current position of ``f`` (opened ``r+b``) for ``new_vault``.
+
+    ``vault`` must open the current key area. With ``keep_existing`` the
+    current recipients stay and ``new_vault``'s credentials are added.
+    The area keeps its size, so nothing after it moves. The old area is
+    copied to ``backup_path`` first and removed once the new one is on disk.
+    """
+    offset = f.tell()
+    recipients, capacity = read_key_area(f)
+    data_key = vault.unwrap_data_key(recipients, header)
+    added = new_vault.wrap_data_key(data_key, header)
+    if keep_existing:
+        known = {entry.get("id") for entry in recipients if entry.get("type") == "keyfile"}
+        added = recipients + [entry for entry in added if entry["type"] != "keyfile" or entry["id"] not in known]
+    area = pack_key_area(added, capacity)
+    f.seek(offset)
+    old_area = f.read(len(area))
+    if backup_path:
+        with open(backup_path, "wb") as backup:
+            backup.write(old_area)
+            backup.flush()
+            os.fsync(backup.fileno())
+    f.seek(offset)
+    f.write(area)
+    f.flush()
+    os.fsync(f.fileno())
+    if backup_path:
+        os.unlink(backup_path)
+
+
+def rekey_file(path: str, vault: CryptoVault, new_vault: CryptoVault, keep_existing: bool = False):
+    """Re-wrap the data key of an encrypted file in place, without re-encrypting its content."""
+    try:
+        with open(path, "r+b") as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size or not prefix.startswith(MAGIC):
+                raise EncryptionError(f"Not an encrypted backup: {path}")
+            _, version, meta_len = _PREFIX.unpack(prefix)
+            if version != ENVELOPE_FORMAT_VERSION:
+                raise EncryptionError(f"{path} predates envelope encryption; re-encrypt it to change its keys")
+            header = prefix + f.read(meta_len)
+            rekey_key_area(f, header, vault, new_vault, keep_existing, backup_path=path + ".keyheader.bak")
+    except OSError as e:
+        raise EncryptionError(f"Rekey failed: {str(e)}")
@@ -14,4 +14,7 @@ class ConfigError(ObsidianBackupError):
     pass
 
 class DecryptionError(ObsidianBackupError):
+    pass
+
+class OperationCancelled(ObsidianBackupError):
     pass
\ No newline at end of file
@@ -0,0 +1,192 @@
+import os
+import shutil
+import tarfile
+import logging
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional
+from .crypto import CryptoVault, SEGMENT_SIZE
+from .exceptions import ArchiveError, ConfigError, EncryptionError
+from .restore import TarStreamExtractor
+
+logger = logging.getLogger(__name__)
+
+BRANCH = "snapshots"
+GC_EVERY = 24
+_AUTHOR = {
+    "GIT_AUTHOR_NAME": "obsidian-backup",
+    "GIT_AUTHOR_EMAIL": "obsidian-backup@localhost",
+    "GIT_COMMITTER_NAME": "obsidian-backup",
+    "GIT_COMMITTER_EMAIL": "obsidian-backup@localhost",
+}
+# Applied on init: notes are small text files, so favour pack size over speed,
+# and run gc ourselves every GC_EVERY snapshots instead of during commits.
+_REPO_CONFIG = {
+    "core.compression": "9",
+    "pack.window": "50",
+    "pack.depth": "50",
+    "gc.auto": "0",
+}
+_SECTION = "obsidianbackup"
+
+
+def _gitpython():
+    try:
+        import git
+    except ImportError as e:
+        # GitPython raises ImportError when the git executable is missing too.
+        raise ConfigError(f"Git snapshots require GitPython and the git executable: {str(e)}")
+    return git
+
+
+class GitSnapshotRepository:
+    """Vault snapshots committed into a bare git repository outside the vault.
+
+    Each snapshot is a commit on the ``snapshots`` branch; unchanged notes
+    are stored once and ``git gc`` delta-compresses edited ones. The
+    repository itself is not encrypted; :meth:`export_bundle` writes an
+    encrypted bundle for off-site copies.
+    """
+
+    def __init__(self, path: str):
+        git = _gitpython()
+        self.path = os.path.abspath(os.path.expanduser(path))
+        try:
+            self.repo = git.Repo(self.path)
+        except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+            raise ArchiveError(f"Not a git snapshot repository: {self.path}")
+        if not self.repo.bare:
+            raise ArchiveError(f"Git snapshot repository must be bare: {self.path}")
+
+    @classmethod
+    def init(cls, path: str) -> "GitSnapshotRepository":
+        git = _gitpython()
+        path = os.path.abspath(os.path.expanduser(path))
+        repo = git.Repo.init(path, bare=True, initial_branch=BRANCH)
+        with repo.config_writer() as config:
+            for key, value in _REPO_CONFIG.items():
+                config.set_value(*key.split("."), value)
+        logger.info(f"Initialized git snapshot repository at {path}")
+        return cls(path)
+
+    @classmethod
+    def open_or_init(cls, path: str) -> "GitSnapshotRepository":
+        path = os.path.expanduser(path)
+        if os.path.exists(os.path.join(path, "HEAD")):
+            return cls(path)
+        if os.path.exists(path) and os.listdir(path):
+            raise ArchiveError(f"Directory exists and is not a git snapshot repository: {path}")
+        return cls.init(path)
+
+    @contextmanager
+    def _git_errors(self, action: str) -> Iterator[None]:
+        git = _gitpython()
+        try:
+            yield
+        except git.exc.GitCommandError as e:
+            raise ArchiveError(f"Git {action} failed: {e.stderr.strip() or str(e)}")
+
+    def snapshot(self, vault_path: str, message: Optional[str] = None) -> Optional[str]:
+        """Commit the current state of ``vault_path``; returns the commit id.
+
+        Returns None when nothing changed since the previous snapshot.
+        """
+        vault_path = os.path.abspath(os.path.expanduser(vault_path))
+        if os.path.commonpath([vault_path, self.path]) in (vault_path, self.path):
+            raise ConfigError("The git snapshot repository must be outside the vault")
+        message = message or f"Snapshot of {os.path.basename(vault_path)} at " \
+                             f"{datetime.now().isoformat(timespec='seconds')}"
+        with self._git_errors("snapshot"), \
+                self.repo.git.custom_environment(GIT_WORK_TREE=vault_path, **_AUTHOR):
+            self.repo.git.add("--all", "--", ".")
+            status, _, _ = self.repo.git.diff("--cached", "--quiet", with_extended_output=True,
+                                              with_exceptions=False)
+            if self.repo.head.is_valid() and status == 0:
+                logger.info(f"No changes in {vault_path} since the last git snapshot")
+                return None
+            self.repo.git.commit("--quiet", "--no-verify", "-m", message)
+        commit = self.repo.head.commit.hexsha
+        logger.info(f"Git snapshot {commit[:12]} of {vault_path}")
+        count = int(self.repo.config_reader().get_value(_SECTION, "snapshotssincegc", default=0)) + 1
+        if count >= GC_EVERY:
+            self.gc()
+            count = 0
+        with self.repo.config_writer() as config:
+            config.set_value(_SECTION, "snapshotssincegc", count)
+            config.set_value(_SECTION, "root", os.path.basename(vault_path))
+        return commit
+
+    def gc(self):
+        """Repack all objects into one delta-compressed pack and prune loose objects."""
+        with self._git_errors("gc"):
+            self.repo.git.gc("--quiet", "--prune=now")
+        logger.info(f"Repacked git snapshot repository {self.path}")
+
+    def snapshots(self) -> List[str]:
+        """Commit ids of all snapshots, newest first."""
+        if not self.repo.head.is_valid():
+            return []
+        return [commit.hexsha for commit in self.repo.iter_commits(BRANCH)]
+
+    def restore(self, target_dir: str, commit: Optional[str] = None, root: Optional[str] = None) -> str:
+        """Extract snapshot ``commit`` (default: latest) into ``target_dir/<root>``."""
+        commit = commit or BRANCH
+        root = root or self.repo.config_reader().get_value(_SECTION, "root", default="vault")
+        os.makedirs(target_dir, exist_ok=True)
+        with self._git_errors("restore"):
+            process = self.repo.git.archive(commit, format="tar", prefix=f"{root}/", as_process=True)
+            try:
+                with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                    TarStreamExtractor(target_dir).extract(tar)
+            finally:
+                process.wait()
+        return os.path.join(target_dir, root)
+
+    def export_bundle(self, output_path: str, password: str) -> str:
+        """Write the whole repository as a git bundle encrypted with ``password``."""
+        if not password:
+            raise EncryptionError("Encryption password required")
+        if not self.repo.head.is_valid():
+            raise ArchiveError("Git snapshot repository has no snapshots to export")
+        crypto = CryptoVault(password)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=".part",
+                                        dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            with self._git_errors("bundle"), os.fdopen(fd, "wb") as out:
+                process = self.repo.git.bundle("create", "-", "--all", as_process=True)
+                try:
+                    with crypto.writer(out, metadata={"type": "git-bundle"}) as writer:
+                        shutil.copyfileobj(process.stdout, writer, SEGMENT_SIZE)
+                finally:
+                    process.wait()
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        logger.info(f"Encrypted git bundle exported to {output_path}")
+        return output_path
+
+    @classmethod
+    def import_bundle(cls, bundle_path: str, password: str, path: str) -> "GitSnapshotRepository":
+        """Recreate a repository at ``path`` from an encrypted bundle."""
+        git = _gitpython()
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.exists(path) and os.listdir(path):
+            raise ArchiveError(f"Target directory is not empty: {path}")
+        fd, plain = tempfile.mkstemp(prefix=".import.", suffix=".bundle", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            CryptoVault(password).decrypt_file(bundle_path, plain)
+            git.Repo.clone_from(plain, path, bare=True, mirror=True)
+        except git.exc.GitCommandError as e:
+            raise ArchiveError(f"Git bundle import failed: {e.stderr.strip() or str(e)}")
+        finally:
+            if os.path.exists(plain):
+                os.unlink(plain)
+        repository = cls(path)
+        with repository.repo.config_writer() as config:
+            for key, value in _REPO_CONFIG.items():
+                config.set_value(*key.split("."), value)
+        return repository
@@ -0,0 +1,164 @@
+import os
+import re
+import logging
+from typing import Iterable, List, NamedTuple, Optional, Pattern, Tuple
+from .exceptions import ConfigError
+
+logger = logging.getLogger(__name__)
+
+IGNORE_FILE = ".obsidianbackupignore"
+# UI state rewritten on every click, deleted notes, and tool directories.
+DEFAULT_EXCLUDES = (
+    ".obsidian/workspace.json",
+    ".obsidian/workspace-mobile.json",
+    ".trash/",
+    ".git/",
+    "node_modules/",
+    ".DS_Store",
+)
+
+
+class SkipStats(NamedTuple):
+    dirs: int = 0
+    files: int = 0
+    bytes: int = 0
+
+    def format(self) -> str:
+        return f"skipped {self.dirs} directories and {self.files} files ({self.bytes / 1e6:.1f} MB)"
+
+
+def _translate(pattern: str) -> str:
+    """Regex body for a gitignore glob (already stripped of ``!``, ``/`` anchors and dir markers)."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                out.append(re.escape("["))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def _parse(line: str) -> Optional[Tuple[str, bool, bool]]:
+    """(regex, negated, directories only) for one gitignore line, or None for blanks and comments."""
+    line = line.rstrip("\n\r")
+    if not line.strip() or line.startswith("#"):
+        return None
+    if not line.endswith("\\ "):
+        line = line.rstrip()
+    negated = line.startswith("!")
+    if negated or line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    body = _translate(line.lstrip("/"))
+    return (body if anchored else "(?:.*/)?" + body), negated, dir_only
+
+
+class IgnoreRules:
+    """gitignore-style exclusion rules compiled into a few regexes.
+
+    Paths are vault-relative with ``/`` separators. As in gitignore, the
+    last matching pattern wins, ``!pattern`` re-includes, a trailing ``/``
+    only matches directories, and a pattern containing ``/`` is anchored at
+    the vault root. Consecutive patterns with the same flags share one
+    alternation regex, so a path is usually decided by one or two
+    ``fullmatch`` calls. Files below an excluded directory are never
+    visited, so they cannot be re-included.
+    """
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.patterns: List[str] = []
+        self._groups: List[Tuple[Pattern, bool, bool]] = []
+        pending: List[str] = []
+        flags = None
+        for pattern in patterns:
+            parsed = _parse(pattern)
+            if parsed is None:
+                continue
+            self.patterns.append(pattern.strip())
+            body, negated, dir_only = parsed
+            if (negated, dir_only) != flags and pending:
+                self._groups.append(self._compile(pending, *flags))
+                pending = []
+            flags = (negated, dir_only)
+            pending.append(body)
+        if pending:
+            self._groups.append(self._compile(pending, *flags))
+        # Checked newest first: the last matching pattern decides.
+        self._groups.reverse()
+
+    @staticmethod
+    def _compile(bodies: List[str], negated: bool, dir_only: bool) -> Tuple[Pattern, bool, bool]:
+        try:
+            return re.compile("|".join(f"(?:{body})" for body in bodies)), negated, dir_only
+        except re.error as e:
+            raise ConfigError(f"Invalid exclude pattern: {str(e)}")
+
+    @classmethod
+    def for_vault(cls, vault_path: str, exclude: Iterable[str] = (), include: Iterable[str] = (),
+                  defaults: bool = True) -> "IgnoreRules":
+        """Defaults, then the vault's ``.obsidianbackupignore``, then ``exclude`` and ``include`` (as ``!``)."""
+        patterns = list(DEFAULT_EXCLUDES) if defaults else []
+        ignore_file = os.path.join(vault_path, IGNORE_FILE)
+        if os.path.isfile(ignore_file):
+            try:
+                with open(ignore_file, encoding="utf-8") as f:
+                    patterns.extend(f.read().splitlines())
+            except (OSError, UnicodeDecodeError) as e:
+                raise ConfigError(f"Cannot read {ignore_file}: {str(e)}")
+            logger.debug(f"Loaded exclusion rules from {ignore_file}")
+        patterns.extend(exclude)
+        patterns.extend(f"!{pattern}" for pattern in include)
+        return cls(patterns)
+
+    def __bool__(self) -> bool:
+        return bool(self._groups)
+
+    def ignored(self, path: str, is_dir: bool = False) -> bool:
+        """Whether ``path`` itself matches; a walk never asks about paths below an ignored directory."""
+        for regex, negated, dir_only in self._groups:
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path):
+                return not negated
+        return False
+
+    def ignored_with_parents(self, path: str, is_dir: bool = False) -> bool:
+        """Whether ``path`` or any directory above it is ignored, for paths not found by a walk."""
+        parts = path.split("/")
+        for depth in range(1, len(parts)):
+            if self.ignored("/".join(parts[:depth]), is_dir=True):
+                return True
+        return self.ignored(path, is_dir)
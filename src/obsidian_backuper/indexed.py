@@ -0,0 +1,329 @@
+import os
+import json
+import stat
+import struct
+import fnmatch
+import logging
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+from cryptography.exceptions import InvalidTag
+from .exceptions import ArchiveError, ConfigError, EncryptionError
+from .crypto import CryptoVault, NONCE_PREFIX_SIZE, rekey_key_area
+from .profiling import span
+from . import compression
+
+logger = logging.getLogger(__name__)
+
+# Indexed archive layout:
+#   MAGIC | version (u8) | header length (u16) | JSON header (KDF, codec, nonce prefix)
+#   key area (version 3)            data key wrapped for each recipient
+#   block 0 | block 1 | ...         independently compressed + AES-GCM encrypted
+#   index                           encrypted, compressed JSON table of contents
+#   footer                          index offset (u64) | index length (u64) | FOOTER_MAGIC
+# The table of contents maps every path to (block, offset, length) extents,
+# so restoring a few notes only reads the footer, the index and their blocks.
+# Version 2 archives also hold an encrypted zstd dictionary (located by the
+# index) and compress note blocks with it, in smaller blocks.
+# Version 3 archives use envelope encryption (see crypto): the header holds no
+# KDF, blocks are encrypted with a random data key stored in the key area.
+MAGIC = b"OBKIDX"
+FOOTER_MAGIC = b"OBKIDXND"
+FORMAT_VERSION = 1
+DICTIONARY_FORMAT_VERSION = 2
+ENVELOPE_FORMAT_VERSION = 3
+EXTENSION = ".obk"
+BLOCK_SIZE = 1024 * 1024
+DICT_BLOCK_SIZE = 64 * 1024
+INDEX_CODEC = "gzip"
+# Block codec of zstd blocks compressed with the archive's dictionary.
+DICT_CODEC = "zstd+dict"
+
+_PREFIX = struct.Struct(">6sBH")
+_FOOTER = struct.Struct(">QQ8s")
+_NONCE_SUFFIX = struct.Struct(">IB")
+_DATA_BLOCK = 0
+_INDEX_BLOCK = 1
+_DICT_BLOCK = 2
+
+
+def _nonce(prefix: bytes, index: int, kind: int) -> bytes:
+    return prefix + _NONCE_SUFFIX.pack(index, kind)
+
+
+def match_paths(path: str, patterns: Optional[Iterable[str]]) -> bool:
+    """True if ``path`` (relative to the vault root) matches any glob in ``patterns``."""
+    if not patterns:
+        return True
+    return any(fnmatch.fnmatchcase(path, pattern) for pattern in patterns)
+
+
+def _read_header(f: BinaryIO, path: str):
+    """(version, raw header, parsed metadata) of the indexed archive ``f``, left positioned after the header."""
+    prefix = f.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size or not prefix.startswith(MAGIC):
+        raise ArchiveError(f"Not an indexed backup archive: {path}")
+    _, version, meta_len = _PREFIX.unpack(prefix)
+    if version not in (FORMAT_VERSION, DICTIONARY_FORMAT_VERSION, ENVELOPE_FORMAT_VERSION):
+        raise ArchiveError(f"Unsupported indexed archive version: {version}")
+    meta_raw = f.read(meta_len)
+    try:
+        meta = json.loads(meta_raw)
+    except ValueError:
+        raise ArchiveError("Corrupted indexed archive header")
+    if not isinstance(meta, dict):
+        raise ArchiveError("Corrupted indexed archive header")
+    return version, prefix + meta_raw, meta
+
+
+def rekey_archive(path: str, crypto: CryptoVault, new_crypto: CryptoVault, keep_existing: bool = False):
+    """Re-wrap the data key of an indexed archive in place (see :func:`crypto.rekey_key_area`)."""
+    try:
+        with open(path, "r+b") as f:
+            version, header, _ = _read_header(f, path)
+            if version < ENVELOPE_FORMAT_VERSION:
+                raise ArchiveError(f"{path} predates envelope encryption; back up again to change its keys")
+            rekey_key_area(f, header, crypto, new_crypto, keep_existing, backup_path=path + ".keyheader.bak")
+    except OSError as e:
+        raise ArchiveError(f"Rekey failed: {str(e)}")
+
+
+class IndexedArchiveWriter:
+    """Write a vault as blocks of packed file data plus an encrypted index.
+
+    With a zstd ``dictionary`` (from :func:`compression.train_dictionary`),
+    compressed blocks shrink to ``DICT_BLOCK_SIZE``, so restoring one note
+    decompresses less without losing ratio.
+    """
+
+    def __init__(self, out: BinaryIO, crypto: CryptoVault, root: str,
+                 codec: str = compression.DEFAULT_CODEC, block_size: int = BLOCK_SIZE,
+                 dictionary: Optional[bytes] = None):
+        self._out = out
+        self._root = root
+        self._codec = compression.validate_codec(codec)
+        if dictionary is not None and codec != "zstd":
+            raise ConfigError("A compression dictionary requires the zstd codec")
+        self._dictionary = dictionary
+        self._block_size = block_size
+        self._compressed_block_size = min(block_size, DICT_BLOCK_SIZE) if dictionary else block_size
+        self._nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+        meta = json.dumps({
+            "cipher": crypto.cipher,
+            "codec": codec,
+            "nonce_prefix": self._nonce_prefix.hex(),
+        }, separators=(",", ":")).encode()
+        self._header = _PREFIX.pack(MAGIC, ENVELOPE_FORMAT_VERSION, len(meta)) + meta
+        data_key, key_area = crypto.new_key_area(self._header)
+        self._aead = crypto.aead(data_key)
+        self._offset = 0
+        # Compressed and stored data are packed into separate blocks; extents
+        # get their block number when the block is flushed.
+        self._buffers: Dict[str, bytearray] = {}
+        self._pending: Dict[str, List[list]] = {}
+        self._blocks: List[list] = []
+        self._entries: List[dict] = []
+        self._write(self._header + key_area)
+        self._dictionary_extent = None
+        if dictionary:
+            sealed = self._seal(dictionary, 0, _DICT_BLOCK, "none")
+            self._dictionary_extent = [self._offset, len(sealed)]
+            self._write(sealed)
+
+    def _write(self, data: bytes):
+        self._out.write(data)
+        self._offset += len(data)
+
+    def _seal(self, plaintext: bytes, index: int, kind: int, codec: str) -> bytes:
+        nonce = _nonce(self._nonce_prefix, index, kind)
+        if codec == DICT_CODEC:
+            compressed = compression.compress_block(plaintext, "zstd", dictionary=self._dictionary)
+        else:
+            compressed = compression.compress_block(plaintext, codec)
+        with span("encrypt", bytes=len(compressed)):
+            return self._aead.encrypt(nonce, compressed, self._header)
+
+    def _flush_block(self, codec: str):
+        buffer = self._buffers.get(codec)
+        if not buffer:
+            return
+        index = len(self._blocks)
+        block_codec = DICT_CODEC if self._dictionary and codec == self._codec else codec
+        sealed = self._seal(bytes(buffer), index, _DATA_BLOCK, block_codec)
+        self._blocks.append([self._offset, len(sealed), block_codec])
+        self._write(sealed)
+        for extent in self._pending.pop(codec):
+            extent[0] = index
+        buffer.clear()
+
+    def _entry(self, rel: str, st: os.stat_result, kind: str) -> dict:
+        entry = {"path": rel, "type": kind, "mode": stat.S_IMODE(st.st_mode), "mtime_ns": st.st_mtime_ns}
+        self._entries.append(entry)
+        return entry
+
+    def add_directory(self, rel: str, st: os.stat_result):
+        self._entry(rel, st, "dir")
+
+    def add_symlink(self, rel: str, st: os.stat_result, target: str):
+        self._entry(rel, st, "link")["target"] = target
+
+    def add_file(self, rel: str, st: os.stat_result, f: BinaryIO, stored: bool = False):
+        """Pack ``f`` into data blocks; ``stored`` files go to uncompressed blocks."""
+        entry = self._entry(rel, st, "file")
+        codec = "none" if stored else self._codec
+        if stored:
+            entry["codec"] = codec
+        buffer = self._buffers.setdefault(codec, bytearray())
+        block_size = self._block_size if stored else self._compressed_block_size
+        extents = []
+        size = 0
+        while True:
+            data = f.read(block_size - len(buffer))
+            if not data:
+                break
+            extent = [None, len(buffer), len(data)]
+            extents.append(extent)
+            self._pending.setdefault(codec, []).append(extent)
+            buffer += data
+            size += len(data)
+            if len(buffer) >= block_size:
+                self._flush_block(codec)
+        entry["size"] = size
+        entry["extents"] = extents
+
+    def close(self):
+        for codec in sorted(self._buffers):
+            self._flush_block(codec)
+        index = {"root": self._root, "blocks": self._blocks, "entries": self._entries}
+        if self._dictionary_extent:
+            index["dictionary"] = self._dictionary_extent
+        index = json.dumps(index, separators=(",", ":")).encode()
+        sealed = self._seal(index, 0, _INDEX_BLOCK, INDEX_CODEC)
+        index_offset = self._offset
+        self._write(sealed)
+        self._write(_FOOTER.pack(index_offset, len(sealed), FOOTER_MAGIC))
+
+
+class IndexedArchiveReader:
+    """Random-access reader for archives written by :class:`IndexedArchiveWriter`."""
+
+    def __init__(self, path: str, crypto: CryptoVault):
+        self.path = path
+        self._cached_block = (None, b"")
+        self._dictionary: Optional[bytes] = None
+        self._f = open(path, "rb")
+        try:
+            self._read_header(crypto)
+            self._read_index()
+        except BaseException:
+            self._f.close()
+            raise
+
+    def __enter__(self) -> "IndexedArchiveReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._f.close()
+
+    def _read_header(self, crypto: CryptoVault):
+        version, self._header, meta = _read_header(self._f, self.path)
+        try:
+            self._nonce_prefix = bytes.fromhex(meta["nonce_prefix"])
+            self.codec = meta["codec"]
+            if version < ENVELOPE_FORMAT_VERSION:
+                key = crypto.key_for_header(meta["kdf"])
+        except (ValueError, KeyError, TypeError):
+            raise ArchiveError("Corrupted indexed archive header")
+        if version >= ENVELOPE_FORMAT_VERSION:
+            key = crypto.open_key_area(self._f, self._header)
+        self._aead = crypto.aead(key, meta.get("cipher"))
+
+    def _open(self, offset: int, length: int, index: int, kind: int, codec: str) -> bytes:
+        self._f.seek(offset)
+        sealed = self._f.read(length)
+        try:
+            with span("decrypt", bytes=len(sealed)):
+                data = self._aead.decrypt(_nonce(self._nonce_prefix, index, kind), sealed, self._header)
+        except InvalidTag:
+            raise EncryptionError("Invalid password or corrupted file")
+        if codec == DICT_CODEC:
+            if self._dictionary is None:
+                raise ArchiveError("Indexed archive is missing its compression dictionary")
+            return compression.decompress_block(data, "zstd", dictionary=self._dictionary)
+        return compression.decompress_block(data, codec)
+
+    def _read_index(self):
+        self._f.seek(0, os.SEEK_END)
+        size = self._f.tell()
+        if size < _FOOTER.size:
+            raise ArchiveError("Indexed archive is truncated")
+        self._f.seek(size - _FOOTER.size)
+        index_offset, index_len, footer_magic = _FOOTER.unpack(self._f.read(_FOOTER.size))
+        if footer_magic != FOOTER_MAGIC or index_offset + index_len > size - _FOOTER.size:
+            raise ArchiveError("Indexed archive is truncated or corrupted")
+        index = json.loads(self._open(index_offset, index_len, 0, _INDEX_BLOCK, INDEX_CODEC))
+        self.root = index["root"]
+        self.blocks = index["blocks"]
+        if "dictionary" in index:
+            offset, length = index["dictionary"]
+            self._dictionary = self._open(offset, length, 0, _DICT_BLOCK, "none")
+        self.entries: List[dict] = index["entries"]
+
+    def _block(self, index: int) -> bytes:
+        cached_index, data = self._cached_block
+        if cached_index != index:
+            offset, length, codec = self.blocks[index]
+            data = self._open(offset, length, index, _DATA_BLOCK, codec)
+            self._cached_block = (index, data)
+        return data
+
+    def authenticate(self) -> int:
+        """Decrypt and decompress every data block; returns the plaintext size."""
+        return sum(len(self._block(index)) for index in range(len(self.blocks)))
+
+    def find(self, patterns: Optional[Iterable[str]] = None) -> List[dict]:
+        return [entry for entry in self.entries if match_paths(entry["path"], patterns)]
+
+    def iter_file(self, entry: dict) -> Iterator[memoryview]:
+        """Contents of a file entry, one extent at a time, without copying the blocks."""
+        for block, start, length in entry["extents"]:
+            yield memoryview(self._block(block))[start:start + length]
+
+    def read_file(self, entry: dict) -> bytes:
+        return b"".join(self.iter_file(entry))
+
+    def extract(self, target_dir: str, patterns: Optional[Iterable[str]] = None) -> List[str]:
+        """Restore matching entries under ``target_dir/<root>``; returns restored paths."""
+        root = os.path.abspath(os.path.join(target_dir, self.root))
+        os.makedirs(root, exist_ok=True)
+        restored = []
+        dir_times: Dict[str, int] = {}
+        for entry in self.find(patterns):
+            path = os.path.normpath(os.path.join(root, *entry["path"].split("/")))
+            if os.path.commonpath([root, path]) != root or path == root:
+                raise ArchiveError(f"Unsafe path in archive: {entry['path']}")
+            if entry["type"] == "dir":
+                os.makedirs(path, exist_ok=True)
+                dir_times[path] = entry["mtime_ns"]
+                continue
+            parent = os.path.dirname(path)
+            os.makedirs(parent, exist_ok=True)
+            # Refuse to write through a symlink restored earlier in this run.
+            real_root = os.path.realpath(root)
+            if os.path.commonpath([real_root, os.path.realpath(parent)]) != real_root:
+                raise ArchiveError(f"Unsafe path in archive: {entry['path']}")
+            if os.path.lexists(path):
+                os.unlink(path)
+            if entry["type"] == "link":
+                os.symlink(entry["target"], path)
+            else:
+                with open(path, "wb") as f:
+                    for extent in self.iter_file(entry):
+                        f.write(extent)
+                os.chmod(path, entry["mode"] & 0o777)
+                os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            restored.append(path)
+        for path, mtime_ns in dir_times.items():
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return restored
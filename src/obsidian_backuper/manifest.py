@@ -0,0 +1,183 @@
+import os
+import json
+import stat
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from .exceptions import ArchiveError
+from .ignore import IgnoreRules, SkipStats
+from .progress import Progress
+from .scanner import scan_tree
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+HASH_NAME = "blake2b"
+
+
+class FileEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    digest: Optional[str] = None
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+
+def manifest_path_for(archive_path: str) -> str:
+    """Return the sidecar manifest path for ``archive_path``."""
+    name = archive_path
+    encrypted = name.endswith(".enc") or name.endswith(".obk")
+    if name.endswith(".enc"):
+        name = name[:-len(".enc")]
+    for ext in (".tar.gz", ".tar.zst", ".tar", ".obk"):
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+            break
+    return name + MANIFEST_SUFFIX + (".enc" if encrypted else "")
+
+
+class Manifest:
+    """Listing of a vault's files (path, size, mtime, content hash) at backup time.
+
+    Paths are relative to the vault root and use ``/`` as separator. An
+    incremental manifest also names its parent archive and lists the paths
+    deleted since that parent (tombstones).
+    """
+
+    def __init__(self, root: str, vault: Optional[str] = None,
+                 files: Optional[Dict[str, FileEntry]] = None, dirs: Optional[Set[str]] = None,
+                 kind: str = "full", parent: Optional[str] = None,
+                 deleted: Optional[List[str]] = None, archive: Optional[str] = None,
+                 created_at: Optional[str] = None):
+        self.root = root
+        self.vault = vault
+        self.files = files if files is not None else {}
+        self.dirs = dirs if dirs is not None else set()
+        self.kind = kind
+        self.parent = parent
+        self.deleted = deleted if deleted is not None else []
+        self.archive = archive
+        self.created_at = created_at or datetime.now().isoformat(timespec="seconds")
+        # What the exclusion rules left out of this scan, and the lstat
+        # results of the paths scanned; not stored.
+        self.skipped = SkipStats()
+        self.stats: Dict[str, os.stat_result] = {}
+
+    @classmethod
+    def scan(cls, vault_path: str, progress: Optional[Progress] = None,
+             ignore: Optional[IgnoreRules] = None) -> "Manifest":
+        """Stat-only walk of ``vault_path``; digests are filled in while archiving.
+
+        Paths matching ``ignore`` are left out, and ignored directories are
+        not descended into; what was left out is counted in ``skipped``.
+        """
+        vault_path = os.path.abspath(vault_path)
+        manifest = cls(root=os.path.basename(vault_path), vault=vault_path)
+        manifest._add_tree("", progress, ignore)
+        return manifest
+
+    def _add_tree(self, rel: str, progress: Optional[Progress] = None,
+                  ignore: Optional[IgnoreRules] = None):
+        """Record ``rel`` (a directory under the vault) and everything below it."""
+        result = scan_tree(self.vault, rel, ignore, progress)
+        self.dirs.update(result.dirs)
+        for path, st in result.files.items():
+            self.files[path] = FileEntry(st.st_size, st.st_mtime_ns)
+        self.stats.update(result.dirs)
+        self.stats.update(result.files)
+        self.skipped = SkipStats(*(total + new for total, new in zip(self.skipped, result.skipped)))
+
+    def _remove_tree(self, rel: str):
+        self.files.pop(rel, None)
+        if rel in self.dirs:
+            prefix = rel + "/"
+            self.dirs = {path for path in self.dirs if path != rel and not path.startswith(prefix)}
+            for path in [path for path in self.files if path.startswith(prefix)]:
+                del self.files[path]
+
+    @classmethod
+    def rescan(cls, previous: "Manifest", paths: Iterable[str],
+               ignore: Optional[IgnoreRules] = None) -> "Manifest":
+        """Copy of ``previous`` with only ``paths`` (and directories below them) re-read from disk.
+
+        Used when the changed paths are already known, e.g. from file
+        system events, to avoid walking the whole vault.
+        """
+        manifest = cls(root=previous.root, vault=previous.vault,
+                       files=dict(previous.files), dirs=set(previous.dirs))
+        for rel in sorted(set(paths)):
+            manifest._remove_tree(rel)
+            try:
+                st = os.lstat(os.path.join(manifest.vault, *rel.split("/")))
+            except FileNotFoundError:
+                continue
+            is_dir = stat.S_ISDIR(st.st_mode)
+            if ignore and ignore.ignored_with_parents(rel, is_dir):
+                continue
+            if is_dir:
+                manifest._add_tree(rel, ignore=ignore)
+            else:
+                manifest.files[rel] = FileEntry(st.st_size, st.st_mtime_ns)
+                manifest.stats[rel] = st
+            parent = rel.rpartition("/")[0]
+            while parent and parent not in manifest.dirs:
+                manifest.dirs.add(parent)
+                parent = parent.rpartition("/")[0]
+        return manifest
+
+    def diff(self, previous: "Manifest") -> Tuple[List[str], List[str]]:
+        """Compare against ``previous`` by size and mtime only.
+
+        Returns the sorted paths (files and new directories) that must be
+        archived and the sorted paths deleted since ``previous``. Digests of
+        unchanged files are carried over from ``previous``.
+        """
+        changed = []
+        for path, entry in self.files.items():
+            old = previous.files.get(path)
+            if old is not None and old.size == entry.size and old.mtime_ns == entry.mtime_ns:
+                self.files[path] = old
+            else:
+                changed.append(path)
+        changed.extend(self.dirs - previous.dirs)
+        deleted = (set(previous.files) - set(self.files)) | (previous.dirs - self.dirs)
+        return sorted(changed), sorted(deleted)
+
+    def all_paths(self) -> List[str]:
+        return sorted(set(self.files) | self.dirs)
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({
+            "version": MANIFEST_VERSION,
+            "hash": HASH_NAME,
+            "root": self.root,
+            "vault": self.vault,
+            "kind": self.kind,
+            "parent": self.parent,
+            "archive": self.archive,
+            "created_at": self.created_at,
+            "dirs": sorted(self.dirs),
+            "files": {path: list(entry) for path, entry in sorted(self.files.items())},
+            "deleted": self.deleted,
+        }, separators=(",", ":")).encode()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Manifest":
+        try:
+            raw = json.loads(data)
+            if raw.get("version") != MANIFEST_VERSION:
+                raise ArchiveError(f"Unsupported manifest version: {raw.get('version')}")
+            return cls(
+                root=raw["root"],
+                vault=raw.get("vault"),
+                files={path: FileEntry(*entry) for path, entry in raw["files"].items()},
+                dirs=set(raw["dirs"]),
+                kind=raw["kind"],
+                parent=raw.get("parent"),
+                deleted=list(raw.get("deleted", [])),
+                archive=raw.get("archive"),
+                created_at=raw.get("created_at"),
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            raise ArchiveError(f"Corrupted backup manifest: {str(e)}")
@@ -1,10 +1,12 @@
 import os
-from typing import Optional
+from typing import Iterable, Optional
 from .exceptions import (
     ArchiveError,
-    DecryptionError
+    DecryptionError,
+    OperationCancelled
 )
 from .crypto import CryptoVault
+from .progress import ProgressCallback
 
 
 class ObsidianDecryptor:
@@ -21,7 +23,8 @@ class ObsidianDecryptor:
             raise ArchiveError("File must have .enc extension for decryption")
         return expanded_path
 
-    def decrypt(self, password: str, output_dir: Optional[str] = None) -> str:
+    def decrypt(self, password: Optional[str], output_dir: Optional[str] = None,
+                progress: Optional[ProgressCallback] = None, keyfiles: Iterable[str] = ()) -> str:
         try:
             if output_dir is None:
                 output_dir = os.path.dirname(os.path.abspath(self.encrypted_file_path))
@@ -29,9 +32,11 @@ class ObsidianDecryptor:
             decrypted_name = os.path.basename(self.encrypted_file_path).replace('.enc', '')
             final_path = os.path.join(output_dir, decrypted_name)
 
-            crypto = CryptoVault(password)
-            crypto.decrypt_file(self.encrypted_file_path, final_path)
+            crypto = CryptoVault(password, keyfiles=keyfiles)
+            crypto.decrypt_file(self.encrypted_file_path, final_path, progress=progress)
 
             return final_path
+        except OperationCancelled:
+            raise
         except Exception as e:
             raise DecryptionError(f"Decryption failed: {str(e)}")
\ No newline at end of file
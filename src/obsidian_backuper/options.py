@@ -0,0 +1,18 @@
+# Choices and defaults of the command-line options. The CLI builds its parser
+# from this module alone, before it knows which of the heavier modules the
+# command needs, so keep it free of imports.
+ARCHIVE_FORMATS = ("tar", "indexed")
+
+CODECS = ("gzip", "zstd", "none")
+DEFAULT_CODEC = "gzip"
+
+# Suites of crypto.CIPHERS; "auto" picks the faster one on this CPU.
+CIPHER_NAMES = ("aes-256-gcm", "chacha20-poly1305")
+AUTO_CIPHER = "auto"
+
+# Each verify level includes the ones before it.
+VERIFY_LEVELS = ("auth", "decompress", "tar", "manifest")
+DEFAULT_VERIFY_LEVEL = "manifest"
+
+# Seconds without edits before watch mode takes a snapshot.
+DEFAULT_DEBOUNCE = 5.0
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+REPORT_VERSION = 1
+
+# The profiler collecting spans, or None. Only profile() sets it, so with
+# profiling off span() is a global lookup returning a shared no-op object.
+_profiler: Optional["Profiler"] = None
+
+
+class SpanStats(NamedTuple):
+    """Totals of all spans with one name.
+
+    Spans on worker threads (read, compress, encrypt, decrypt) overlap, so
+    their ``wall_s`` is busy time summed over threads and may exceed the
+    elapsed time. ``cpu_s`` is the CPU time of the threads running the
+    span: pool work started by a span is counted in the pool's spans.
+    """
+    name: str
+    parent: Optional[str]
+    depth: int
+    calls: int
+    wall_s: float
+    cpu_s: float
+    bytes: int
+    files: int
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second of busy time."""
+        return self.bytes / self.wall_s if self.wall_s > 0 else 0.0
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, bytes: int = 0, files: int = 0):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_profiler", "name", "bytes", "files", "_wall", "_cpu")
+
+    def __init__(self, profiler: "Profiler", name: str, bytes: int, files: int):
+        self._profiler = profiler
+        self.name = name
+        self.bytes = bytes
+        self.files = files
+
+    def __enter__(self) -> "_Span":
+        self._profiler._push(self.name)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        self._profiler._record(self.name, wall, cpu, self.bytes, self.files)
+        return False
+
+    def add(self, bytes: int = 0, files: int = 0):
+        """Count bytes and files processed inside the span."""
+        self.bytes += bytes
+        self.files += files
+
+
+class Profiler:
+    """Wall time, CPU time, bytes and files per named phase, from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats: Dict[str, list] = {}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+
+    def _push(self, name: str):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        with self._lock:
+            if name not in self._stats:
+                # Listed under the span it first ran in on this thread.
+                parent = stack[-1] if stack else None
+                depth = self._stats[parent][1] + 1 if parent else 0
+                self._stats[name] = [parent, depth, 0, 0.0, 0.0, 0, 0]
+        stack.append(name)
+
+    def _record(self, name: str, wall: float, cpu: float, size: int, files: int):
+        self._local.stack.pop()
+        with self._lock:
+            entry = self._stats[name]
+            entry[2] += 1
+            entry[3] += wall
+            entry[4] += cpu
+            entry[5] += size
+            entry[6] += files
+
+    def stop(self):
+        self.wall_s = time.perf_counter() - self._wall
+        self.cpu_s = time.process_time() - self._cpu
+
+    def spans(self) -> List[SpanStats]:
+        """Stats per span name, each parent followed by its children, in order of first use."""
+        with self._lock:
+            stats = [SpanStats(name, *entry) for name, entry in self._stats.items()]
+        ordered = []
+
+        def add_children(parent: Optional[str]):
+            for span in stats:
+                if span.parent == parent:
+                    ordered.append(span)
+                    add_children(span.name)
+
+        add_children(None)
+        return ordered
+
+    def report(self) -> dict:
+        """JSON-serializable report, as written by :func:`profile`."""
+        return {
+            "version": REPORT_VERSION,
+            "wall_s": self.wall_s,
+            "cpu_s": self.cpu_s,
+            "spans": [{**span._asdict(), "throughput_bytes_s": span.throughput} for span in self.spans()],
+        }
+
+    def format(self) -> str:
+        """Table of the spans, nested spans indented under their parent."""
+        lines = [f"{'phase':<24}{'calls':>7}{'wall s':>10}{'cpu s':>10}{'MB':>10}{'MB/s':>9}{'files':>8}"]
+        for span in self.spans():
+            name = "  " * span.depth + span.name
+            lines.append(f"{name:<24}{span.calls:>7}{span.wall_s:>10.3f}{span.cpu_s:>10.3f}"
+                         f"{span.bytes / 1e6:>10.1f}{span.throughput / 1e6:>9.1f}{span.files:>8}")
+        lines.append(f"{'total':<24}{'':>7}{self.wall_s:>10.3f}{self.cpu_s:>10.3f}")
+        return "\n".join(lines)
+
+
+def span(name: str, bytes: int = 0, files: int = 0):
+    """Context manager timing one occurrence of phase ``name`` while a profile is active.
+
+    ``bytes`` and ``files`` (or later calls to the span's ``add``) are
+    summed per name. Without an active profile this returns a shared no-op.
+    """
+    profiler = _profiler
+    if profiler is None:
+        return _NULL_SPAN
+    return _Span(profiler, name, bytes, files)
+
+
+@contextmanager
+def profile(json_path: Optional[str] = None, cprofile_path: Optional[str] = None) -> Iterator[Profiler]:
+    """Collect spans from all threads until the block exits.
+
+    On exit the report is written to ``json_path`` and, with
+    ``cprofile_path``, a cProfile dump of the calling thread (readable with
+    ``pstats`` or snakeviz) is written there.
+    """
+    global _profiler
+    if _profiler is not None:
+        raise RuntimeError("A profile is already active")
+    profiler = Profiler()
+    cprofiler = None
+    if cprofile_path:
+        import cProfile
+        cprofiler = cProfile.Profile()
+    _profiler = profiler
+    try:
+        if cprofiler is not None:
+            cprofiler.enable()
+        try:
+            yield profiler
+        finally:
+            if cprofiler is not None:
+                cprofiler.disable()
+    finally:
+        _profiler = None
+        profiler.stop()
+        if cprofiler is not None:
+            cprofiler.dump_stats(cprofile_path)
+        if json_path:
+            tmp_path = f"{json_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(profiler.report(), f, indent=2)
+            os.replace(tmp_path, json_path)
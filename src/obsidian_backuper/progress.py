@@ -0,0 +1,176 @@
+import io
+import time
+from typing import BinaryIO, Callable, NamedTuple, Optional
+
+# Minimum delay between two callback invocations.
+DEFAULT_INTERVAL = 0.1
+
+
+class ProgressEvent(NamedTuple):
+    """Snapshot of an operation's counters, passed to progress callbacks.
+
+    ``bytes_read`` counts input consumed (vault file data for backups,
+    ciphertext for decryption) and is what ``bytes_total``, throughput and
+    ETA refer to. ``bytes_compressed`` and ``bytes_encrypted`` count output
+    leaving the compressor and the cipher.
+    """
+    phase: str
+    files_scanned: int
+    files_done: int
+    files_total: int
+    bytes_read: int
+    bytes_total: int
+    bytes_compressed: int
+    bytes_encrypted: int
+    elapsed: float
+    finished: bool = False
+
+    @property
+    def throughput(self) -> float:
+        """Bytes read per second."""
+        return self.bytes_read / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Estimated seconds left, or None while unknown."""
+        if self.finished:
+            return 0.0
+        if not self.bytes_total or not self.bytes_read:
+            return None
+        return max(self.bytes_total - self.bytes_read, 0) / self.throughput
+
+    @property
+    def fraction(self) -> float:
+        if self.finished:
+            return 1.0
+        return min(self.bytes_read / self.bytes_total, 1.0) if self.bytes_total else 0.0
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+def format_progress(event: ProgressEvent) -> str:
+    """One-line human readable summary of ``event``."""
+    if event.phase == "scan":
+        return f"Scanning: {event.files_scanned} files"
+    parts = [f"{event.phase.capitalize()}: {event.fraction:6.1%}"]
+    if event.files_total:
+        parts.append(f"{event.files_done}/{event.files_total} files")
+    parts.append(f"{_format_bytes(event.bytes_read)}/{_format_bytes(event.bytes_total)}")
+    parts.append(f"{_format_bytes(event.throughput)}/s")
+    eta = event.eta
+    parts.append(f"ETA {eta:.0f}s" if eta is not None else "ETA --")
+    return " | ".join(parts)
+
+
+class Progress:
+    """Counters for one operation with a throttled callback.
+
+    The counters are plain integer additions; the callback is only invoked
+    when at least ``interval`` seconds have passed since the previous call,
+    and never when no callback is set. A callback may raise
+    :class:`OperationCancelled` to stop the operation; the partial output is
+    then removed as for any other failure.
+    """
+
+    def __init__(self, callback: Optional[ProgressCallback] = None, interval: float = DEFAULT_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.phase = "scan"
+        self.files_scanned = 0
+        self.files_done = 0
+        self.files_total = 0
+        self.bytes_read = 0
+        self.bytes_total = 0
+        self.bytes_compressed = 0
+        self.bytes_encrypted = 0
+        self._started = time.monotonic()
+        self._next_emit = 0.0
+
+    def start(self, phase: str, bytes_total: int = 0, files_total: int = 0):
+        """Begin a phase; throughput and ETA are measured from here."""
+        self.phase = phase
+        self.bytes_total = bytes_total
+        self.files_total = files_total
+        self._started = time.monotonic()
+        self.emit(force=True)
+
+    def add(self, read: int = 0, compressed: int = 0, encrypted: int = 0,
+            files: int = 0, scanned: int = 0):
+        self.bytes_read += read
+        self.bytes_compressed += compressed
+        self.bytes_encrypted += encrypted
+        self.files_done += files
+        self.files_scanned += scanned
+        if self.callback is not None:
+            self.emit()
+
+    def finish(self):
+        self.emit(force=True, finished=True)
+
+    def snapshot(self, finished: bool = False) -> ProgressEvent:
+        return ProgressEvent(
+            self.phase, self.files_scanned, self.files_done, self.files_total,
+            self.bytes_read, self.bytes_total, self.bytes_compressed, self.bytes_encrypted,
+            time.monotonic() - self._started, finished,
+        )
+
+    def emit(self, force: bool = False, finished: bool = False):
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_emit:
+            return
+        self._next_emit = now + self.interval
+        self.callback(self.snapshot(finished))
+
+
+class CountingReader(io.RawIOBase):
+    """Pass reads through from ``src`` (without closing it), counting bytes into ``progress``."""
+
+    def __init__(self, src: BinaryIO, progress: Progress, counter: str = "read"):
+        self._src = src
+        self._progress = progress
+        self._counter = counter
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._src.read(size)
+        self._progress.add(**{self._counter: len(data)})
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class CountingWriter(io.RawIOBase):
+    """Pass writes through to ``dst`` (without closing it), counting bytes into ``progress``."""
+
+    def __init__(self, dst: BinaryIO, progress: Progress, counter: str):
+        self._dst = dst
+        self._progress = progress
+        self._counter = counter
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._dst.write(data)
+        size = len(data)
+        self._progress.add(**{self._counter: size})
+        return size
+
+    def flush(self):
+        if not self.closed:
+            self._dst.flush()
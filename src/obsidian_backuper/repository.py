@@ -0,0 +1,347 @@
+import os
+import hmac
+import json
+import stat
+import zlib
+import base64
+import hashlib
+import logging
+import secrets
+import tempfile
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from .exceptions import ArchiveError, EncryptionError
+from .crypto import SALT_SIZE, derive_key, kdf_params
+from .ignore import IgnoreRules
+from .scanner import scan_tree
+
+logger = logging.getLogger(__name__)
+
+REPO_VERSION = 1
+CONFIG_NAME = "config"
+CHUNKS_DIR = "chunks"
+SNAPSHOTS_DIR = "snapshots"
+KEY_CHECK = b"obsidian_backuper repository"
+
+# Content-defined chunking: cut candidates are the positions following an
+# ANCHOR byte; a candidate becomes a boundary when the CRC-32 of the WINDOW
+# bytes before it matches BOUNDARY_MASK. Both searches run in C (bytes.find,
+# zlib.crc32), so chunking is not limited by the interpreter, and boundaries
+# depend only on local content, so an insertion only changes nearby chunks.
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+ANCHOR = b"\n"
+WINDOW = 64
+BOUNDARY_MASK = (1 << 12) - 1
+
+NONCE_SIZE = 12
+RAW = b"\x00"
+ZLIB = b"\x01"
+ZLIB_LEVEL = 6
+
+
+def find_boundary(data, min_size: int = MIN_CHUNK_SIZE, max_size: int = MAX_CHUNK_SIZE) -> int:
+    """Return the length of the first chunk of ``data``."""
+    end = min(len(data), max_size)
+    if end <= min_size:
+        return end
+    view = memoryview(data)
+    pos = data.find(ANCHOR, min_size - 1, end - 1)
+    while pos != -1:
+        cut = pos + 1
+        if zlib.crc32(view[cut - WINDOW:cut]) & BOUNDARY_MASK == 0:
+            return cut
+        pos = data.find(ANCHOR, cut, end - 1)
+    return end
+
+
+def iter_chunks(f: BinaryIO, min_size: int = MIN_CHUNK_SIZE,
+                max_size: int = MAX_CHUNK_SIZE) -> Iterator[bytes]:
+    """Split the stream ``f`` into content-defined chunks."""
+    buffer = b""
+    eof = False
+    while True:
+        if not eof and len(buffer) < max_size:
+            data = f.read(max_size * 2 - len(buffer))
+            eof = not data
+            buffer += data
+            continue
+        if not buffer:
+            return
+        cut = find_boundary(buffer, min_size, max_size)
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+
+class Repository:
+    """Deduplicating snapshot store.
+
+    Files are split into content-defined chunks, each identified by a keyed
+    hash of its plaintext and stored once, compressed and encrypted, under
+    ``chunks/``. A snapshot is a small encrypted JSON tree under
+    ``snapshots/`` listing every file with its chunk ids. Unchanged files
+    (same size and mtime as in the previous snapshot) are not read at all.
+    """
+
+    def __init__(self, path: str, password: str):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        config_path = os.path.join(self.path, CONFIG_NAME)
+        if not os.path.isfile(config_path):
+            raise ArchiveError(f"Not a backup repository: {self.path}")
+        try:
+            with open(config_path, "rb") as f:
+                self.config = json.loads(f.read())
+            kdf = dict(self.config.get("kdf") or {**kdf_params(), "salt": self.config["salt"]})
+            salt = base64.b64decode(kdf.pop("salt"))
+            key_check = base64.b64decode(self.config["key_check"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ArchiveError(f"Corrupted repository config: {str(e)}")
+        if self.config.get("version") != REPO_VERSION:
+            raise ArchiveError(f"Unsupported repository version: {self.config.get('version')}")
+
+        self._enc_key, self._id_key = self._derive_keys(password, salt, kdf)
+        self._aead = AESGCM(self._enc_key)
+        try:
+            self._aead.decrypt(key_check[:NONCE_SIZE], key_check[NONCE_SIZE:], KEY_CHECK)
+        except InvalidTag:
+            raise EncryptionError("Invalid password for repository")
+        self._known_chunks = None
+        # Chunks written since the last sync_chunks(), not yet known to be durable.
+        self._unsynced_chunks: List[str] = []
+
+    @classmethod
+    def init(cls, path: str, password: str) -> "Repository":
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.exists(os.path.join(path, CONFIG_NAME)):
+            raise ArchiveError(f"Repository already exists: {path}")
+        os.makedirs(os.path.join(path, CHUNKS_DIR), exist_ok=True)
+        os.makedirs(os.path.join(path, SNAPSHOTS_DIR), exist_ok=True)
+
+        salt = os.urandom(SALT_SIZE)
+        kdf = kdf_params()
+        enc_key, _ = cls._derive_keys(password, salt, kdf)
+        nonce = os.urandom(NONCE_SIZE)
+        key_check = nonce + AESGCM(enc_key).encrypt(nonce, KEY_CHECK, KEY_CHECK)
+        config = {
+            "version": REPO_VERSION,
+            "kdf": {**kdf, "salt": base64.b64encode(salt).decode()},
+            "key_check": base64.b64encode(key_check).decode(),
+            "chunker": {"min_size": MIN_CHUNK_SIZE, "max_size": MAX_CHUNK_SIZE},
+        }
+        _write_atomic(os.path.join(path, CONFIG_NAME), json.dumps(config, indent=2).encode())
+        logger.info(f"Initialized backup repository at {path}")
+        return cls(path, password)
+
+    @classmethod
+    def open_or_init(cls, path: str, password: str) -> "Repository":
+        if os.path.isfile(os.path.join(os.path.expanduser(path), CONFIG_NAME)):
+            return cls(path, password)
+        return cls.init(path, password)
+
+    @staticmethod
+    def _derive_keys(password: str, salt: bytes, kdf: dict):
+        master = derive_key(password, salt, kdf)
+        keys = HKDF(algorithm=hashes.SHA256(), length=64, salt=None,
+                    info=b"obsidian_backuper repository keys").derive(master)
+        return keys[:32], keys[32:]
+
+    def _seal(self, payload: bytes, aad: bytes) -> bytes:
+        compressed = zlib.compress(payload, ZLIB_LEVEL)
+        body = ZLIB + compressed if len(compressed) < len(payload) else RAW + payload
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead.encrypt(nonce, body, aad)
+
+    def _open(self, blob: bytes, aad: bytes) -> bytes:
+        try:
+            body = self._aead.decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], aad)
+        except InvalidTag:
+            raise EncryptionError("Repository object is corrupted")
+        return zlib.decompress(body[1:]) if body[:1] == ZLIB else body[1:]
+
+    def _chunk_path(self, chunk_id: str) -> str:
+        return os.path.join(self.path, CHUNKS_DIR, chunk_id[:2], chunk_id)
+
+    def _load_known_chunks(self):
+        self._known_chunks = set()
+        chunks_dir = os.path.join(self.path, CHUNKS_DIR)
+        for prefix in os.listdir(chunks_dir):
+            self._known_chunks.update(
+                name for name in os.listdir(os.path.join(chunks_dir, prefix))
+                if not name.startswith(".")
+            )
+
+    def store_chunk(self, data: bytes) -> str:
+        chunk_id = hmac.new(self._id_key, data, hashlib.sha256).hexdigest()
+        if self._known_chunks is None:
+            self._load_known_chunks()
+        if chunk_id not in self._known_chunks:
+            path = self._chunk_path(chunk_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, self._seal(data, chunk_id.encode()), sync=False)
+            self._known_chunks.add(chunk_id)
+            self._unsynced_chunks.append(path)
+        return chunk_id
+
+    def sync_chunks(self):
+        """fsync the chunks stored since the last call, and their directories.
+
+        Chunks are written without fsync so the kernel can write them back
+        together. This must run before a snapshot referencing them is
+        written: after a crash, a chunk listed in the directory is taken to
+        be present and is never rewritten.
+        """
+        dirs = set()
+        for path in self._unsynced_chunks:
+            _fsync(path)
+            dirs.add(os.path.dirname(path))
+        for path in sorted(dirs) + ([os.path.join(self.path, CHUNKS_DIR)] if dirs else []):
+            _fsync_dir(path)
+        self._unsynced_chunks = []
+
+    def load_chunk(self, chunk_id: str) -> bytes:
+        try:
+            with open(self._chunk_path(chunk_id), "rb") as f:
+                data = self._open(f.read(), chunk_id.encode())
+        except FileNotFoundError:
+            raise ArchiveError(f"Missing chunk in repository: {chunk_id}")
+        if not hmac.compare_digest(hmac.new(self._id_key, data, hashlib.sha256).hexdigest(), chunk_id):
+            raise ArchiveError(f"Chunk content does not match its id: {chunk_id}")
+        return data
+
+    def snapshot_ids(self) -> List[str]:
+        return sorted(name for name in os.listdir(os.path.join(self.path, SNAPSHOTS_DIR))
+                      if not name.startswith("."))
+
+    def load_snapshot(self, snapshot_id: str) -> dict:
+        path = os.path.join(self.path, SNAPSHOTS_DIR, snapshot_id)
+        if os.path.basename(snapshot_id) != snapshot_id or not os.path.isfile(path):
+            raise ArchiveError(f"Snapshot not found: {snapshot_id}")
+        with open(path, "rb") as f:
+            return json.loads(self._open(f.read(), snapshot_id.encode()))
+
+    def latest_snapshot(self, vault: Optional[str] = None) -> Optional[dict]:
+        for snapshot_id in reversed(self.snapshot_ids()):
+            snapshot = self.load_snapshot(snapshot_id)
+            if vault is None or snapshot["vault"] == vault:
+                return snapshot
+        return None
+
+    def backup(self, vault_path: str, ignore: Optional[IgnoreRules] = None) -> str:
+        """Store a snapshot of ``vault_path``, leaving out what ``ignore`` excludes, and return its id."""
+        vault_path = os.path.abspath(os.path.expanduser(vault_path))
+        scan = scan_tree(vault_path, ignore=ignore)
+        if scan.skipped.dirs or scan.skipped.files:
+            logger.info(f"Exclusion rules {scan.skipped.format()}")
+        previous = self.latest_snapshot(vault_path)
+        known_files: Dict[str, dict] = {entry["path"]: entry for entry in previous["files"]} if previous else {}
+
+        snapshot = {
+            "version": REPO_VERSION,
+            "vault": vault_path,
+            "root": os.path.basename(vault_path),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "dirs": sorted(scan.dirs),
+            "links": [],
+            "files": [],
+        }
+        reused = stored = 0
+        for rel in sorted(scan.files):
+            full = os.path.join(vault_path, *rel.split("/"))
+            st = scan.files[rel]
+            try:
+                if stat.S_ISLNK(st.st_mode):
+                    snapshot["links"].append({"path": rel, "target": os.readlink(full)})
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    logger.warning(f"Skipping unsupported file type: {full}")
+                    continue
+                old = known_files.get(rel)
+                if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                    chunks = old["chunks"]
+                    reused += 1
+                else:
+                    with open(full, "rb") as f:
+                        chunks = [self.store_chunk(chunk) for chunk in iter_chunks(f)]
+                    stored += 1
+            except FileNotFoundError:
+                # Deleted since the scan; the next snapshot won't list it either.
+                logger.warning(f"File disappeared during snapshot: {full}")
+                continue
+            snapshot["files"].append({
+                "path": rel, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                "mode": st.st_mode & 0o7777, "chunks": chunks,
+            })
+
+        self.sync_chunks()
+        snapshot_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+        snapshot["id"] = snapshot_id
+        data = json.dumps(snapshot, separators=(",", ":")).encode()
+        _write_atomic(os.path.join(self.path, SNAPSHOTS_DIR, snapshot_id),
+                      self._seal(data, snapshot_id.encode()))
+        logger.info(f"Snapshot {snapshot_id}: {stored} files read, {reused} unchanged files reused")
+        return snapshot_id
+
+    def restore(self, snapshot_id: str, target_dir: str) -> str:
+        """Restore ``snapshot_id`` under ``target_dir`` and return the vault path."""
+        snapshot = self.load_snapshot(snapshot_id)
+        root = os.path.abspath(os.path.join(target_dir, snapshot["root"]))
+        os.makedirs(root, exist_ok=True)
+
+        for rel in snapshot["dirs"]:
+            os.makedirs(_safe_join(root, rel), exist_ok=True)
+        for entry in snapshot["files"]:
+            path = _safe_join(root, entry["path"])
+            with open(path, "wb") as f:
+                for chunk_id in entry["chunks"]:
+                    f.write(self.load_chunk(chunk_id))
+            os.chmod(path, entry["mode"])
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        for entry in snapshot["links"]:
+            path = _safe_join(root, entry["path"])
+            if os.path.lexists(path):
+                os.unlink(path)
+            os.symlink(entry["target"], path)
+        logger.info(f"Snapshot {snapshot_id} restored to: {root}")
+        return root
+
+
+def _safe_join(root: str, rel: str) -> str:
+    path = os.path.normpath(os.path.join(root, *rel.split("/")))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ArchiveError(f"Unsafe path in snapshot: {rel}")
+    return path
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path: str):
+    """Make renames and new entries in ``path`` durable (not possible on Windows)."""
+    if os.name == "posix":
+        _fsync(path)
+
+
+def _write_atomic(path: str, data: bytes, sync: bool = True):
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".part", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    if sync:
+        _fsync_dir(os.path.dirname(path))
@@ -0,0 +1,177 @@
+import os
+import stat
+import tarfile
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from .exceptions import ArchiveError
+from .ignore import IgnoreRules, SkipStats
+from .profiling import span
+from .progress import Progress
+
+try:
+    import grp
+    import pwd
+except ImportError:  # Windows
+    grp = pwd = None
+
+logger = logging.getLogger(__name__)
+
+# Regular files up to this size are read whole by the reader pool, ahead of
+# the archive writer; larger ones are streamed by the writer itself. Restores
+# use the same split: small files go to the writer pool, large ones are
+# streamed to disk directly.
+SMALL_FILE_SIZE = 1024 * 1024
+MAX_IN_FLIGHT_BYTES = 64 * 1024 * 1024
+
+
+def default_workers() -> int:
+    return min(32, (os.cpu_count() or 1) * 4)
+
+
+class ScanResult(NamedTuple):
+    """``lstat`` results by vault-relative path; symlinks (even to directories) count as files."""
+    dirs: Dict[str, os.stat_result]
+    files: Dict[str, os.stat_result]
+    skipped: SkipStats
+
+
+def _list_dir(path: str, rel_dir: str) -> List[Tuple[str, os.stat_result, bool]]:
+    prefix = f"{rel_dir}/" if rel_dir else ""
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            entries.append((prefix + entry.name, st, stat.S_ISDIR(st.st_mode)))
+    return entries
+
+
+def scan_tree(root: str, rel: str = "", ignore: Optional[IgnoreRules] = None,
+              progress: Optional[Progress] = None, workers: Optional[int] = None) -> ScanResult:
+    """Walk ``root/rel`` with ``os.scandir``, listing directories in parallel.
+
+    Each entry is ``lstat``-ed once through its ``DirEntry``. Ignored
+    directories are not listed at all. The result does not depend on the
+    order in which the directories were listed.
+    """
+    base = os.path.join(root, *rel.split("/")) if rel else root
+    dirs: Dict[str, os.stat_result] = {}
+    files: Dict[str, os.stat_result] = {}
+    skipped_dirs = skipped_files = skipped_bytes = 0
+    if rel:
+        try:
+            dirs[rel] = os.lstat(base)
+        except OSError as e:
+            raise ArchiveError(f"Cannot read vault directory: {e}")
+
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+        pending: Set[Future] = {pool.submit(_list_dir, base, rel)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    entries = future.result()
+                except OSError as e:
+                    for other in pending:
+                        other.cancel()
+                    raise ArchiveError(f"Cannot read vault directory: {e}")
+                for path, st, is_dir in entries:
+                    if ignore and ignore.ignored(path, is_dir):
+                        if is_dir:
+                            skipped_dirs += 1
+                        else:
+                            skipped_files += 1
+                            skipped_bytes += st.st_size
+                    elif is_dir:
+                        dirs[path] = st
+                        pending.add(pool.submit(_list_dir, os.path.join(root, *path.split("/")), path))
+                    else:
+                        files[path] = st
+                if progress is not None:
+                    progress.add(scanned=sum(not is_dir for _, _, is_dir in entries))
+    return ScanResult(dirs, files, SkipStats(skipped_dirs, skipped_files, skipped_bytes))
+
+
+@lru_cache(maxsize=None)
+def _user_name(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid)[0] if pwd else ""
+    except KeyError:
+        return ""
+
+
+@lru_cache(maxsize=None)
+def _group_name(gid: int) -> str:
+    try:
+        return grp.getgrgid(gid)[0] if grp else ""
+    except KeyError:
+        return ""
+
+
+def make_tarinfo(arcname: str, st: os.stat_result, linkname: str = "") -> Optional[tarfile.TarInfo]:
+    """The header ``TarFile.gettarinfo`` would build, from an existing ``lstat``.
+
+    User and group names are looked up once per id. Hard links are stored
+    as separate files. Returns None for types other than regular files,
+    directories and symlinks.
+    """
+    mode = st.st_mode
+    tarinfo = tarfile.TarInfo(arcname)
+    if stat.S_ISREG(mode):
+        tarinfo.type = tarfile.REGTYPE
+        tarinfo.size = st.st_size
+    elif stat.S_ISDIR(mode):
+        tarinfo.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(mode):
+        tarinfo.type = tarfile.SYMTYPE
+        tarinfo.linkname = linkname
+    else:
+        return None
+    tarinfo.mode = stat.S_IMODE(mode)
+    tarinfo.uid = st.st_uid
+    tarinfo.gid = st.st_gid
+    tarinfo.mtime = st.st_mtime
+    tarinfo.uname = _user_name(st.st_uid)
+    tarinfo.gname = _group_name(st.st_gid)
+    return tarinfo
+
+
+def _read_file(path: str, hasher_factory) -> Tuple[bytes, str]:
+    with span("read") as timer:
+        with open(path, "rb") as f:
+            data = f.read()
+        hasher = hasher_factory()
+        hasher.update(data)
+        timer.add(bytes=len(data), files=1)
+        return data, hasher.hexdigest()
+
+
+def read_ahead(paths: List[Tuple[str, int]], hasher_factory, workers: Optional[int] = None,
+               max_in_flight: int = MAX_IN_FLIGHT_BYTES) -> Iterator[Future]:
+    """Read and hash ``(path, expected size)`` files on a thread pool, in order.
+
+    Yields one future of ``(data, hexdigest)`` per path, in input order,
+    keeping at most ``max_in_flight`` bytes read ahead of the consumer.
+    """
+    workers = workers or default_workers()
+    pending: Deque[Tuple[Future, int]] = deque()
+    in_flight = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for path, size in paths:
+                while pending and (in_flight + size > max_in_flight or len(pending) >= workers * 4):
+                    future, pending_size = pending.popleft()
+                    in_flight -= pending_size
+                    yield future
+                pending.append((pool.submit(_read_file, path, hasher_factory), size))
+                in_flight += size
+            while pending:
+                yield pending.popleft()[0]
+        finally:
+            for future, _ in pending:
+                future.cancel()
@@ -6,8 +6,8 @@ from pathlib import Path
 from typing import Optional
 import os
 
-from .core import ObsidianBackuper
-from .obsidian_decryptor import ObsidianDecryptor
+from .aio import AsyncObsidianBackuper, decrypt
+from .progress import ProgressEvent, format_progress
 from .exceptions import (
     ObsidianBackupError,
     VaultValidationError,
@@ -41,6 +41,7 @@ class ObsidianBackupTUI(App):
                     id="buttons"
                 ),
                 ProgressBar(show_eta=False, id="progress"),
+                Static("", id="progress-status"),
                 OperationComplete("", id="operation-complete"),
                 id="main-container"
             )
@@ -52,6 +53,7 @@ class ObsidianBackupTUI(App):
         self.title = "Obsidian Backup Tool"
         self.sub_title = "Python 3.12"
         self.query_one("#progress").display = False
+        self.query_one("#progress-status").display = False
         self.query_one("#operation-complete").display = False
 
     @on(Button.Pressed, "#encrypt")
@@ -65,9 +67,9 @@ class ObsidianBackupTUI(App):
         self.run_backup_operation(encrypt=False)
 
 
-    @work(thread=True)
-    def run_backup_operation(self, encrypt: bool) -> None:
-        """Run the backup operation in a worker thread."""
+    @work(exclusive=True)
+    async def run_backup_operation(self, encrypt: bool) -> None:
+        """Run the backup operation off the event loop; cancelled (and cleaned up) on quit."""
         vault_path = self.query_one("#vault-path", Input).value
         password = self.query_one("#password", Input).value
 
@@ -79,50 +81,56 @@ class ObsidianBackupTUI(App):
             self.notify("Password is required!", severity="error")
             return
 
-        self.call_from_thread(
-            self.update_ui_for_operation_start,
-            f"{'Encrypting' if encrypt else 'Decrypting'}..."
-        )
+        self.update_ui_for_operation_start(f"{'Encrypting' if encrypt else 'Decrypting'}...")
 
         try:
             if encrypt:
-                backuper = ObsidianBackuper(vault_path)
-                backup_path = backuper.create_backup(
+                backuper = AsyncObsidianBackuper(vault_path)
+                backup_path = await backuper.create_backup(
                     encrypt=True,
-                    password=password
+                    password=password,
+                    progress=self.update_progress
                 )
                 success_message = f"Encrypted backup created at:\n{backup_path}"
             else:
-                decryptor = ObsidianDecryptor(vault_path)
-                decrypted_path = decryptor.decrypt(password=password)
+                decrypted_path = await decrypt(vault_path, password, progress=self.update_progress)
                 success_message = f"File decrypted to:\n{decrypted_path}"
 
             # Update UI for success
-            self.call_from_thread(
-                self.update_ui_for_success,
-                success_message
-            )
+            self.update_ui_for_success(success_message)
 
         except VaultValidationError as e:
-            self.call_from_thread(self.notify, f"Vault error: {str(e)}", severity="error")
+            self.notify(f"Vault error: {str(e)}", severity="error")
         except (EncryptionError, DecryptionError) as e:
-            self.call_from_thread(self.notify, f"Crypto error: {str(e)}", severity="error")
+            self.notify(f"Crypto error: {str(e)}", severity="error")
         except ObsidianBackupError as e:
-            self.call_from_thread(self.notify, f"Backup error: {str(e)}", severity="error")
+            self.notify(f"Backup error: {str(e)}", severity="error")
         except Exception as e:
-            self.call_from_thread(self.notify, f"Unexpected error: {str(e)}", severity="error")
+            self.notify(f"Unexpected error: {str(e)}", severity="error")
         finally:
-            self.call_from_thread(self.update_ui_for_operation_end)
+            self.update_ui_for_operation_end()
 
     def update_ui_for_operation_start(self, message: str) -> None:
         """Update UI when operation starts."""
         progress = self.query_one("#progress", ProgressBar)
-        progress.update(total=100, progress=0)
+        progress.update(total=None, progress=0)
         progress.display = True
+        status = self.query_one("#progress-status", Static)
+        status.update("")
+        status.display = True
         self.query_one("#operation-complete", OperationComplete).display = False
         self.query_one("#buttons", Horizontal).disabled = True
         self.notify(message)
 
+    def update_progress(self, event: ProgressEvent) -> None:
+        """Move the progress bar to the bytes processed so far."""
+        progress = self.query_one("#progress", ProgressBar)
+        if event.bytes_total:
+            progress.update(total=event.bytes_total, progress=min(event.bytes_read, event.bytes_total))
+        else:
+            progress.update(total=None)
+        self.query_one("#progress-status", Static).update(format_progress(event))
+
     def update_ui_for_success(self, message: str) -> None:
         """Update UI when operation succeeds."""
         operation_complete = self.query_one("#operation-complete", OperationComplete)
@@ -133,6 +141,7 @@ class ObsidianBackupTUI(App):
     def update_ui_for_operation_end(self) -> None:
         """Update UI when operation ends (success or failure)."""
         self.query_one("#progress", ProgressBar).display = False
+        self.query_one("#progress-status", Static).display = False
         self.query_one("#buttons", Horizontal).disabled = False
 
 
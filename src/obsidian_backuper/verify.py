@@ -0,0 +1,202 @@
+import os
+import time
+import tarfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterable, List, NamedTuple, Optional
+from .core import ObsidianBackuper
+from .crypto import CryptoVault, SEGMENT_SIZE
+from .exceptions import ConfigError, EncryptionError, ObsidianBackupError, OperationCancelled
+from .indexed import IndexedArchiveReader
+from .manifest import Manifest, manifest_path_for, new_hasher
+from .options import DEFAULT_VERIFY_LEVEL, VERIFY_LEVELS
+from .progress import CountingReader, Progress, ProgressCallback
+from . import compression, indexed
+
+logger = logging.getLogger(__name__)
+
+LEVELS = VERIFY_LEVELS
+DEFAULT_LEVEL = DEFAULT_VERIFY_LEVEL
+
+
+class VerifyResult(NamedTuple):
+    archive: str
+    level: str
+    seconds: float
+    bytes_checked: int
+    files_checked: int
+    errors: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def format_results(results: List[VerifyResult]) -> str:
+    ok = sum(result.ok for result in results)
+    lines = [f"Verified {ok}/{len(results)} archives"]
+    for result in results:
+        status = "OK  " if result.ok else "FAIL"
+        lines.append(f"  {status}  {result.archive}  {result.files_checked} files  "
+                     f"{result.bytes_checked / 1e6:.1f} MB  {result.seconds:.1f}s")
+        lines.extend(f"        {error}" for error in result.errors)
+    return "\n".join(lines)
+
+
+def _drain(stream: BinaryIO) -> int:
+    total = 0
+    while chunk := stream.read(SEGMENT_SIZE):
+        total += len(chunk)
+    return total
+
+
+class _Check:
+    """Counters and findings of one archive verification."""
+
+    def __init__(self, manifest: Optional[Manifest]):
+        self.manifest = manifest
+        self.errors: List[str] = []
+        self.files = 0
+        self.bytes = 0
+        self.seen = set()
+
+    def other(self, rel: str):
+        """Directory or symlink ``rel``: present, but with no content to hash."""
+        self.seen.add(rel)
+
+    def file(self, rel: str, digest: str):
+        self.files += 1
+        self.seen.add(rel)
+        if self.manifest is None:
+            return
+        entry = self.manifest.files.get(rel)
+        if entry is None:
+            self.errors.append(f"{rel}: not in the manifest")
+        elif entry.digest and entry.digest != digest:
+            self.errors.append(f"{rel}: content does not match the manifest hash")
+
+    def finish(self):
+        # Incremental archives only hold changed files, so only full ones can be complete.
+        if self.manifest is not None and self.manifest.kind == "full":
+            for rel in sorted(set(self.manifest.files) - self.seen):
+                self.errors.append(f"{rel}: in the manifest but missing from the archive")
+
+
+def _verify_tar(path: str, crypto: Optional[CryptoVault], level: str, check: _Check, tracker: Progress):
+    with open(path, "rb") as f:
+        counted = CountingReader(f, tracker)
+        if path.endswith(".enc"):
+            if crypto is None:
+                raise EncryptionError("Password required for decryption")
+            plain = crypto.reader(counted)
+            codec = plain.metadata.get("codec", compression.DEFAULT_CODEC)
+        else:
+            codec = compression.detect_codec(f.read(4))
+            f.seek(0)
+            plain = counted
+        if level == "auth":
+            check.bytes = _drain(plain)
+            return
+        stream = compression.open_reader(plain, codec)
+        if level == "decompress":
+            check.bytes = _drain(stream)
+            return
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                rel = member.name.partition("/")[2]
+                if not member.isreg():
+                    check.other(rel)
+                    continue
+                data = tar.extractfile(member)
+                if level == "tar":
+                    check.bytes += _drain(data)
+                    check.files += 1
+                    continue
+                hasher = new_hasher()
+                while chunk := data.read(SEGMENT_SIZE):
+                    hasher.update(chunk)
+                    check.bytes += len(chunk)
+                check.file(rel, hasher.hexdigest())
+
+
+def _verify_indexed(path: str, crypto: Optional[CryptoVault], level: str, check: _Check,
+                    tracker: Progress):
+    if crypto is None:
+        raise EncryptionError("Password required for decryption")
+    with IndexedArchiveReader(path, crypto) as reader:
+        if level != "manifest":
+            check.bytes = reader.authenticate()
+            check.files = sum(entry["type"] == "file" for entry in reader.entries)
+        else:
+            for entry in reader.entries:
+                if entry["type"] != "file":
+                    check.other(entry["path"])
+                    continue
+                hasher = new_hasher()
+                for extent in reader.iter_file(entry):
+                    hasher.update(extent)
+                    check.bytes += len(extent)
+                check.file(entry["path"], hasher.hexdigest())
+    tracker.add(read=os.path.getsize(path))
+
+
+def verify_archive(path: str, password: Optional[str] = None, level: str = DEFAULT_LEVEL,
+                   progress: Optional[ProgressCallback] = None, keyfiles: Iterable[str] = ()) -> VerifyResult:
+    """Check that the backup at ``path`` is intact, without writing anything.
+
+    ``auth`` decrypts every segment, which authenticates the whole file
+    (and detects truncation); ``decompress`` also decompresses it; ``tar``
+    also parses every tar header and member; ``manifest`` also hashes every
+    file and compares it with the backup's manifest. The archive is read
+    once as a stream, in constant memory. Problems are reported in the
+    result's ``errors`` rather than raised. ``keyfiles`` can stand in
+    for, or add to, the password.
+    """
+    if level not in LEVELS:
+        raise ConfigError(f"Unknown verify level: {level}")
+    started = time.perf_counter()
+    crypto = CryptoVault(password, keyfiles=keyfiles) if password or keyfiles else None
+    check = _Check(None)
+    tracker = Progress(progress)
+    try:
+        tracker.start("verify", bytes_total=os.path.getsize(path))
+        if level == "manifest":
+            manifest_path = manifest_path_for(path)
+            if os.path.exists(manifest_path):
+                check.manifest = ObsidianBackuper.read_manifest(manifest_path, crypto)
+            if check.manifest is None:
+                logger.warning(f"No manifest for {path}, file hashes are not compared")
+            elif check.manifest.parent and \
+                    not os.path.isfile(os.path.join(os.path.dirname(path), check.manifest.parent)):
+                check.errors.append(f"Parent backup {check.manifest.parent} is missing")
+        if path.endswith(indexed.EXTENSION):
+            _verify_indexed(path, crypto, level, check, tracker)
+        else:
+            _verify_tar(path, crypto, level, check, tracker)
+        if level == "manifest":
+            check.finish()
+        tracker.finish()
+    except OperationCancelled:
+        raise
+    except (ObsidianBackupError, tarfile.TarError, OSError, EOFError) as e:
+        check.errors.append(str(e) or type(e).__name__)
+    except Exception as e:
+        # zlib.error, zstd.ZstdError, ... from a corrupt compressed stream.
+        check.errors.append(f"{type(e).__name__}: {str(e)}")
+    result = VerifyResult(path, level, time.perf_counter() - started, check.bytes, check.files, check.errors)
+    if result.ok:
+        logger.info(f"Verified {path} ({level})")
+    else:
+        logger.error(f"Verification of {path} failed: {'; '.join(result.errors)}")
+    return result
+
+
+def verify_archives(paths: Iterable[str], password: Optional[str] = None, level: str = DEFAULT_LEVEL,
+                    workers: Optional[int] = None, keyfiles: Iterable[str] = ()) -> List[VerifyResult]:
+    """Verify many archives on a bounded thread pool; results are in input order."""
+    paths = list(paths)
+    if not paths:
+        return []
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda path: verify_archive(path, password, level, keyfiles=keyfiles), paths))
@@ -0,0 +1,306 @@
+import os
+import sys
+import abc
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from typing import Callable, Dict, Optional, Set
+from .core import ObsidianBackuper
+from .ignore import IgnoreRules
+from .manifest import Manifest
+from .exceptions import ConfigError, ObsidianBackupError
+from .options import DEFAULT_DEBOUNCE
+from . import compression
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long a steady stream of edits can postpone a snapshot.
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+_EVENT = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+class ChangeWatcher(abc.ABC):
+    """Source of vault-relative paths that changed since the previous poll.
+
+    ``poll`` returns None when events were lost and the whole vault must be
+    treated as changed.
+    """
+
+    @abc.abstractmethod
+    def poll(self, timeout: float) -> Optional[Set[str]]:
+        pass
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(ChangeWatcher):
+    """Recursive inotify watch of a vault through libc (Linux only).
+
+    Directories matching ``ignore`` are not watched.
+    """
+
+    def __init__(self, root: str, ignore: Optional[IgnoreRules] = None):
+        self.root = os.path.abspath(root)
+        self.ignore = ignore
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self._watches: Dict[int, str] = {}
+        try:
+            self._watch_tree("")
+        except BaseException:
+            self.close()
+            raise
+
+    @staticmethod
+    def available() -> bool:
+        return sys.platform.startswith("linux") and \
+            hasattr(ctypes.CDLL(ctypes.util.find_library("c") or None), "inotify_init1")
+
+    def _watch_tree(self, rel: str):
+        if rel and self.ignore and self.ignore.ignored_with_parents(rel, is_dir=True):
+            return
+        base = os.path.join(self.root, *rel.split("/")) if rel else self.root
+        for dirpath, dirnames, _ in os.walk(base):
+            dir_rel = os.path.relpath(dirpath, self.root)
+            dir_rel = "" if dir_rel == "." else dir_rel.replace(os.sep, "/")
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached "
+                                       "(raise fs.inotify.max_user_watches or use polling)")
+                raise OSError(err, f"inotify_add_watch failed for {dirpath}: {os.strerror(err)}")
+            self._watches[wd] = dir_rel
+            dirnames[:] = [name for name in dirnames if not os.path.islink(os.path.join(dirpath, name))
+                           and not (self.ignore and self.ignore.ignored(f"{dir_rel}/{name}" if dir_rel else name,
+                                                                         is_dir=True))]
+
+    def poll(self, timeout: float) -> Optional[Set[str]]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed: Set[str] = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                parent = self._watches.get(wd)
+                if parent is None:
+                    continue
+                if mask & IN_MOVE_SELF and not os.path.isdir(os.path.join(self.root, *parent.split("/"))):
+                    # Moved out of the vault; a move within it re-registered the
+                    # same watch under the new path already.
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    self._watches.pop(wd, None)
+                    continue
+                if not name:
+                    continue
+                name = os.fsdecode(name)
+                rel = f"{parent}/{name}" if parent else name
+                changed.add(rel)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(rel)
+        if overflow:
+            logger.warning("inotify event queue overflowed, rescanning the whole vault")
+            return None
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher(ChangeWatcher):
+    """Portable fallback comparing (size, mtime) of every path at a fixed interval."""
+
+    def __init__(self, root: str, interval: float = DEFAULT_POLL_INTERVAL, ignore: Optional[IgnoreRules] = None):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.ignore = ignore
+        self._state = self._snapshot()
+
+    def _snapshot(self) -> Dict[str, tuple]:
+        manifest = Manifest.scan(self.root, ignore=self.ignore)
+        state = {path: (entry.size, entry.mtime_ns) for path, entry in manifest.files.items()}
+        state.update((path, None) for path in manifest.dirs)
+        return state
+
+    def poll(self, timeout: float) -> Optional[Set[str]]:
+        time.sleep(min(timeout, self.interval))
+        state = self._snapshot()
+        old = self._state
+        self._state = state
+        return {path for path in state.keys() | old.keys() if state.get(path, -1) != old.get(path, -1)}
+
+
+def create_watcher(root: str, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                   ignore: Optional[IgnoreRules] = None) -> ChangeWatcher:
+    """inotify on Linux, polling everywhere else or when inotify cannot be set up."""
+    if InotifyWatcher.available():
+        try:
+            return InotifyWatcher(root, ignore)
+        except OSError as e:
+            logger.warning(f"inotify unavailable ({str(e)}), falling back to polling")
+    return PollingWatcher(root, poll_interval, ignore)
+
+
+class VaultWatcher:
+    """Take debounced incremental backups of a vault as it changes.
+
+    Changed paths are collected from a :class:`ChangeWatcher` into an
+    in-memory dirty set. Once no new change arrived for ``debounce``
+    seconds (or ``max_delay`` seconds after the first pending change), an
+    incremental backup of just those paths is written on top of the last
+    manifest kept in memory.
+    """
+
+    def __init__(self, backuper: ObsidianBackuper, password: str,
+                 codec: str = compression.DEFAULT_CODEC, threads: Optional[int] = None,
+                 archive_format: str = "tar", debounce: float = DEFAULT_DEBOUNCE,
+                 max_delay: Optional[float] = None, watcher: Optional[ChangeWatcher] = None,
+                 on_backup: Optional[Callable[[str], None]] = None, catalog_files: bool = False):
+        if max_delay is None:
+            max_delay = max(DEFAULT_MAX_DELAY, debounce)
+        if debounce < 0 or max_delay < debounce:
+            raise ConfigError("Watch debounce must be >= 0 and not exceed the maximum delay")
+        self.backuper = backuper
+        self.password = password
+        self.codec = codec
+        self.threads = threads
+        self.archive_format = archive_format
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.on_backup = on_backup
+        self.catalog_files = catalog_files
+        self._watcher = watcher
+        self._stop = threading.Event()
+        self.manifest: Optional[Manifest] = None
+        self.dirty: Set[str] = set()
+        self._rescan = False
+        self._first_change = None
+        self._last_change = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _backup(self, paths: Set[str]) -> Optional[str]:
+        # After lost events (and on startup) fall back to a full stat walk against the last manifest.
+        archive, manifest = self.backuper.create_backup_from_changes(
+            self.manifest, None if self._rescan else paths, encrypt=True, password=self.password,
+            codec=self.codec, threads=self.threads, archive_format=self.archive_format,
+            catalog_files=self.catalog_files,
+        )
+        self.manifest = manifest
+        self._rescan = False
+        if archive and self.on_backup:
+            self.on_backup(archive)
+        return archive
+
+    def flush(self) -> Optional[str]:
+        """Back up pending changes now; returns the new archive, if any."""
+        if not self.dirty and not self._rescan:
+            return None
+        paths, self.dirty = self.dirty, set()
+        self._first_change = self._last_change = None
+        try:
+            return self._backup(paths)
+        except Exception:
+            # Keep the paths and retry after another debounce period.
+            self.dirty |= paths
+            self._first_change = self._last_change = time.monotonic()
+            raise
+
+    def record(self, changed: Optional[Set[str]], now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        if changed is None:
+            self._rescan = True
+        elif not changed:
+            return
+        else:
+            self.dirty |= changed
+        self._last_change = now
+        if self._first_change is None:
+            self._first_change = now
+
+    def due(self, now: Optional[float] = None) -> bool:
+        if self._last_change is None:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self._last_change >= self.debounce or now - self._first_change >= self.max_delay
+
+    def run(self):
+        """Watch until :meth:`stop` is called (or KeyboardInterrupt), then back up pending changes."""
+        self.manifest = self.backuper.latest_manifest(self.password)
+        # Watch before the first backup, so that nothing changed while it runs
+        # is missed; the first backup picks up edits made while not watching.
+        watcher = self._watcher or create_watcher(self.backuper.vault_path, ignore=self.backuper.ignore_rules())
+        if self.manifest is None:
+            logger.info("No previous backup of this vault, creating a full backup first")
+        else:
+            logger.info("Backing up changes made since the last backup")
+        self._rescan = True
+        try:
+            self.flush()
+            logger.info(f"Watching {self.backuper.vault_path} (debounce {self.debounce}s)")
+            while not self._stop.is_set():
+                timeout = self.debounce if self._last_change is None else \
+                    max(0.05, self.debounce - (time.monotonic() - self._last_change))
+                self.record(watcher.poll(min(timeout, 1.0)))
+                if self.due():
+                    try:
+                        self.flush()
+                    except ObsidianBackupError as e:
+                        logger.error(f"Watch backup failed, will retry: {str(e)}")
+        except KeyboardInterrupt:
+            logger.info("Stopping watch")
+        finally:
+            watcher.close()
+        self.flush()
@@ -0,0 +1,120 @@
+import unittest
+import os
+import time
+import asyncio
+import tempfile
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from obsidian_backuper.aio import AsyncObsidianBackuper, decrypt, run_cancellable
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.exceptions import OperationCancelled
+
+
+class TestAsyncObsidianBackuper(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        os.makedirs(os.path.join(self.vault_dir, "Daily"))
+        for i in range(5):
+            with open(os.path.join(self.vault_dir, "Daily", f"note{i}.md"), "w") as f:
+                f.write(f"Note {i}\n" * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_backup_and_restore(self):
+        events = []
+
+        async def scenario():
+            backuper = AsyncObsidianBackuper(self.vault_dir)
+            archive = await backuper.create_backup(encrypt=True, password="testpassword",
+                                                   progress=events.append)
+            restored = await AsyncObsidianBackuper(archive, require_directory=False).restore_backup(
+                os.path.join(self.test_dir, "restore"), password="testpassword", progress=events.append
+            )
+            return archive, restored
+
+        archive, restored = asyncio.run(scenario())
+        self.assertTrue(os.path.isfile(archive))
+        self.assertEqual(sorted(os.listdir(os.path.join(restored, "Daily"))),
+                         sorted(os.listdir(os.path.join(self.vault_dir, "Daily"))))
+        self.assertEqual([e.phase for e in events if e.finished], ["backup", "restore"])
+
+    def test_concurrent_jobs_share_bounded_pool(self):
+        vaults = []
+        for name in ("a", "b", "c"):
+            vault = os.path.join(self.test_dir, name)
+            shutil.copytree(self.vault_dir, vault)
+            vaults.append(vault)
+
+        async def scenario(executor):
+            backups = await asyncio.gather(*(
+                AsyncObsidianBackuper(vault, executor=executor).create_backup(encrypt=True, password="pw")
+                for vault in vaults
+            ))
+            return await asyncio.gather(*(decrypt(path, "pw", executor=executor) for path in backups))
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            decrypted = asyncio.run(scenario(executor))
+        self.assertEqual(len(decrypted), 3)
+        self.assertTrue(all(os.path.isfile(path) for path in decrypted))
+
+    def test_cancelled_backup_removes_partial_archive(self):
+        started = threading.Event()
+        resume = threading.Event()
+        add_entry = ObsidianBackuper._add_entry
+
+        def slow_add_entry(backuper, *args, **kwargs):
+            started.set()
+            resume.wait(5)
+            time.sleep(0.15)  # past the progress callback interval
+            return add_entry(backuper, *args, **kwargs)
+
+        async def scenario():
+            task = asyncio.ensure_future(
+                AsyncObsidianBackuper(self.vault_dir).create_backup(encrypt=True, password="testpassword")
+            )
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            task.cancel()
+            resume.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with patch.object(ObsidianBackuper, "_add_entry", slow_add_entry):
+            asyncio.run(scenario())
+        self.assertEqual(os.listdir(self.test_dir), ["vault"])
+
+    def test_queued_job_is_cancelled_before_it_starts(self):
+        calls = []
+
+        def job(progress):
+            calls.append(progress)
+
+        async def scenario(executor):
+            blocker = threading.Event()
+            executor.submit(blocker.wait, 5)
+            task = asyncio.ensure_future(run_cancellable(job, executor=executor))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            blocker.set()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            asyncio.run(scenario(executor))
+        self.assertEqual(calls, [])
+
+    def test_progress_callback_can_cancel_sync_backup(self):
+        def cancel(event):
+            if event.phase == "backup":
+                raise OperationCancelled("stop")
+
+        with self.assertRaises(OperationCancelled):
+            ObsidianBackuper(self.vault_dir).create_backup(encrypt=True, password="pw", progress=cancel)
+        self.assertEqual(os.listdir(self.test_dir), ["vault"])
+
+
+if __name__ == "__main__":
+    unittest.main()
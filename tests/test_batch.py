@@ -0,0 +1,70 @@
+import unittest
+import os
+import json
+import tempfile
+import shutil
+from unittest.mock import patch
+from obsidian_backuper import crypto
+from obsidian_backuper.batch import VaultJob, backup_vaults, load_vault_config
+from obsidian_backuper.exceptions import ConfigError
+
+
+class TestBatchBackup(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vaults = []
+        for name in ("alpha", "beta", "gamma"):
+            vault = os.path.join(self.test_dir, name)
+            os.makedirs(vault)
+            with open(os.path.join(vault, "note.md"), "w") as f:
+                f.write(f"# {name}")
+            self.vaults.append(vault)
+        crypto.clear_key_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_backup_vaults_shares_key_and_isolates_failures(self):
+        jobs = [VaultJob(vault, password="teampassword") for vault in self.vaults]
+        jobs.append(VaultJob(os.path.join(self.test_dir, "missing"), password="teampassword"))
+        with patch("obsidian_backuper.crypto._run_kdf", wraps=crypto._run_kdf) as run_kdf:
+            summary = backup_vaults(jobs, workers=3)
+
+        self.assertEqual(run_kdf.call_count, 1)
+        self.assertEqual([result.vault for result in summary.results], [job.vault for job in jobs])
+        self.assertEqual(len(summary.succeeded), 3)
+        self.assertEqual(len(summary.failed), 1)
+        self.assertIn("not found", summary.failed[0].error)
+        archives = [result.archive for result in summary.succeeded]
+        self.assertEqual(len(set(archives)), 3)
+        for result in summary.succeeded:
+            self.assertEqual(os.path.getsize(result.archive), result.size)
+        self.assertIn("Backed up 3/4 vaults", summary.format())
+
+    def test_load_vault_config(self):
+        config = os.path.join(self.test_dir, "vaults.json")
+        with open(config, "w") as f:
+            json.dump({
+                "defaults": {"codec": "none", "password_env": "TEAM_PASSWORD"},
+                "vaults": ["alpha", {"path": "beta", "password": "beta-secret", "incremental": True,
+                                     "catalog_files": True}],
+            }, f)
+        with patch.dict(os.environ, {"TEAM_PASSWORD": "from-env"}):
+            jobs = load_vault_config(config)
+
+        self.assertEqual(jobs[0], VaultJob(self.vaults[0], password="from-env", codec="none"))
+        self.assertEqual(jobs[1].vault, self.vaults[1])
+        self.assertEqual(jobs[1].password, "beta-secret")
+        self.assertTrue(jobs[1].incremental)
+        self.assertTrue(jobs[1].catalog_files)
+
+    def test_load_vault_config_rejects_unknown_keys(self):
+        config = os.path.join(self.test_dir, "vaults.json")
+        with open(config, "w") as f:
+            json.dump([{"path": "alpha", "compression": "gzip"}], f)
+        with self.assertRaises(ConfigError):
+            load_vault_config(config)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import tempfile
+import shutil
+from obsidian_backuper.benchmark import (VaultSpec, generate_vault, run_benchmarks, compare, CASES,
+                                         NOTE_METHODS, benchmark_note_compression)
+from obsidian_backuper.exceptions import ConfigError
+
+SMALL = VaultSpec(notes=20, note_size=512, attachments=2, attachment_size=2048, depth=2, fanout=2)
+
+
+def read_tree(path):
+    tree = {}
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            with open(full, "rb") as f:
+                tree[os.path.relpath(full, path)] = f.read()
+    return tree
+
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_generate_vault_is_reproducible(self):
+        first, second = os.path.join(self.test_dir, "a"), os.path.join(self.test_dir, "b")
+        stats = generate_vault(first, SMALL)
+        generate_vault(second, SMALL)
+        tree = read_tree(first)
+        self.assertEqual(tree, read_tree(second))
+        self.assertEqual(stats, {"files": len(tree), "bytes": sum(map(len, tree.values()))})
+        self.assertEqual(len([p for p in tree if p.endswith(".md")]), 20)
+
+        other = os.path.join(self.test_dir, "c")
+        generate_vault(other, SMALL._replace(seed=1))
+        self.assertNotEqual(tree, read_tree(other))
+
+    def test_run_benchmarks(self):
+        report = run_benchmarks(SMALL, repeat=1, workdir=self.test_dir, isolate=False)
+        self.assertEqual(list(report["results"]), list(CASES))
+        for result in report["results"].values():
+            self.assertGreater(result["wall_s"], 0)
+            self.assertGreater(result["bytes_written"], 0)
+            self.assertEqual(len(result["samples"]), 1)
+        self.assertEqual(os.listdir(self.test_dir), [])
+
+    def test_run_benchmarks_unknown_case(self):
+        with self.assertRaises(ConfigError):
+            run_benchmarks(SMALL, cases=["compress"], isolate=False)
+
+    def test_note_compression(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard not installed")
+        report = benchmark_note_compression(VaultSpec(notes=300, note_size=2048), repeat=1, workdir=self.test_dir)
+        self.assertEqual(report["notes"], 300)
+        self.assertEqual(set(report["results"]), set(NOTE_METHODS))
+        self.assertGreater(report["results"]["zstd+dict"]["ratio"], report["results"]["gzip"]["ratio"])
+        self.assertEqual(os.listdir(self.test_dir), [])
+
+    def test_compare(self):
+        def report(wall, rss, spec=SMALL):
+            return {"spec": spec._asdict(), "options": {"codec": "gzip"},
+                    "results": {"backup": {"wall_s": wall, "cpu_s": wall,
+                                           "peak_rss_bytes": rss, "bytes_written": 100}}}
+
+        self.assertEqual(compare(report(1.0, 1000), report(1.05, None)), [])
+        regressions = compare(report(1.0, 1000), report(1.5, 1000))
+        self.assertEqual({r["metric"] for r in regressions}, {"wall_s", "cpu_s"})
+        self.assertAlmostEqual(regressions[0]["change"], 0.5)
+        with self.assertRaises(ConfigError):
+            compare(report(1.0, 1000), report(1.0, 1000, SMALL._replace(notes=5)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import os
+import tempfile
+import shutil
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.catalog import Catalog, catalog_path_for
+from obsidian_backuper.manifest import FileEntry, Manifest, manifest_path_for
+from obsidian_backuper.exceptions import ConfigError
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        os.makedirs(os.path.join(self.vault_dir, "Daily"))
+        with open(os.path.join(self.vault_dir, "index.md"), "w") as f:
+            f.write("# Index\n")
+        with open(os.path.join(self.vault_dir, "Daily", "monday.md"), "w") as f:
+            f.write("Monday\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def fake_backup(self, catalog, name, created_at, kind="full", parent=None):
+        archive = os.path.join(self.test_dir, name)
+        for path in (archive, manifest_path_for(archive)):
+            with open(path, "wb") as f:
+                f.write(b"x")
+        manifest = Manifest("vault", vault=self.vault_dir, files={"index.md": FileEntry(8, 0)},
+                            kind=kind, parent=parent, archive=name, created_at=created_at)
+        catalog.record(manifest, archive, "gzip", "tar", True)
+
+    def test_backups_are_recorded(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        full = backuper.create_backup(encrypt=True, password="testpassword", catalog_files=True)
+        incremental = backuper.create_backup(encrypt=True, password="testpassword", incremental=True)
+
+        with Catalog(self.test_dir) as catalog:
+            records = catalog.snapshots(self.vault_dir)
+            self.assertEqual([r.archive for r in records],
+                             [os.path.basename(full), os.path.basename(incremental)])
+            self.assertEqual(records[0].file_count, 2)
+            self.assertEqual(records[0].size, os.path.getsize(full))
+            self.assertTrue(records[0].encrypted)
+            self.assertEqual(records[1].parent, records[0].archive)
+            self.assertEqual(catalog.snapshots("/elsewhere"), [])
+
+            self.assertEqual(catalog.find("Daily/*.md"), {os.path.basename(full): ["Daily/monday.md"]})
+            self.assertEqual(catalog.find("*.pdf"), {})
+
+    def test_list_by_date(self):
+        with Catalog(self.test_dir) as catalog:
+            self.fake_backup(catalog, "a.tar.gz.enc", "2026-10-01T09:00:00")
+            self.fake_backup(catalog, "b.tar.gz.enc", "2026-10-02T09:00:00")
+            self.fake_backup(catalog, "c.tar.gz.enc", "2026-10-03T09:00:00")
+            records = catalog.snapshots(since="2026-10-02", until="2026-10-02T23:59:59")
+            self.assertEqual([r.archive for r in records], ["b.tar.gz.enc"])
+
+    def test_prune_keeps_newest_per_day_and_incremental_parents(self):
+        with Catalog(self.test_dir) as catalog:
+            self.fake_backup(catalog, "d1_full", "2026-10-01T08:00:00")
+            self.fake_backup(catalog, "d1_late", "2026-10-01T20:00:00")
+            self.fake_backup(catalog, "d2_full", "2026-10-02T08:00:00")
+            self.fake_backup(catalog, "d3_incr", "2026-10-03T08:00:00", "incremental", "d2_full")
+            self.fake_backup(catalog, "d3_late", "2026-10-03T09:00:00", "incremental", "d3_incr")
+
+            with self.assertRaises(ConfigError):
+                catalog.prune()
+            removed = catalog.prune(keep_daily=1, dry_run=True)
+            self.assertEqual([r.archive for r in removed], ["d1_full", "d1_late"])
+            self.assertTrue(os.path.exists(os.path.join(self.test_dir, "d1_full")))
+
+            removed = catalog.prune(keep_daily=2)
+            self.assertEqual([r.archive for r in removed], ["d1_full", "d1_late"])
+            self.assertFalse(os.path.exists(os.path.join(self.test_dir, "d1_late")))
+            self.assertFalse(os.path.exists(manifest_path_for(os.path.join(self.test_dir, "d1_late"))))
+            self.assertEqual([r.archive for r in catalog.snapshots()], ["d2_full", "d3_incr", "d3_late"])
+
+            self.assertEqual(catalog.prune(keep_hourly=1), [])
+
+    def test_catalog_is_next_to_the_backups(self):
+        ObsidianBackuper(self.vault_dir).create_backup()
+        self.assertTrue(os.path.isfile(catalog_path_for(self.test_dir)))
+
+
+if __name__ == "__main__":
+    unittest.main()
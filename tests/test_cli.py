@@ -1,11 +1,18 @@
 import unittest
 import os
+import sys
+import json
 import tempfile
 import shutil
+import subprocess
+import obsidian_backuper
 from unittest.mock import patch, MagicMock
-from obsidian_backuper.cli import main, get_env_var
+from obsidian_backuper.cli import main, get_env_var, print_progress
 from obsidian_backuper.exceptions import VaultValidationError, EncryptionError, DecryptionError
 from obsidian_backuper.crypto import CryptoVault
+from obsidian_backuper.batch import backup_vaults
+from obsidian_backuper.catalog import Catalog
+from obsidian_backuper.core import ObsidianBackuper
 
 
 class TestCLI(unittest.TestCase):
@@ -38,47 +45,403 @@ class TestCLI(unittest.TestCase):
     @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
     def test_cli_encrypt(self, mock_parse_args):
         mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
         mock_args.vault = self.vault_dir
         mock_args.password = "testpassword"
         mock_args.encrypt = True
         mock_args.decrypt = False
+        mock_args.tui = False
+        mock_args.codec = "gzip"
+        mock_args.threads = None
+        mock_args.incremental = False
+        mock_args.repo = None
+        mock_args.archive_format = "tar"
+        mock_args.vaults = None
+        mock_args.vaults_config = None
+        mock_args.progress = False
+        mock_args.catalog_files = False
+        mock_args.exclude = ["*.tmp"]
+        mock_args.include = []
+        mock_args.no_default_excludes = False
+        mock_args.compress_all = False
+        mock_args.zstd_dict = False
+        mock_args.cipher = "auto"
+        mock_args.keyfile = []
         mock_parse_args.return_value = mock_args
         
-        with patch('obsidian_backuper.cli.ObsidianBackuper') as mock_backuper:
+        with patch('obsidian_backuper.core.ObsidianBackuper') as mock_backuper:
             instance = mock_backuper.return_value
             instance.create_backup.return_value = "/path/to/backup.tar.gz.enc"
             
             main()
             
-            mock_backuper.assert_called_once_with(vault_path=self.vault_dir)
-            instance.create_backup.assert_called_once_with(encrypt=True, password="testpassword")
+            mock_backuper.assert_called_once_with(vault_path=self.vault_dir, exclude=["*.tmp"], include=[],
+                                                  default_excludes=True, adaptive_compression=True,
+                                                  zstd_dictionary=False, cipher="auto", keyfiles=[])
+            instance.create_backup.assert_called_once_with(
+                encrypt=True, password="testpassword", codec="gzip", threads=None,
+                incremental=False, archive_format="tar", progress=None, catalog_files=False
+            )
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_encrypt_many_vaults(self, mock_parse_args):
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        mock_args.vault = None
+        mock_args.vaults = [self.vault_dir, "/nonexistent/vault"]
+        mock_args.vaults_config = None
+        mock_args.password = "testpassword"
+        mock_args.encrypt = True
+        mock_args.tui = False
+        mock_args.codec = "gzip"
+        mock_args.threads = None
+        mock_args.jobs = 2
+        mock_args.incremental = False
+        mock_args.archive_format = "tar"
+        mock_args.exclude = []
+        mock_args.include = []
+        mock_args.no_default_excludes = False
+        mock_args.compress_all = False
+        mock_args.zstd_dict = False
+        mock_args.cipher = "auto"
+        mock_args.keyfile = []
+        mock_args.catalog_files = True
+        mock_parse_args.return_value = mock_args
+
+        with patch('obsidian_backuper.batch.backup_vaults', wraps=backup_vaults) as mock_batch:
+            with self.assertRaises(SystemExit):
+                main()
+        jobs = mock_batch.call_args[0][0]
+        self.assertEqual([job.vault for job in jobs], [self.vault_dir, "/nonexistent/vault"])
+        self.assertTrue(all(job.catalog_files for job in jobs))
+        self.assertEqual(len([name for name in os.listdir(self.test_dir) if name.endswith(".tar.gz.enc")]), 1)
+        with Catalog(self.test_dir) as catalog:
+            self.assertEqual(list(catalog.find("*.md").values()), [["test_note.md"]])
 
     @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
     def test_cli_decrypt(self, mock_parse_args):
         mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
         mock_args.vault = self.encrypted_file
         mock_args.password = "testpassword"
         mock_args.encrypt = False
         mock_args.decrypt = True
+        mock_args.tui = False
+        mock_args.progress = True
+        mock_args.keyfile = []
         mock_parse_args.return_value = mock_args
         
-        with patch('obsidian_backuper.cli.ObsidianDecryptor') as mock_decryptor:
+        with patch('obsidian_backuper.obsidian_decryptor.ObsidianDecryptor') as mock_decryptor:
             instance = mock_decryptor.return_value
             instance.decrypt.return_value = "/path/to/decrypted_file"
             
             main()
             
             mock_decryptor.assert_called_once_with(encrypted_file_path=self.encrypted_file)
-            instance.decrypt.assert_called_once_with(password="testpassword")
+            instance.decrypt.assert_called_once_with(password="testpassword", progress=print_progress, keyfiles=[])
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_profile(self, mock_parse_args):
+        report_path = os.path.join(self.test_dir, "profile.json")
+        mock_args = MagicMock()
+        mock_args.profile = True
+        mock_args.profile_json = report_path
+        mock_args.profile_dump = None
+        mock_args.vault = self.encrypted_file
+        mock_args.password = "testpassword"
+        mock_args.encrypt = False
+        mock_args.decrypt = True
+        mock_args.tui = False
+        mock_args.progress = False
+        mock_args.keyfile = []
+        mock_parse_args.return_value = mock_args
+
+        with patch('sys.stderr') as mock_stderr:
+            main()
+
+        table = "".join(call.args[0] for call in mock_stderr.write.call_args_list)
+        self.assertIn("decrypt_file", table)
+        self.assertIn("total", table)
+        with open(report_path) as f:
+            report = json.load(f)
+        self.assertLessEqual({"decrypt_file", "decrypt"}, {span["name"] for span in report["spans"]})
+        with open(os.path.join(self.test_dir, "test"), "rb") as f:
+            self.assertEqual(f.read(), b"test content")
 
     @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
     def test_cli_errors(self, mock_parse_args):
         mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
         mock_args.vault = "/nonexistent/path"
         mock_args.password = "testpassword"
         mock_args.encrypt = True
         mock_args.decrypt = False
+        mock_args.tui = False
+        mock_args.vaults = None
+        mock_args.vaults_config = None
         mock_parse_args.return_value = mock_args
         
         with self.assertRaises(SystemExit):
-            main()
\ No newline at end of file
+            main()
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_restore(self, mock_parse_args):
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        mock_args.vault = "/path/to/backup.obk"
+        mock_args.password = "testpassword"
+        mock_args.encrypt = False
+        mock_args.decrypt = False
+        mock_args.tui = False
+        mock_args.restore = self.test_dir
+        mock_args.repo = None
+        mock_args.path = ["Daily/*.md"]
+        mock_args.threads = 4
+        mock_args.keyfile = ["/keys/ops.key"]
+        mock_args.progress = True
+        mock_parse_args.return_value = mock_args
+
+        with patch('obsidian_backuper.core.ObsidianBackuper') as mock_backuper:
+            main()
+
+            mock_backuper.assert_called_once_with(vault_path="/path/to/backup.obk", require_directory=False,
+                                                  keyfiles=["/keys/ops.key"])
+            mock_backuper.return_value.restore_backup.assert_called_once_with(
+                self.test_dir, password="testpassword", paths=["Daily/*.md"], workers=4, progress=print_progress
+            )
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_repo_list_and_restore(self, mock_parse_args):
+        repo_dir = os.path.join(self.test_dir, "repo")
+        snapshot_id = ObsidianBackuper(self.vault_dir).create_snapshot(repo_dir, "testpassword")
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        mock_args.vault = self.vault_dir
+        mock_args.password = "testpassword"
+        mock_args.repo = repo_dir
+        mock_args.snapshot = None
+        mock_args.encrypt = False
+        mock_args.decrypt = False
+        mock_args.tui = False
+        mock_args.restore = None
+        mock_args.git_snapshot = None
+        mock_args.watch = False
+        mock_args.verify = None
+        mock_args.list = True
+        mock_parse_args.return_value = mock_args
+
+        with patch('builtins.print') as mock_print:
+            main()
+        self.assertTrue(mock_print.call_args[0][0].startswith(snapshot_id))
+
+        mock_args.list = False
+        mock_args.restore = os.path.join(self.test_dir, "restored")
+        main()
+        with open(os.path.join(self.test_dir, "restored", "test_vault", "test_note.md")) as f:
+            self.assertEqual(f.read(), "# Test Note")
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_git_snapshot(self, mock_parse_args):
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        mock_args.vault = self.vault_dir
+        mock_args.password = "testpassword"
+        mock_args.encrypt = False
+        mock_args.decrypt = False
+        mock_args.restore = None
+        mock_args.tui = False
+        mock_args.git_snapshot = "/path/to/snapshots.git"
+        mock_args.git_export = "/path/to/offsite.bundle.enc"
+        mock_parse_args.return_value = mock_args
+
+        with patch('obsidian_backuper.core.ObsidianBackuper') as mock_backuper:
+            main()
+
+            mock_backuper.return_value.create_git_snapshot.assert_called_once_with(
+                "/path/to/snapshots.git", export_path="/path/to/offsite.bundle.enc", password="testpassword"
+            )
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_watch(self, mock_parse_args):
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        mock_args.vault = self.vault_dir
+        mock_args.password = "testpassword"
+        mock_args.encrypt = False
+        mock_args.decrypt = False
+        mock_args.restore = None
+        mock_args.tui = False
+        mock_args.git_snapshot = None
+        mock_args.watch = True
+        mock_args.codec = "gzip"
+        mock_args.threads = None
+        mock_args.archive_format = "tar"
+        mock_args.debounce = 2.0
+        mock_args.catalog_files = True
+        mock_args.exclude = []
+        mock_args.include = []
+        mock_args.no_default_excludes = True
+        mock_args.compress_all = False
+        mock_args.zstd_dict = False
+        mock_args.cipher = "auto"
+        mock_args.keyfile = []
+        mock_parse_args.return_value = mock_args
+
+        with patch('obsidian_backuper.watch.VaultWatcher') as mock_watcher:
+            main()
+
+            backuper = mock_watcher.call_args[0][0]
+            self.assertEqual(backuper.vault_path, self.vault_dir)
+            self.assertEqual(mock_watcher.call_args[1]["debounce"], 2.0)
+            self.assertTrue(mock_watcher.call_args[1]["catalog_files"])
+            mock_watcher.return_value.run.assert_called_once_with()
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_verify(self, mock_parse_args):
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        mock_args.password = "testpassword"
+        mock_args.encrypt = False
+        mock_args.decrypt = False
+        mock_args.restore = None
+        mock_args.tui = False
+        mock_args.git_snapshot = None
+        mock_args.watch = False
+        mock_args.verify = ["/backups/a.tar.gz.enc", "/backups/b.tar.gz.enc"]
+        mock_args.verify_level = "auth"
+        mock_args.jobs = 2
+        mock_args.keyfile = []
+        mock_parse_args.return_value = mock_args
+
+        with patch('obsidian_backuper.verify.verify_archives') as mock_verify:
+            mock_verify.return_value = []
+            main()
+            mock_verify.assert_called_once_with(["/backups/a.tar.gz.enc", "/backups/b.tar.gz.enc"],
+                                                password="testpassword", level="auth", workers=2, keyfiles=[])
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_calibrate_ciphers(self, mock_parse_args):
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        for name in ("encrypt", "decrypt", "tui", "watch", "list", "prune"):
+            setattr(mock_args, name, False)
+        for name in ("restore", "git_snapshot", "verify", "find"):
+            setattr(mock_args, name, None)
+        mock_args.calibrate_ciphers = True
+        mock_parse_args.return_value = mock_args
+
+        with patch('obsidian_backuper.crypto.calibrate') as mock_calibrate, \
+                patch('builtins.print') as mock_print:
+            mock_calibrate.return_value = {"aes-256-gcm": 2000.0, "chacha20-poly1305": 900.0}
+            main()
+            mock_calibrate.assert_called_once_with(refresh=True)
+            self.assertIn("aes-256-gcm", mock_print.call_args[0][0])
+
+    @patch('obsidian_backuper.cli.argparse.ArgumentParser.parse_args')
+    def test_cli_prune(self, mock_parse_args):
+        mock_args = MagicMock()
+        mock_args.profile = False
+        mock_args.profile_json = None
+        mock_args.profile_dump = None
+        mock_args.vault = self.vault_dir
+        mock_args.backup_dir = None
+        mock_args.encrypt = False
+        mock_args.decrypt = False
+        mock_args.restore = None
+        mock_args.tui = False
+        mock_args.git_snapshot = None
+        mock_args.watch = False
+        mock_args.verify = None
+        mock_args.list = False
+        mock_args.find = None
+        mock_args.prune = True
+        mock_args.keep_hourly = 0
+        mock_args.keep_daily = 7
+        mock_args.dry_run = True
+        mock_parse_args.return_value = mock_args
+
+        with patch('obsidian_backuper.catalog.Catalog') as mock_catalog:
+            catalog = mock_catalog.return_value.__enter__.return_value
+            catalog.prune.return_value = []
+            main()
+
+            mock_catalog.assert_called_once_with(os.path.dirname(os.path.abspath(self.vault_dir)))
+            catalog.prune.assert_called_once_with(os.path.abspath(self.vault_dir), keep_hourly=0,
+                                                  keep_daily=7, dry_run=True)
+
+
+# Runs the CLI with the given arguments, then prints the loaded modules and
+# the cumulative import time of obsidian_backuper.cli (from -X importtime).
+STARTUP_SCRIPT = """
+import io, json, sys
+sys.argv = ["obsidian-backup"] + sys.argv[1:]
+import obsidian_backuper.cli
+sys.stderr = io.StringIO()
+try:
+    obsidian_backuper.cli.main()
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+"""
+# Generous for slow CI machines; importing Textual alone takes longer.
+CLI_IMPORT_BUDGET_US = 200_000
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+
+    def _run(self, *args):
+        src_dir = os.path.dirname(os.path.dirname(os.path.abspath(obsidian_backuper.__file__)))
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")]))}
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT, *args],
+                                cwd=self.test_dir, env=env, capture_output=True, text=True, timeout=120)
+        modules = set(json.loads(result.stdout.splitlines()[-1]))
+        cli_import = [line for line in result.stderr.splitlines() if line.endswith("| obsidian_backuper.cli")]
+        return modules, int(cli_import[0].split("|")[1])
+
+    def test_help_loads_no_heavy_modules(self):
+        modules, import_us = self._run("--help")
+        for heavy in ("textual", "cryptography", "dotenv", "tarfile", "sqlite3", "obsidian_backuper.core"):
+            self.assertNotIn(heavy, modules)
+        self.assertLess(import_us, CLI_IMPORT_BUDGET_US)
+
+    def test_encrypt_loads_only_what_it_uses(self):
+        vault = os.path.join(self.test_dir, "vault")
+        os.makedirs(vault)
+        with open(os.path.join(vault, "note.md"), "w") as f:
+            f.write("# Note")
+        modules, import_us = self._run("--encrypt", "--vault", vault, "--password", "startup",
+                                       "--cipher", "aes-256-gcm")
+        self.assertIn("cryptography", modules)
+        for unused in ("textual", "git", "obsidian_backuper.repository", "obsidian_backuper.git_snapshot"):
+            self.assertNotIn(unused, modules)
+        self.assertLess(import_us, CLI_IMPORT_BUDGET_US)
+        self.assertTrue(any(name.endswith(".tar.gz.enc") for name in os.listdir(self.test_dir)))
+
+    def test_parser_choices_match_implementations(self):
+        from obsidian_backuper import compression, crypto
+        from obsidian_backuper.options import CIPHER_NAMES, CODECS
+        self.assertEqual(set(CIPHER_NAMES), set(crypto.CIPHERS))
+        self.assertEqual(set(CODECS), set(compression.EXTENSIONS))
@@ -0,0 +1,107 @@
+import unittest
+import io
+import os
+import gzip
+from obsidian_backuper import compression
+from obsidian_backuper.exceptions import ConfigError
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.data = b"# Note\n\nSome repeated markdown content.\n" * 50_000 + os.urandom(10_000)
+
+    def _roundtrip(self, codec: str, **kwargs) -> bytes:
+        out = io.BytesIO()
+        writer = compression.open_writer(out, codec, **kwargs)
+        for i in range(0, len(self.data), 64 * 1024):
+            writer.write(self.data[i:i + 64 * 1024])
+        writer.close()
+        self.assertFalse(out.closed)
+        return out.getvalue()
+
+    def test_parallel_gzip_is_gunzip_compatible(self):
+        compressed = self._roundtrip("gzip", threads=4)
+        self.assertEqual(compression.detect_codec(compressed), "gzip")
+        self.assertLess(len(compressed), len(self.data))
+        self.assertEqual(gzip.decompress(compressed), self.data)
+
+        reader = compression.open_reader(io.BytesIO(compressed), "gzip")
+        self.assertEqual(reader.read(), self.data)
+
+    def test_single_threaded_gzip_matches_parallel(self):
+        self.assertEqual(self._roundtrip("gzip", threads=1), self._roundtrip("gzip", threads=3))
+
+    def test_empty_gzip_stream(self):
+        out = io.BytesIO()
+        compression.open_writer(out, "gzip").close()
+        self.assertEqual(gzip.decompress(out.getvalue()), b"")
+
+    def test_none_codec(self):
+        stored = self._roundtrip("none")
+        self.assertEqual(stored, self.data)
+        self.assertEqual(compression.open_reader(io.BytesIO(stored), "none").read(), self.data)
+
+    def test_zstd_codec(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard not installed")
+        compressed = self._roundtrip("zstd", threads=2)
+        self.assertEqual(compression.detect_codec(compressed), "zstd")
+        reader = compression.open_reader(io.BytesIO(compressed), "zstd")
+        self.assertEqual(reader.read(), self.data)
+
+    def test_is_compressible(self):
+        self.assertFalse(compression.is_compressible("attachments/photo.JPG", b"text" * 2000))
+        self.assertFalse(compression.is_compressible("notes/data.bin", os.urandom(compression.SAMPLE_SIZE)))
+        self.assertTrue(compression.is_compressible("notes/index.md", self.data[:compression.SAMPLE_SIZE]))
+        self.assertTrue(compression.is_compressible("tiny.bin", os.urandom(100)))
+        self.assertAlmostEqual(compression.sample_entropy(bytes(range(256)) * 4), 8.0)
+
+    def test_stored_gzip_members(self):
+        random_data = os.urandom(300_000)
+        out = io.BytesIO()
+        writer = compression.open_writer(out, "gzip", threads=2)
+        writer.write(self.data[:100_000])
+        self.assertTrue(compression.set_stored(writer, True))
+        writer.write(random_data)
+        self.assertFalse(compression.set_stored(writer, False))
+        writer.write(self.data[:100_000])
+        writer.close()
+        self.assertEqual(gzip.decompress(out.getvalue()), self.data[:100_000] + random_data + self.data[:100_000])
+        self.assertLess(len(out.getvalue()), len(random_data) + 20_000)
+
+    def test_dictionary_blocks(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard not installed")
+        self.assertIsNone(compression.train_dictionary([b"# Note"] * 3))
+        notes = [f"---\ntags: [daily]\n---\n# Day {i}\n\n- [[Project {i % 7}]] met {i * 37 % 101}\n".encode()
+                 for i in range(500)]
+        dictionary = compression.train_dictionary(notes)
+        self.assertGreaterEqual(len(dictionary), compression.MIN_DICT_SIZE)
+        block = compression.compress_block(notes[0], "zstd", dictionary=dictionary)
+        self.assertLess(len(block), len(compression.compress_block(notes[0], "zstd")))
+        self.assertEqual(compression.decompress_block(block, "zstd", dictionary=dictionary), notes[0])
+
+    def test_abort_writes_nothing_more(self):
+        codecs = ["gzip", "none"]
+        try:
+            import zstandard  # noqa: F401
+            codecs.append("zstd")
+        except ImportError:
+            pass
+        for codec in codecs:
+            with self.subTest(codec=codec):
+                out = io.BytesIO()
+                writer = compression.open_writer(out, codec, threads=2)
+                writer.write(self.data[:1000])
+                written = len(out.getvalue())
+                compression.abort_writer(writer)
+                self.assertTrue(writer.closed)
+                self.assertEqual(len(out.getvalue()), written)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ConfigError):
+            compression.open_writer(io.BytesIO(), "lz4")
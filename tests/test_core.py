@@ -2,10 +2,16 @@ import unittest
 import os
 import tempfile
 import shutil
+import random
 import tarfile
-from obsidian_backuper.core import ObsidianBackuper
-from obsidian_backuper.exceptions import VaultValidationError, ArchiveError, EncryptionError
+import threading
+from unittest.mock import patch
+from obsidian_backuper.core import ObsidianBackuper, PAX_CODEC
+from obsidian_backuper.exceptions import VaultValidationError, ArchiveError, EncryptionError, ConfigError
 from obsidian_backuper.crypto import CryptoVault
+from obsidian_backuper import compression
+from obsidian_backuper.manifest import Manifest, manifest_path_for
+from obsidian_backuper.catalog import CATALOG_NAME
 
 
 class TestObsidianBackuper(unittest.TestCase):
@@ -80,6 +86,28 @@ class TestObsidianBackuper(unittest.TestCase):
         os.unlink(backup_path)
         os.unlink(decrypted_path)
 
+    def test_backup_and_decrypt_report_progress(self):
+        events = []
+        backuper = ObsidianBackuper(self.vault_dir)
+        backup_path = backuper.create_backup(encrypt=True, password="testpassword123", progress=events.append)
+
+        last = events[-1]
+        self.assertTrue(last.finished)
+        self.assertEqual(last.phase, "backup")
+        self.assertEqual((last.files_scanned, last.files_done, last.files_total), (2, 2, 2))
+        self.assertEqual(last.bytes_read, last.bytes_total)
+        self.assertGreater(last.bytes_compressed, 0)
+        self.assertEqual(last.bytes_encrypted, os.path.getsize(backup_path))
+
+        events.clear()
+        output_dir = os.path.join(self.test_dir, "out")
+        os.makedirs(output_dir)
+        ObsidianBackuper(backup_path, require_directory=False).decrypt_backup(
+            output_dir, password="testpassword123", progress=events.append
+        )
+        self.assertEqual(events[-1].phase, "decrypt")
+        self.assertEqual(events[-1].bytes_read, os.path.getsize(backup_path))
+
     def test_create_backup_encrypted_no_password(self):
         backuper = ObsidianBackuper(self.vault_dir)
         with self.assertRaises(EncryptionError):
@@ -113,4 +141,238 @@ class TestObsidianBackuper(unittest.TestCase):
         with self.assertRaises(EncryptionError):
             file_backuper.decrypt_backup(password=wrong_password)
         
-        os.unlink(encrypted_path)
\ No newline at end of file
+        os.unlink(encrypted_path)
+
+    def test_create_backup_leaves_no_temporary_files(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        backup_path = backuper.create_backup(encrypt=True, password="testpassword123")
+
+        manifest_path = manifest_path_for(backup_path)
+        self.assertEqual(sorted(os.listdir(self.test_dir)),
+                         sorted(["test_vault", os.path.basename(backup_path),
+                                 os.path.basename(manifest_path), CATALOG_NAME]))
+        os.unlink(backup_path)
+        os.unlink(manifest_path)
+
+    def test_create_backup_failure_removes_partial_archive(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        with patch("tarfile.TarFile.add", side_effect=OSError("disk full")):
+            with self.assertRaises(ArchiveError):
+                backuper.create_backup(encrypt=True, password="testpassword123")
+
+        self.assertEqual(os.listdir(self.test_dir), ["test_vault"])
+
+    def test_failed_archive_releases_compressor_threads(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        threads = threading.active_count()
+        with patch.object(ObsidianBackuper, "_add_entry", side_effect=OSError("disk full")):
+            with patch("obsidian_backuper.compression.abort_writer",
+                       wraps=compression.abort_writer) as abort_writer:
+                with self.assertRaises(ArchiveError):
+                    backuper.create_backup(codec="gzip", threads=4)
+        abort_writer.assert_called_once()
+        self.assertTrue(abort_writer.call_args[0][0].closed)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_no_archive_name_exists_before_the_data_is_complete(self):
+        listings = []
+        write_archive = ObsidianBackuper._write_archive
+
+        def spy(backuper, *args, **kwargs):
+            listings.append(sorted(os.listdir(self.test_dir)))
+            write_archive(backuper, *args, **kwargs)
+
+        with patch.object(ObsidianBackuper, "_write_archive", spy):
+            first = self._backup_at("20260101_000000", encrypt=True, password="testpassword123")
+            second = self._backup_at("20260101_000000", encrypt=True, password="testpassword123")
+        self.assertEqual(os.path.basename(second), "obsidian_backup_20260101_000000_1.tar.gz.enc")
+        self.assertEqual([name for name in listings[0] if name.startswith("obsidian_backup_2")], [])
+        self.assertEqual(len([name for name in listings[1] if name.endswith(".part")]), 1)
+        self.assertNotIn(os.path.basename(second), listings[1])
+        self.assertTrue(os.path.getsize(first) > 0 and os.path.getsize(second) > 0)
+
+    def test_create_backup_codecs(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        backup_path = backuper.create_backup(encrypt=False, codec="none")
+        self.assertTrue(backup_path.endswith(".tar"))
+        with tarfile.open(backup_path, "r:") as tar:
+            self.assertIn("test_vault/test_note.md", tar.getnames())
+        os.unlink(backup_path)
+
+        password = "testpassword123"
+        backup_path = backuper.create_backup(encrypt=True, password=password, codec="gzip", threads=2)
+        with open(backup_path, "rb") as f:
+            reader = CryptoVault(password).reader(f)
+            self.assertEqual(reader.metadata["codec"], "gzip")
+            with tarfile.open(fileobj=compression.open_reader(reader, "gzip"), mode="r|") as tar:
+                self.assertIn("test_vault/subdir/another_note.md", tar.getnames())
+        os.unlink(backup_path)
+
+    def test_attachments_are_stored_uncompressed(self):
+        image = os.urandom(2 * 1024 * 1024)
+        with open(os.path.join(self.vault_dir, "photo.png"), "wb") as f:
+            f.write(image)
+        backup_path = ObsidianBackuper(self.vault_dir).create_backup(threads=1)
+        with tarfile.open(backup_path, "r:gz") as tar:
+            members = {member.name: member for member in tar.getmembers()}
+            self.assertEqual(members["test_vault/photo.png"].pax_headers.get(PAX_CODEC), "none")
+            self.assertNotIn(PAX_CODEC, members["test_vault/test_note.md"].pax_headers)
+            self.assertEqual(tar.extractfile("test_vault/photo.png").read(), image)
+        os.unlink(backup_path)
+
+        backup_path = ObsidianBackuper(self.vault_dir, adaptive_compression=False).create_backup(threads=1)
+        with tarfile.open(backup_path, "r:gz") as tar:
+            self.assertNotIn(PAX_CODEC, tar.getmember("test_vault/photo.png").pax_headers)
+
+    def test_zstd_archive_records_no_stored_entries(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard not installed")
+        with open(os.path.join(self.vault_dir, "photo.png"), "wb") as f:
+            f.write(os.urandom(2 * 1024 * 1024))
+        backup_path = ObsidianBackuper(self.vault_dir).create_backup(codec="zstd", threads=1)
+        with open(backup_path, "rb") as f, \
+                tarfile.open(fileobj=compression.open_reader(f, "zstd"), mode="r|") as tar:
+            headers = {member.name: member.pax_headers for member in tar}
+        self.assertNotIn(PAX_CODEC, headers["test_vault/photo.png"])
+        os.unlink(backup_path)
+
+    def test_adaptive_archive_not_larger_than_compress_all(self):
+        rng = random.Random(7)
+        words = ["note", "link", "daily", "project", "idea", "todo", "heading", "vault"]
+        for i in range(100):
+            folder = os.path.join(self.vault_dir, f"folder{i % 10}")
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, f"note{i}.md"), "w") as f:
+                f.write(f"# Note {i}\n\n" + " ".join(rng.choice(words) for _ in range(rng.randint(50, 500))))
+            with open(os.path.join(folder, f"icon{i}.png"), "wb") as f:
+                f.write(rng.randbytes(rng.randint(500, 12000)))
+            if i % 10 == 0:
+                with open(os.path.join(folder, f"photo{i}.jpg"), "wb") as f:
+                    f.write(rng.randbytes(100_000))
+
+        sizes = {}
+        for adaptive in (True, False):
+            path = ObsidianBackuper(self.vault_dir, adaptive_compression=adaptive).create_backup(threads=1)
+            sizes[adaptive] = os.path.getsize(path)
+            if adaptive:
+                with tarfile.open(path, "r:gz") as tar:
+                    self.assertNotIn(PAX_CODEC, tar.getmember("test_vault/folder0/icon0.png").pax_headers)
+                    self.assertEqual(tar.getmember("test_vault/folder0/photo0.jpg").pax_headers.get(PAX_CODEC),
+                                     "none")
+            os.unlink(path)
+            os.unlink(manifest_path_for(path))
+        self.assertLessEqual(sizes[True], sizes[False] * 1.01)
+
+    def test_create_backup_unknown_codec(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        with self.assertRaises(ConfigError):
+            backuper.create_backup(codec="rar")
+
+    def _backup_at(self, timestamp: str, **kwargs) -> str:
+        with patch("obsidian_backuper.core.datetime") as mock_datetime:
+            mock_datetime.now.return_value.strftime.return_value = timestamp
+            return ObsidianBackuper(self.vault_dir).create_backup(**kwargs)
+
+    def _read_tree(self, root: str) -> dict:
+        tree = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                with open(path) as f:
+                    tree[os.path.relpath(path, root)] = f.read()
+        return tree
+
+    def test_incremental_backup_and_restore_chain(self):
+        password = "testpassword123"
+        full = self._backup_at("20260101_000000", encrypt=True, password=password, incremental=True)
+        self.assertFalse(full.endswith("_incr.tar.gz.enc"))
+
+        with open(os.path.join(self.vault_dir, "test_note.md"), "w") as f:
+            f.write("# Test Note\n\nEdited after the first backup.")
+        os.makedirs(os.path.join(self.vault_dir, "Daily"))
+        with open(os.path.join(self.vault_dir, "Daily", "2026-01-02.md"), "w") as f:
+            f.write("New daily note")
+        first = self._backup_at("20260102_000000", encrypt=True, password=password, incremental=True)
+        self.assertTrue(first.endswith("_incr.tar.gz.enc"))
+
+        shutil.rmtree(os.path.join(self.vault_dir, "subdir"))
+        second = self._backup_at("20260103_000000", encrypt=True, password=password, incremental=True)
+
+        with open(second, "rb") as f:
+            reader = CryptoVault(password).reader(f)
+            with tarfile.open(fileobj=compression.open_reader(reader, "gzip"), mode="r|") as tar:
+                self.assertEqual(tar.getnames(), ["test_vault"])
+
+        restore_dir = os.path.join(self.test_dir, "restore")
+        restored = ObsidianBackuper(second, require_directory=False).restore_backup(restore_dir, password)
+        self.assertEqual(restored, os.path.join(restore_dir, "test_vault"))
+        self.assertEqual(self._read_tree(restored), self._read_tree(self.vault_dir))
+        self.assertFalse(os.path.exists(os.path.join(restored, "subdir")))
+
+    def test_restore_chain_with_type_changes(self):
+        for archive_format in ("tar", "indexed"):
+            with self.subTest(archive_format=archive_format):
+                vault = os.path.join(self.test_dir, archive_format, "vault")
+                os.makedirs(os.path.join(vault, "foo"))
+                with open(os.path.join(vault, "foo", "child.md"), "w") as f:
+                    f.write("child")
+                with open(os.path.join(vault, "bar"), "w") as f:
+                    f.write("bar as a file")
+                backuper = ObsidianBackuper(vault)
+                options = dict(encrypt=True, password="testpassword", archive_format=archive_format)
+                with patch("obsidian_backuper.core.datetime") as mock_datetime:
+                    mock_datetime.now.return_value.strftime.return_value = "20260101_000000"
+                    backuper.create_backup(**options)
+
+                    shutil.rmtree(os.path.join(vault, "foo"))
+                    with open(os.path.join(vault, "foo"), "w") as f:
+                        f.write("foo as a file")
+                    os.unlink(os.path.join(vault, "bar"))
+                    os.makedirs(os.path.join(vault, "bar"))
+                    with open(os.path.join(vault, "bar", "child.md"), "w") as f:
+                        f.write("bar child")
+                    mock_datetime.now.return_value.strftime.return_value = "20260102_000000"
+                    incremental = backuper.create_backup(incremental=True, **options)
+
+                restore_dir = os.path.join(self.test_dir, archive_format, "restore")
+                restored = ObsidianBackuper(incremental, require_directory=False).restore_backup(
+                    restore_dir, "testpassword"
+                )
+                self.assertEqual(self._read_tree(restored), {"foo": "foo as a file",
+                                                             os.path.join("bar", "child.md"): "bar child"})
+
+    def test_incremental_without_previous_backup_is_full(self):
+        backup_path = self._backup_at("20260101_000000", incremental=True)
+        with open(manifest_path_for(backup_path), "rb") as f:
+            manifest = Manifest.from_bytes(f.read())
+        self.assertEqual(manifest.kind, "full")
+        self.assertEqual(sorted(manifest.files), ["subdir/another_note.md", "test_note.md"])
+        self.assertTrue(all(entry.digest for entry in manifest.files.values()))
+
+    def test_manifest_rescan_only_reads_given_paths(self):
+        previous = Manifest.scan(self.vault_dir)
+        with open(os.path.join(self.vault_dir, "test_note.md"), "a") as f:
+            f.write("\nEdited.")
+        os.makedirs(os.path.join(self.vault_dir, "new", "deep"))
+        with open(os.path.join(self.vault_dir, "new", "deep", "note.md"), "w") as f:
+            f.write("new")
+        shutil.rmtree(os.path.join(self.vault_dir, "subdir"))
+
+        manifest = Manifest.rescan(previous, ["new/deep/note.md", "subdir"])
+        self.assertEqual(manifest.files["test_note.md"], previous.files["test_note.md"])
+        self.assertEqual(sorted(manifest.files), ["new/deep/note.md", "test_note.md"])
+        self.assertEqual(manifest.dirs, {"new", "new/deep"})
+        changed, deleted = manifest.diff(previous)
+        self.assertEqual(changed, ["new", "new/deep", "new/deep/note.md"])
+        self.assertEqual(deleted, ["subdir", "subdir/another_note.md"])
+
+    def test_restore_selected_paths_from_tar(self):
+        backup_path = ObsidianBackuper(self.vault_dir).create_backup(encrypt=False)
+        restore_dir = os.path.join(self.test_dir, "restore")
+        restored = ObsidianBackuper(backup_path, require_directory=False).restore_backup(
+            restore_dir, paths=["subdir/*.md"]
+        )
+        self.assertTrue(os.path.exists(os.path.join(restored, "subdir", "another_note.md")))
+        self.assertFalse(os.path.exists(os.path.join(restored, "test_note.md")))
@@ -1,10 +1,26 @@
 import unittest
 import os
+import shutil
 import tempfile
-from obsidian_backuper.crypto import CryptoVault
+from cryptography.fernet import Fernet
+import json
+from unittest.mock import patch
+from obsidian_backuper import crypto as crypto_module
+from obsidian_backuper.crypto import (
+    CryptoVault, kdf_params, clear_key_cache, generate_keyfile, read_key_area, rekey_file, _PREFIX, _KEY_AREA
+)
 from obsidian_backuper.exceptions import EncryptionError
 
 
+KEY_AREA_BYTES = _KEY_AREA.size + crypto_module.KEY_AREA_SIZE
+
+
+def writer_header(path):
+    with open(path, 'rb') as f:
+        prefix = f.read(_PREFIX.size)
+        return prefix + f.read(_PREFIX.unpack(prefix)[2])
+
+
 class TestCryptoVault(unittest.TestCase):
     def setUp(self):
         self.password = "securepassword123"
@@ -81,4 +97,196 @@ class TestCryptoVault(unittest.TestCase):
             f.write(b"xxxxx")
         
         with self.assertRaises(EncryptionError):
-            crypto.decrypt_file(self.encrypted_file, self.decrypted_file)
\ No newline at end of file
+            crypto.decrypt_file(self.encrypted_file, self.decrypted_file)
+
+    def _write_input(self, data: bytes):
+        with open(self.test_file.name, 'wb') as f:
+            f.write(data)
+
+    def test_encrypt_decrypt_multiple_segments(self):
+        data = os.urandom(100_000)
+        crypto = CryptoVault(self.password)
+        with open(self.encrypted_file, 'wb') as dst:
+            with crypto.writer(dst, segment_size=4096) as writer:
+                for i in range(0, len(data), 1000):
+                    writer.write(data[i:i + 1000])
+
+        crypto.decrypt_file(self.encrypted_file, self.decrypted_file)
+        with open(self.decrypted_file, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_parallel_segments_interoperate(self):
+        data = os.urandom(200_000)
+        crypto = CryptoVault(self.password)
+        for write_threads, read_threads in ((4, 1), (1, 4), (3, 3)):
+            with open(self.encrypted_file, 'wb') as dst:
+                with crypto.writer(dst, segment_size=4096, threads=write_threads) as writer:
+                    for i in range(0, len(data), 10_000):
+                        writer.write(data[i:i + 10_000])
+            self.assertEqual(os.path.getsize(self.encrypted_file) - len(data),
+                             len(writer_header(self.encrypted_file)) + KEY_AREA_BYTES + 49 * 16)
+            with open(self.encrypted_file, 'rb') as src:
+                with crypto.reader(src, threads=read_threads) as reader:
+                    self.assertEqual(reader.read(), data)
+
+        with open(self.encrypted_file, 'r+b') as f:
+            f.seek(-100_000, os.SEEK_END)
+            byte = f.read(1)
+            f.seek(-100_000, os.SEEK_END)
+            f.write(bytes([byte[0] ^ 1]))
+        with open(self.encrypted_file, 'rb') as src:
+            with self.assertRaises(EncryptionError):
+                crypto.reader(src, threads=4).read()
+
+    def test_encrypt_decrypt_empty_file(self):
+        self._write_input(b"")
+        crypto = CryptoVault(self.password)
+        crypto.encrypt_file(self.test_file.name, self.encrypted_file)
+        crypto.decrypt_file(self.encrypted_file, self.decrypted_file)
+        with open(self.decrypted_file, 'rb') as f:
+            self.assertEqual(f.read(), b"")
+
+    def test_decrypt_truncated_file(self):
+        self._write_input(os.urandom(20_000))
+        crypto = CryptoVault(self.password)
+        with open(self.test_file.name, 'rb') as src, open(self.encrypted_file, 'wb') as dst:
+            with crypto.writer(dst, segment_size=4096) as writer:
+                writer.write(src.read())
+
+        size = os.path.getsize(self.encrypted_file)
+        with open(self.encrypted_file, 'r+b') as f:
+            f.truncate(size - (20_000 % 4096 + 16))
+
+        with self.assertRaises(EncryptionError):
+            crypto.decrypt_file(self.encrypted_file, self.decrypted_file)
+        self.assertFalse(os.path.exists(self.decrypted_file))
+
+    def test_decrypt_legacy_fernet_file(self):
+        crypto = CryptoVault(self.password)
+        token = Fernet(crypto.key).encrypt(self.test_data)
+        with open(self.encrypted_file, 'wb') as f:
+            f.write(crypto.salt + token)
+
+        CryptoVault(self.password).decrypt_file(self.encrypted_file, self.decrypted_file)
+        with open(self.decrypted_file, 'rb') as f:
+            self.assertEqual(f.read(), self.test_data)
+
+    def _read_header(self) -> dict:
+        with open(self.encrypted_file, 'rb') as f:
+            _, _, meta_len = _PREFIX.unpack(f.read(_PREFIX.size))
+            return json.loads(f.read(meta_len))
+
+    def _read_recipients(self) -> list:
+        with open(self.encrypted_file, 'rb') as f:
+            f.seek(len(writer_header(self.encrypted_file)))
+            return read_key_area(f)[0]
+
+    def _assert_decrypts(self, crypto: CryptoVault):
+        crypto.decrypt_file(self.encrypted_file, self.decrypted_file)
+        with open(self.decrypted_file, 'rb') as f:
+            self.assertEqual(f.read(), self.test_data)
+
+    def _keyfile(self, name: str) -> str:
+        key_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, key_dir)
+        path = os.path.join(key_dir, name)
+        generate_keyfile(path)
+        return path
+
+    def test_kdf_parameters_in_header(self):
+        crypto = CryptoVault(self.password, kdf=kdf_params("scrypt", n=2 ** 10))
+        crypto.encrypt_file(self.test_file.name, self.encrypted_file)
+
+        self.assertNotIn("kdf", self._read_header())
+        kdf = self._read_recipients()[0]["kdf"]
+        self.assertEqual(kdf["name"], "scrypt")
+        self.assertEqual(kdf["n"], 2 ** 10)
+
+        clear_key_cache()
+        CryptoVault(self.password).decrypt_file(self.encrypted_file, self.decrypted_file)
+        with open(self.decrypted_file, 'rb') as f:
+            self.assertEqual(f.read(), self.test_data)
+
+    def test_multiple_recipients(self):
+        ops_key = self._keyfile("ops.key")
+        CryptoVault(self.password, keyfiles=[ops_key]).encrypt_file(self.test_file.name, self.encrypted_file)
+        self.assertEqual([entry["type"] for entry in self._read_recipients()], ["password", "keyfile"])
+
+        self._assert_decrypts(CryptoVault(self.password))
+        self._assert_decrypts(CryptoVault(keyfiles=[ops_key]))
+        with self.assertRaises(EncryptionError):
+            CryptoVault(keyfiles=[self._keyfile("other.key")]).decrypt_file(self.encrypted_file, self.decrypted_file)
+        with self.assertRaises(EncryptionError):
+            generate_keyfile(ops_key)
+
+    def test_rekey_in_place(self):
+        CryptoVault(self.password).encrypt_file(self.test_file.name, self.encrypted_file)
+        with open(self.encrypted_file, 'rb') as f:
+            original = f.read()
+
+        rekey_file(self.encrypted_file, CryptoVault(self.password), CryptoVault("newpassword"))
+        with open(self.encrypted_file, 'rb') as f:
+            rekeyed = f.read()
+        # Only the key area changed; the encrypted content is untouched.
+        key_area_end = len(writer_header(self.encrypted_file)) + KEY_AREA_BYTES
+        self.assertEqual(len(rekeyed), len(original))
+        self.assertEqual(rekeyed[key_area_end:], original[key_area_end:])
+        self.assertFalse(os.path.exists(self.encrypted_file + ".keyheader.bak"))
+
+        self._assert_decrypts(CryptoVault("newpassword"))
+        with self.assertRaises(EncryptionError):
+            CryptoVault(self.password).decrypt_file(self.encrypted_file, self.decrypted_file)
+        with self.assertRaises(EncryptionError):
+            rekey_file(self.encrypted_file, CryptoVault(self.password), CryptoVault("other"))
+
+    def test_rekey_keeping_existing_recipients(self):
+        ops_key = self._keyfile("ops.key")
+        CryptoVault(self.password).encrypt_file(self.test_file.name, self.encrypted_file)
+        rekey_file(self.encrypted_file, CryptoVault(self.password), CryptoVault(keyfiles=[ops_key]),
+                   keep_existing=True)
+        self._assert_decrypts(CryptoVault(self.password))
+        self._assert_decrypts(CryptoVault(keyfiles=[ops_key]))
+
+    def test_cipher_suites(self):
+        for cipher in crypto_module.CIPHERS:
+            CryptoVault(self.password, cipher=cipher).encrypt_file(self.test_file.name, self.encrypted_file)
+            self.assertEqual(self._read_header()["cipher"], cipher)
+            CryptoVault(self.password).decrypt_file(self.encrypted_file, self.decrypted_file)
+            with open(self.decrypted_file, 'rb') as f:
+                self.assertEqual(f.read(), self.test_data)
+        with self.assertRaises(EncryptionError):
+            CryptoVault(self.password, cipher="des")
+
+    def test_auto_cipher_is_calibrated_once_and_cached(self):
+        cache_dir = tempfile.mkdtemp()
+        speeds = {"aes-256-gcm": 100.0, "chacha20-poly1305": 900.0}
+        with patch.dict(os.environ, {"XDG_CACHE_HOME": cache_dir}), \
+                patch.object(crypto_module, "_auto_cipher", None), \
+                patch.object(crypto_module, "benchmark_ciphers", return_value=speeds) as benchmark:
+            self.assertEqual(CryptoVault(self.password, cipher="auto").cipher, "chacha20-poly1305")
+            self.assertEqual(CryptoVault(self.password, cipher="auto").cipher, "chacha20-poly1305")
+            self.assertEqual(crypto_module.calibrate(), speeds)
+            self.assertEqual(benchmark.call_count, 1)
+            self.assertTrue(os.path.exists(crypto_module.calibration_cache_path()))
+            crypto_module.calibrate(refresh=True)
+            self.assertEqual(benchmark.call_count, 2)
+        self.assertIn("(auto)", crypto_module.format_calibration(speeds).splitlines()[1])
+        shutil.rmtree(cache_dir)
+
+    def test_key_derivation_is_lazy_and_cached(self):
+        clear_key_cache()
+        with patch.object(crypto_module, "_run_kdf", wraps=crypto_module._run_kdf) as run_kdf:
+            crypto = CryptoVault(self.password)
+            self.assertEqual(run_kdf.call_count, 0)
+
+            crypto.encrypt_file(self.test_file.name, self.encrypted_file)
+            for _ in range(3):
+                CryptoVault(self.password).decrypt_file(self.encrypted_file, self.decrypted_file)
+            self.assertEqual(run_kdf.call_count, 1)
+
+            CryptoVault("otherpassword").encrypt_file(self.test_file.name, self.encrypted_file)
+            self.assertEqual(run_kdf.call_count, 2)
+
+    def test_unsupported_kdf(self):
+        with self.assertRaises(EncryptionError):
+            CryptoVault(self.password, kdf="md5")
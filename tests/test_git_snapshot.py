@@ -0,0 +1,84 @@
+import unittest
+import os
+import tempfile
+import shutil
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.git_snapshot import GitSnapshotRepository
+from obsidian_backuper.exceptions import ConfigError, EncryptionError
+
+
+class TestGitSnapshotRepository(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        os.makedirs(os.path.join(self.vault_dir, "Daily"))
+        self.write("index.md", "# Index\n")
+        self.write("Daily/monday.md", "Monday\n")
+        self.repo_dir = os.path.join(self.test_dir, "snapshots.git")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, rel, text):
+        with open(os.path.join(self.vault_dir, rel), "w") as f:
+            f.write(text)
+
+    def read_tree(self, root):
+        tree = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                with open(os.path.join(dirpath, name)) as f:
+                    tree[os.path.relpath(os.path.join(dirpath, name), root)] = f.read()
+        return tree
+
+    def test_snapshot_and_restore(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        first = backuper.create_git_snapshot(self.repo_dir)
+        self.assertIsNotNone(first)
+        self.assertIsNone(backuper.create_git_snapshot(self.repo_dir))
+        self.assertFalse(os.path.exists(os.path.join(self.vault_dir, ".git")))
+
+        self.write("index.md", "# Index\n\nEdited.\n")
+        os.unlink(os.path.join(self.vault_dir, "Daily", "monday.md"))
+        second = backuper.create_git_snapshot(self.repo_dir)
+
+        repository = GitSnapshotRepository(self.repo_dir)
+        self.assertEqual(repository.snapshots(), [second, first])
+
+        latest = repository.restore(os.path.join(self.test_dir, "latest"))
+        self.assertEqual(latest, os.path.join(self.test_dir, "latest", "vault"))
+        self.assertEqual(self.read_tree(latest), {"index.md": "# Index\n\nEdited.\n"})
+        old = repository.restore(os.path.join(self.test_dir, "old"), first)
+        self.assertEqual(self.read_tree(old), {"index.md": "# Index\n", "Daily/monday.md": "Monday\n"})
+
+    def test_encrypted_bundle_round_trip(self):
+        bundle = os.path.join(self.test_dir, "offsite.bundle.enc")
+        commit = ObsidianBackuper(self.vault_dir).create_git_snapshot(
+            self.repo_dir, export_path=bundle, password="bundlepassword"
+        )
+        with open(bundle, "rb") as f:
+            self.assertNotIn(b"git bundle", f.read())
+
+        with self.assertRaises(EncryptionError):
+            GitSnapshotRepository.import_bundle(bundle, "wrong", os.path.join(self.test_dir, "bad.git"))
+        imported = GitSnapshotRepository.import_bundle(bundle, "bundlepassword",
+                                                       os.path.join(self.test_dir, "imported.git"))
+        self.assertEqual(imported.snapshots(), [commit])
+        restored = imported.restore(os.path.join(self.test_dir, "restore"))
+        self.assertEqual(self.read_tree(restored), self.read_tree(self.vault_dir))
+
+    def test_gc_packs_objects(self):
+        repository = GitSnapshotRepository.init(self.repo_dir)
+        repository.snapshot(self.vault_dir)
+        repository.gc()
+        packs = os.listdir(os.path.join(self.repo_dir, "objects", "pack"))
+        self.assertTrue(any(name.endswith(".pack") for name in packs))
+
+    def test_repository_inside_vault_is_rejected(self):
+        repository = GitSnapshotRepository.init(os.path.join(self.vault_dir, ".snapshots"))
+        with self.assertRaises(ConfigError):
+            repository.snapshot(self.vault_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import os
+import tarfile
+import tempfile
+import shutil
+from unittest.mock import patch
+from obsidian_backuper import scanner
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.ignore import IGNORE_FILE, IgnoreRules
+from obsidian_backuper.manifest import Manifest
+from obsidian_backuper.exceptions import ConfigError
+
+
+class TestIgnoreRules(unittest.TestCase):
+    def test_gitignore_semantics(self):
+        rules = IgnoreRules([
+            "# comment",
+            "",
+            "*.tmp",
+            "/Attachments/*.pdf",
+            "cache/",
+            "Archive/**/old.md",
+            "!keep.tmp",
+        ])
+        self.assertTrue(rules.ignored("a.tmp"))
+        self.assertTrue(rules.ignored("deep/dir/a.tmp"))
+        self.assertFalse(rules.ignored("keep.tmp"))
+        self.assertTrue(rules.ignored("Attachments/paper.pdf"))
+        self.assertFalse(rules.ignored("Notes/Attachments/paper.pdf"))
+        self.assertTrue(rules.ignored("plugin/cache", is_dir=True))
+        self.assertFalse(rules.ignored("plugin/cache"))
+        self.assertTrue(rules.ignored("Archive/old.md"))
+        self.assertTrue(rules.ignored("Archive/2024/q1/old.md"))
+        self.assertFalse(rules.ignored("notes.md"))
+        self.assertTrue(rules.ignored_with_parents("plugin/cache/data.json"))
+
+    def test_last_match_wins_and_patterns_are_grouped(self):
+        rules = IgnoreRules(["*.md", "!Daily/*.md", "Daily/secret.md"])
+        self.assertTrue(rules.ignored("index.md"))
+        self.assertFalse(rules.ignored("Daily/monday.md"))
+        self.assertTrue(rules.ignored("Daily/secret.md"))
+        self.assertEqual(len(IgnoreRules(["a", "b", "c/"]).patterns), 3)
+        self.assertFalse(IgnoreRules(["# only a comment"]))
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(ConfigError):
+            IgnoreRules(["[z-a]"])
+
+
+class TestBackupExclusions(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        for rel, text in {
+            "index.md": "# Index\n",
+            ".obsidian/app.json": "{}",
+            ".obsidian/workspace.json": "{}",
+            ".obsidian/plugins/dev/node_modules/lib/index.js": "x" * 1000,
+            ".trash/deleted.md": "gone",
+            "Scratch/draft.tmp": "tmp",
+        }.items():
+            path = os.path.join(self.vault_dir, *rel.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def archived_files(self, archive):
+        with tarfile.open(archive) as tar:
+            return sorted(m.name.partition("/")[2] for m in tar.getmembers() if m.isfile())
+
+    def test_default_excludes_and_ignore_file(self):
+        with open(os.path.join(self.vault_dir, IGNORE_FILE), "w") as f:
+            f.write("*.tmp\n")
+        backuper = ObsidianBackuper(self.vault_dir)
+        archive = backuper.create_backup()
+        self.assertEqual(self.archived_files(archive), [".obsidian/app.json", IGNORE_FILE, "index.md"])
+        self.assertEqual((backuper.skipped.dirs, backuper.skipped.files), (2, 2))
+
+    def test_excluded_directories_are_not_walked(self):
+        walked = []
+        real_list_dir = scanner._list_dir
+
+        def recording_list_dir(path, rel_dir):
+            walked.append(rel_dir)
+            return real_list_dir(path, rel_dir)
+
+        with patch("obsidian_backuper.scanner._list_dir", recording_list_dir):
+            Manifest.scan(self.vault_dir, ignore=IgnoreRules.for_vault(self.vault_dir))
+        self.assertIn(".obsidian/plugins/dev", walked)
+        self.assertNotIn(".trash", walked)
+        self.assertFalse(any("node_modules" in path for path in walked))
+
+    def test_cli_style_include_and_no_defaults(self):
+        backuper = ObsidianBackuper(self.vault_dir, exclude=[".obsidian/"], include=[".trash/"])
+        self.assertEqual(self.archived_files(backuper.create_backup()),
+                         [".trash/deleted.md", "Scratch/draft.tmp", "index.md"])
+        everything = ObsidianBackuper(self.vault_dir, default_excludes=False).create_backup()
+        self.assertEqual(len(self.archived_files(everything)), 6)
+
+    def test_rescan_skips_excluded_changes(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        previous = Manifest.scan(self.vault_dir, ignore=backuper.ignore_rules())
+        manifest = Manifest.rescan(previous, [".trash/deleted.md", ".obsidian/plugins/dev/node_modules",
+                                              "index.md"], backuper.ignore_rules())
+        self.assertEqual(set(manifest.files), set(previous.files))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import os
+import random
+import shutil
+import tempfile
+from unittest.mock import patch
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.crypto import CryptoVault, generate_keyfile
+from obsidian_backuper.benchmark import VaultSpec, generate_vault
+from obsidian_backuper.indexed import DICT_CODEC, IndexedArchiveReader
+from obsidian_backuper.exceptions import ConfigError, EncryptionError
+
+
+class TestIndexedArchive(unittest.TestCase):
+    def setUp(self):
+        self.password = "indexedpassword"
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        os.makedirs(os.path.join(self.vault_dir, "Daily"))
+        os.makedirs(os.path.join(self.vault_dir, "attachments"))
+        for day in range(1, 31):
+            with open(os.path.join(self.vault_dir, "Daily", f"2026-10-{day:02d}.md"), "w") as f:
+                f.write(f"# 2026-10-{day:02d}\n\n- [[Project]] notes for day {day}\n")
+        with open(os.path.join(self.vault_dir, "Project.md"), "w") as f:
+            f.write("# Project")
+        self.attachment = random.Random(3).randbytes(3 * 1024 * 1024)
+        with open(os.path.join(self.vault_dir, "attachments", "scan.pdf"), "wb") as f:
+            f.write(self.attachment)
+        self.archive = ObsidianBackuper(self.vault_dir).create_backup(
+            encrypt=True, password=self.password, archive_format="indexed"
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_full_restore(self):
+        restore_dir = os.path.join(self.test_dir, "restore")
+        restored = ObsidianBackuper(self.archive, require_directory=False).restore_backup(
+            restore_dir, password=self.password
+        )
+        self.assertEqual(restored, os.path.join(restore_dir, "vault"))
+        with open(os.path.join(restored, "attachments", "scan.pdf"), "rb") as f:
+            self.assertEqual(f.read(), self.attachment)
+        self.assertEqual(len(os.listdir(os.path.join(restored, "Daily"))), 30)
+
+    def test_single_note_restore_reads_only_needed_blocks(self):
+        restore_dir = os.path.join(self.test_dir, "restore")
+        with IndexedArchiveReader(self.archive, CryptoVault(self.password)) as reader:
+            self.assertGreater(len(reader.blocks), 2)
+            with patch.object(reader, "_open", wraps=reader._open) as opened:
+                restored = reader.extract(restore_dir, ["Daily/2026-10-1*.md"])
+                self.assertEqual(opened.call_count, 1)
+
+        self.assertEqual(len(restored), 10)
+        with open(os.path.join(restore_dir, "vault", "Daily", "2026-10-15.md")) as f:
+            self.assertIn("notes for day 15", f.read())
+        self.assertFalse(os.path.exists(os.path.join(restore_dir, "vault", "attachments")))
+
+    def test_attachments_are_stored_uncompressed(self):
+        with IndexedArchiveReader(self.archive, CryptoVault(self.password)) as reader:
+            entry = reader.find(["attachments/scan.pdf"])[0]
+            self.assertEqual(entry["codec"], "none")
+            self.assertEqual({reader.blocks[block][2] for block, _, _ in entry["extents"]}, {"none"})
+            note = reader.find(["Project.md"])[0]
+            self.assertNotIn("codec", note)
+            self.assertEqual(reader.blocks[note["extents"][0][0]][2], "gzip")
+            self.assertEqual(reader.read_file(entry), self.attachment)
+            self.assertEqual(reader.read_file(note), b"# Project")
+
+    def test_trained_dictionary(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest("zstandard not installed")
+        generate_vault(os.path.join(self.vault_dir, "Generated"), VaultSpec(notes=300, note_size=2048, attachments=0))
+        backuper = ObsidianBackuper(self.vault_dir, zstd_dictionary=True)
+        archive = backuper.create_backup(encrypt=True, password=self.password, codec="zstd",
+                                         archive_format="indexed")
+        with open(archive, "rb") as f:
+            self.assertNotIn(b"[[Project]]", f.read())
+        with IndexedArchiveReader(archive, CryptoVault(self.password)) as reader:
+            self.assertIn(DICT_CODEC, {codec for _, _, codec in reader.blocks})
+        restored = os.path.join(self.test_dir, "restored")
+        ObsidianBackuper(archive, require_directory=False).restore_backup(restored, password=self.password,
+                                                                          paths=["Daily/2026-10-07.md"])
+        with open(os.path.join(restored, "vault", "Daily", "2026-10-07.md")) as f:
+            self.assertIn("notes for day 7", f.read())
+
+        with self.assertRaises(ConfigError):
+            backuper.create_backup(encrypt=True, password=self.password, codec="gzip", archive_format="indexed")
+
+    def test_chacha20_archive(self):
+        archive = ObsidianBackuper(self.vault_dir, cipher="chacha20-poly1305").create_backup(
+            encrypt=True, password=self.password, archive_format="indexed")
+        with IndexedArchiveReader(archive, CryptoVault(self.password)) as reader:
+            self.assertEqual(reader.read_file(reader.find(["Project.md"])[0]), b"# Project")
+
+    def test_rekey_with_keyfile(self):
+        keyfile = os.path.join(self.test_dir, "ops.key")
+        generate_keyfile(keyfile)
+        size = os.path.getsize(self.archive)
+        ObsidianBackuper(self.archive, require_directory=False).rekey_backup(
+            password=self.password, new_password="newpassword", new_keyfiles=[keyfile])
+        self.assertEqual(os.path.getsize(self.archive), size)
+
+        with self.assertRaises(EncryptionError):
+            IndexedArchiveReader(self.archive, CryptoVault(self.password))
+        restored = ObsidianBackuper(self.archive, require_directory=False, keyfiles=[keyfile]).restore_backup(
+            os.path.join(self.test_dir, "restore"))
+        with open(os.path.join(restored, "Project.md")) as f:
+            self.assertEqual(f.read(), "# Project")
+        with IndexedArchiveReader(self.archive, CryptoVault("newpassword")) as reader:
+            self.assertEqual(reader.read_file(reader.find(["Project.md"])[0]), b"# Project")
+
+    def test_wrong_password(self):
+        with self.assertRaises(EncryptionError):
+            IndexedArchiveReader(self.archive, CryptoVault("wrongpassword"))
+
+    def test_indexed_requires_encryption(self):
+        with self.assertRaises(ConfigError):
+            ObsidianBackuper(self.vault_dir).create_backup(encrypt=False, archive_format="indexed")
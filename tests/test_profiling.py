@@ -0,0 +1,78 @@
+import unittest
+import os
+import json
+import pstats
+import shutil
+import tempfile
+import threading
+from obsidian_backuper import profiling
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.profiling import profile, span
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_disabled_span_is_shared_no_op(self):
+        self.assertIs(span("scan"), span("encrypt", bytes=10))
+        with span("scan") as timer:
+            timer.add(bytes=1, files=1)
+        self.assertIsNone(profiling._profiler)
+
+    def test_spans_are_summed_and_nested(self):
+        with profile() as profiler:
+            with span("outer", files=2) as timer:
+                for _ in range(3):
+                    with span("inner", bytes=10):
+                        pass
+                timer.add(bytes=5)
+            worker = threading.Thread(target=lambda: span("inner", bytes=1).__enter__().__exit__())
+            worker.start()
+            worker.join()
+        stats = {stats.name: stats for stats in profiler.spans()}
+        self.assertEqual((stats["outer"].depth, stats["outer"].calls), (0, 1))
+        self.assertEqual(stats["inner"].parent, "outer")
+        self.assertEqual((stats["outer"].bytes, stats["outer"].files), (5, 2))
+        self.assertEqual((stats["inner"].depth, stats["inner"].calls, stats["inner"].bytes), (1, 4, 31))
+        self.assertGreaterEqual(profiler.wall_s, stats["outer"].wall_s)
+        self.assertIn("\n  inner", profiler.format())
+        self.assertIsNone(profiling._profiler)
+
+    def test_nested_profiles_are_rejected(self):
+        with profile():
+            with self.assertRaises(RuntimeError):
+                with profile():
+                    pass
+
+    def test_backup_phases_and_reports(self):
+        vault = os.path.join(self.test_dir, "vault")
+        os.makedirs(vault)
+        for i in range(5):
+            with open(os.path.join(vault, f"note{i}.md"), "w") as f:
+                f.write(f"# Note {i}\n" * 100)
+        json_path = os.path.join(self.test_dir, "profile.json")
+        dump_path = os.path.join(self.test_dir, "profile.prof")
+
+        with profile(json_path, dump_path):
+            ObsidianBackuper(vault).create_backup(encrypt=True, password="profiling password")
+
+        with open(json_path) as f:
+            report = json.load(f)
+        self.assertEqual(report["version"], profiling.REPORT_VERSION)
+        spans = {entry["name"]: entry for entry in report["spans"]}
+        for name in ("scan", "read", "compress", "encrypt", "kdf", "archive", "sync", "manifest", "catalog"):
+            self.assertIn(name, spans)
+        self.assertEqual(spans["scan"]["files"], 5)
+        self.assertEqual(spans["read"]["files"], 5)
+        self.assertEqual(spans["archive"]["bytes"], spans["read"]["bytes"])
+        self.assertEqual(spans["sync"]["depth"], 1)
+        self.assertGreater(spans["archive"]["wall_s"], 0)
+        self.assertIn("create_backup", str(pstats.Stats(dump_path).stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import io
+from unittest.mock import patch
+from obsidian_backuper.progress import Progress, ProgressEvent, CountingWriter, format_progress
+
+
+class TestProgress(unittest.TestCase):
+    def test_callback_is_throttled(self):
+        events = []
+        with patch("obsidian_backuper.progress.time.monotonic", return_value=10.0):
+            progress = Progress(events.append, interval=1.0)
+            progress.start("backup", bytes_total=100, files_total=2)
+            for _ in range(10):
+                progress.add(read=5)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(progress.bytes_read, 50)
+
+        with patch("obsidian_backuper.progress.time.monotonic", return_value=11.5):
+            progress.add(read=50, files=2)
+            progress.finish()
+        self.assertEqual(len(events), 3)
+        last = events[-1]
+        self.assertTrue(last.finished)
+        self.assertEqual((last.bytes_read, last.files_done), (100, 2))
+        self.assertEqual(last.fraction, 1.0)
+
+    def test_without_callback_only_counts(self):
+        progress = Progress()
+        progress.add(read=3, compressed=2, encrypted=1)
+        self.assertEqual((progress.bytes_read, progress.bytes_compressed, progress.bytes_encrypted), (3, 2, 1))
+
+    def test_event_throughput_and_eta(self):
+        event = ProgressEvent("backup", 0, 1, 4, 50, 200, 20, 30, elapsed=2.0)
+        self.assertEqual(event.throughput, 25.0)
+        self.assertEqual(event.eta, 6.0)
+        self.assertIsNone(event._replace(bytes_read=0).eta)
+        self.assertIn("1/4 files", format_progress(event))
+        self.assertIn("ETA 6s", format_progress(event))
+
+    def test_counting_writer(self):
+        dst = io.BytesIO()
+        progress = Progress()
+        writer = CountingWriter(dst, progress, "compressed")
+        writer.write(b"abc")
+        writer.close()
+        self.assertFalse(dst.closed)
+        self.assertEqual(progress.bytes_compressed, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
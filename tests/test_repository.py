@@ -0,0 +1,123 @@
+import unittest
+import io
+import os
+import random
+import shutil
+import tempfile
+from unittest.mock import patch
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper import repository as repository_module
+from obsidian_backuper.repository import Repository, iter_chunks, CHUNKS_DIR
+from obsidian_backuper.exceptions import EncryptionError, ArchiveError
+
+
+class TestChunking(unittest.TestCase):
+    def setUp(self):
+        self.data = random.Random(42).randbytes(8 * 1024 * 1024)
+
+    def test_chunks_reassemble(self):
+        chunks = list(iter_chunks(io.BytesIO(self.data), min_size=4096, max_size=256 * 1024))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b"".join(chunks), self.data)
+        self.assertTrue(all(len(chunk) <= 256 * 1024 for chunk in chunks))
+
+    def test_boundaries_survive_insertion(self):
+        original = list(iter_chunks(io.BytesIO(self.data)))
+        shifted = list(iter_chunks(io.BytesIO(b"inserted" + self.data)))
+        self.assertGreater(len(original), 2)
+        self.assertEqual(set(original[1:]), set(shifted[1:]))
+
+    def test_small_input_is_single_chunk(self):
+        self.assertEqual(list(iter_chunks(io.BytesIO(b"# Note"))), [b"# Note"])
+        self.assertEqual(list(iter_chunks(io.BytesIO(b""))), [])
+
+
+class TestRepository(unittest.TestCase):
+    def setUp(self):
+        self.password = "repopassword"
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        self.repo_dir = os.path.join(self.test_dir, "repo")
+        os.makedirs(os.path.join(self.vault_dir, "attachments"))
+        with open(os.path.join(self.vault_dir, "note.md"), "w") as f:
+            f.write("# Note\n\n[[attachment]]")
+        with open(os.path.join(self.vault_dir, "attachments", "scan.pdf"), "wb") as f:
+            f.write(random.Random(7).randbytes(3 * 1024 * 1024))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _chunk_count(self) -> int:
+        return sum(len(files) for _, _, files in os.walk(os.path.join(self.repo_dir, CHUNKS_DIR)))
+
+    def test_snapshot_and_restore(self):
+        snapshot_id = ObsidianBackuper(self.vault_dir).create_snapshot(self.repo_dir, self.password)
+
+        repository = Repository(self.repo_dir, self.password)
+        self.assertEqual(repository.snapshot_ids(), [snapshot_id])
+        restored = repository.restore(snapshot_id, os.path.join(self.test_dir, "restore"))
+        for rel in ("note.md", os.path.join("attachments", "scan.pdf")):
+            with open(os.path.join(self.vault_dir, rel), "rb") as a, open(os.path.join(restored, rel), "rb") as b:
+                self.assertEqual(a.read(), b.read())
+
+    def test_snapshot_follows_exclusion_rules(self):
+        os.makedirs(os.path.join(self.vault_dir, ".trash"))
+        with open(os.path.join(self.vault_dir, ".trash", "old.md"), "w") as f:
+            f.write("# Deleted note")
+        with open(os.path.join(self.vault_dir, "draft.tmp"), "w") as f:
+            f.write("scratch")
+        snapshot_id = ObsidianBackuper(self.vault_dir, exclude=["*.tmp"]).create_snapshot(self.repo_dir, self.password)
+
+        snapshot = Repository(self.repo_dir, self.password).load_snapshot(snapshot_id)
+        self.assertEqual([entry["path"] for entry in snapshot["files"]], ["attachments/scan.pdf", "note.md"])
+        self.assertEqual(snapshot["dirs"], ["attachments"])
+
+    def test_unchanged_attachments_are_stored_once(self):
+        repository = Repository.init(self.repo_dir, self.password)
+        repository.backup(self.vault_dir)
+        chunks_after_first = self._chunk_count()
+
+        with open(os.path.join(self.vault_dir, "note.md"), "a") as f:
+            f.write("\nEdited")
+        shutil.copy(os.path.join(self.vault_dir, "attachments", "scan.pdf"),
+                    os.path.join(self.vault_dir, "attachments", "copy.pdf"))
+        repository.backup(self.vault_dir)
+
+        self.assertEqual(self._chunk_count(), chunks_after_first + 1)
+        self.assertEqual(len(repository.snapshot_ids()), 2)
+
+    def test_chunks_are_synced_before_the_snapshot(self):
+        repository = Repository.init(self.repo_dir, self.password)
+        events = []
+        fsync, write_atomic = repository_module._fsync, repository_module._write_atomic
+
+        def record_fsync(path):
+            events.append(("fsync", path))
+            fsync(path)
+
+        def record_write(path, data, sync=True):
+            events.append(("write", path, sync))
+            write_atomic(path, data, sync)
+
+        with patch.object(repository_module, "_fsync", record_fsync), \
+                patch.object(repository_module, "_write_atomic", record_write):
+            repository.backup(self.vault_dir)
+
+        snapshot_write = next(i for i, event in enumerate(events) if event[0] == "write" and event[2])
+        synced = {event[1] for event in events[:snapshot_write] if event[0] == "fsync"}
+        chunk_files = {os.path.join(dirpath, name)
+                       for dirpath, _, names in os.walk(os.path.join(self.repo_dir, CHUNKS_DIR)) for name in names}
+        self.assertTrue(chunk_files)
+        self.assertLessEqual(chunk_files, synced)
+        self.assertIn(os.path.join(self.repo_dir, CHUNKS_DIR), synced)
+        self.assertEqual(repository._unsynced_chunks, [])
+
+    def test_wrong_password(self):
+        Repository.init(self.repo_dir, self.password)
+        with self.assertRaises(EncryptionError):
+            Repository(self.repo_dir, "wrongpassword")
+
+    def test_unknown_snapshot(self):
+        repository = Repository.init(self.repo_dir, self.password)
+        with self.assertRaises(ArchiveError):
+            repository.load_snapshot("../config")
@@ -0,0 +1,99 @@
+import unittest
+import io
+import os
+import tempfile
+import shutil
+import tarfile
+from unittest.mock import patch
+from obsidian_backuper import restore
+from obsidian_backuper.restore import TarStreamExtractor
+from obsidian_backuper.exceptions import ArchiveError
+
+
+def build_tar(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for info, data in members:
+            tar.addfile(info, io.BytesIO(data) if data is not None else None)
+    buf.seek(0)
+    return buf
+
+
+def file_member(name, data, mtime=1700000000):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = mtime
+    info.mode = 0o644
+    return info, data
+
+
+def dir_member(name, mtime=1700000000):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE
+    info.mode = 0o755
+    info.mtime = mtime
+    return info, None
+
+
+class TestTarStreamExtractor(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def extract(self, members, **kwargs):
+        with tarfile.open(fileobj=build_tar(members), mode="r|") as tar:
+            return TarStreamExtractor(self.test_dir, **kwargs).extract(tar)
+
+    def test_small_and_large_files(self):
+        large = os.urandom(restore.SMALL_FILE_SIZE + 1)
+        notes = [file_member(f"vault/notes/{i}.md", f"note {i}".encode(), mtime=1600000000 + i)
+                 for i in range(50)]
+        count = self.extract([dir_member("vault"), dir_member("vault/notes", mtime=1500000000),
+                              *notes, file_member("vault/big.bin", large)], workers=4)
+        self.assertEqual(count, 53)
+        for i in range(50):
+            path = os.path.join(self.test_dir, "vault", "notes", f"{i}.md")
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), f"note {i}".encode())
+            self.assertEqual(os.stat(path).st_mtime, 1600000000 + i)
+        with open(os.path.join(self.test_dir, "vault", "big.bin"), "rb") as f:
+            self.assertEqual(f.read(), large)
+        self.assertEqual(os.stat(os.path.join(self.test_dir, "vault", "notes")).st_mtime, 1500000000)
+
+    def test_filters_paths(self):
+        count = self.extract([file_member("vault/a.md", b"a"), file_member("vault/b.txt", b"b")],
+                             paths=["*.md"])
+        self.assertEqual(count, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "vault", "a.md")))
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "vault", "b.txt")))
+
+    def test_rejects_path_traversal(self):
+        with self.assertRaises(ArchiveError):
+            self.extract([file_member("vault/../../evil.md", b"x")])
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(self.test_dir), "evil.md")))
+
+    def test_rejects_absolute_symlink(self):
+        link = tarfile.TarInfo("vault/link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        with self.assertRaises(ArchiveError):
+            self.extract([(link, None)])
+
+    def test_symlink_waits_for_queued_writes(self):
+        link = tarfile.TarInfo("vault/link.md")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "note.md"
+        self.extract([file_member("vault/note.md", b"text"), (link, None)])
+        with open(os.path.join(self.test_dir, "vault", "link.md"), "rb") as f:
+            self.assertEqual(f.read(), b"text")
+
+    def test_writer_error_propagates(self):
+        with patch("obsidian_backuper.restore._write_file", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.extract([file_member("vault/a.md", b"a")])
+
+
+if __name__ == "__main__":
+    unittest.main()
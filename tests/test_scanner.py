@@ -0,0 +1,74 @@
+import unittest
+import os
+import tarfile
+import tempfile
+import shutil
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.manifest import new_hasher
+from obsidian_backuper.scanner import make_tarinfo, read_ahead, scan_tree
+from obsidian_backuper.exceptions import ArchiveError
+
+
+class TestScanner(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        for i in range(30):
+            path = os.path.join(self.vault_dir, f"Folder{i % 4}", f"Sub{i % 3}", f"note{i}.md")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(f"note {i}\n" * (i + 1))
+        os.symlink("Folder0", os.path.join(self.vault_dir, "link"))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_scan_matches_walk(self):
+        result = scan_tree(self.vault_dir, workers=4)
+        expected_dirs, expected_files = set(), set()
+        for dirpath, dirnames, filenames in os.walk(self.vault_dir):
+            rel_dir = os.path.relpath(dirpath, self.vault_dir).replace(os.sep, "/")
+            prefix = "" if rel_dir == "." else rel_dir + "/"
+            for name in dirnames:
+                (expected_files if os.path.islink(os.path.join(dirpath, name)) else expected_dirs).add(prefix + name)
+            expected_files.update(prefix + name for name in filenames)
+        self.assertEqual(set(result.dirs), expected_dirs)
+        self.assertEqual(set(result.files), expected_files)
+        self.assertEqual(set(scan_tree(self.vault_dir, "Folder1").files),
+                         {rel for rel in expected_files if rel.startswith("Folder1/")})
+        with self.assertRaises(ArchiveError):
+            scan_tree(self.vault_dir, "missing")
+
+    def test_tarinfo_matches_gettarinfo(self):
+        with tarfile.open(os.path.join(self.test_dir, "out.tar"), "w") as tar:
+            for rel in ("Folder0", "Folder0/Sub0/note0.md", "link"):
+                full = os.path.join(self.vault_dir, *rel.split("/"))
+                st = os.lstat(full)
+                linkname = os.readlink(full) if os.path.islink(full) else ""
+                ours = make_tarinfo(f"vault/{rel}", st, linkname)
+                theirs = tar.gettarinfo(full, arcname=f"vault/{rel}")
+                self.assertEqual(ours.tobuf(tarfile.PAX_FORMAT), theirs.tobuf(tarfile.PAX_FORMAT))
+
+    def test_read_ahead_keeps_order(self):
+        paths = []
+        for i in range(30):
+            path = os.path.join(self.vault_dir, f"Folder{i % 4}", f"Sub{i % 3}", f"note{i}.md")
+            paths.append((path, os.path.getsize(path)))
+        results = [future.result() for future in read_ahead(paths, new_hasher, workers=3, max_in_flight=100)]
+        self.assertEqual([data for data, _ in results], [f"note {i}\n".encode() * (i + 1) for i in range(30)])
+        hasher = new_hasher()
+        hasher.update(results[0][0])
+        self.assertEqual(results[0][1], hasher.hexdigest())
+
+    def test_archives_are_deterministic(self):
+        backuper = ObsidianBackuper(self.vault_dir)
+        first = backuper.create_backup(codec="none")
+        with open(first, "rb") as f:
+            first_bytes = f.read()
+        os.unlink(first)
+        with open(backuper.create_backup(codec="none"), "rb") as f:
+            self.assertEqual(f.read(), first_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import tempfile
+import shutil
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.crypto import CryptoVault
+from obsidian_backuper.manifest import manifest_path_for
+from obsidian_backuper.verify import LEVELS, verify_archive, verify_archives
+from obsidian_backuper.exceptions import ConfigError
+
+
+class TestVerify(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        os.makedirs(os.path.join(self.vault_dir, "Daily"))
+        self.write("index.md", "# Index\n")
+        self.write("Daily/monday.md", "Monday\n" * 1000)
+        self.backuper = ObsidianBackuper(self.vault_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, rel, text):
+        with open(os.path.join(self.vault_dir, rel), "w") as f:
+            f.write(text)
+
+    def backup_dir_listing(self):
+        return sorted(os.listdir(self.test_dir))
+
+    def test_intact_archives_pass_every_level(self):
+        archives = [
+            self.backuper.create_backup(encrypt=True, password="pw"),
+            self.backuper.create_backup(encrypt=True, password="pw", codec="none"),
+            self.backuper.create_backup(encrypt=True, password="pw", archive_format="indexed"),
+        ]
+        listing = self.backup_dir_listing()
+        for archive in archives:
+            for level in LEVELS:
+                result = verify_archive(archive, "pw", level)
+                self.assertTrue(result.ok, (archive, level, result.errors))
+        result = verify_archive(archives[0], "pw")
+        self.assertEqual(result.files_checked, 2)
+        self.assertEqual(result.bytes_checked, len("# Index\n") + len("Monday\n" * 1000))
+        self.assertEqual(self.backup_dir_listing(), listing)
+
+    def test_vault_with_symlink(self):
+        os.symlink("index.md", os.path.join(self.vault_dir, "link.md"))
+        for archive_format in ("tar", "indexed"):
+            archive = self.backuper.create_backup(encrypt=True, password="pw", archive_format=archive_format)
+            result = verify_archive(archive, "pw")
+            self.assertTrue(result.ok, (archive_format, result.errors))
+            self.assertEqual(result.files_checked, 2)
+
+    def test_unencrypted_and_incremental_archives(self):
+        full = self.backuper.create_backup()
+        self.write("index.md", "# Index\n\nEdited.\n")
+        incremental = self.backuper.create_backup(incremental=True)
+        for result in verify_archives([full, incremental]):
+            self.assertTrue(result.ok, result.errors)
+        self.assertEqual(verify_archive(incremental).files_checked, 1)
+
+        os.unlink(full)
+        result = verify_archive(incremental)
+        self.assertFalse(result.ok)
+        self.assertIn("missing", result.errors[0])
+
+    def test_tampered_archive_fails_authentication(self):
+        archive = self.backuper.create_backup(encrypt=True, password="pw")
+        with open(archive, "r+b") as f:
+            f.seek(-20, os.SEEK_END)
+            byte = f.read(1)
+            f.seek(-20, os.SEEK_END)
+            f.write(bytes([byte[0] ^ 1]))
+        result = verify_archive(archive, "pw", "auth")
+        self.assertFalse(result.ok)
+        self.assertFalse(verify_archive(self.backuper.create_backup(encrypt=True, password="pw"), "wrong").ok)
+
+    def test_content_mismatch_with_manifest(self):
+        archive = self.backuper.create_backup(encrypt=True, password="pw")
+        crypto = CryptoVault("pw")
+        manifest_path = manifest_path_for(archive)
+        manifest = self.backuper.read_manifest(manifest_path, crypto)
+        manifest.files["index.md"] = manifest.files["index.md"]._replace(digest="0" * 64)
+        with open(manifest_path, "wb") as f:
+            self.backuper._write_manifest(f, manifest, crypto)
+
+        self.assertTrue(verify_archive(archive, "pw", "tar").ok)
+        result = verify_archive(archive, "pw")
+        self.assertEqual(result.errors, ["index.md: content does not match the manifest hash"])
+
+    def test_unknown_level(self):
+        with self.assertRaises(ConfigError):
+            verify_archive("missing.tar.gz.enc", "pw", "everything")
+
+
+if __name__ == "__main__":
+    unittest.main()
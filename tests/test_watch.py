@@ -0,0 +1,199 @@
+import unittest
+import os
+import tarfile
+import tempfile
+import shutil
+from obsidian_backuper.core import ObsidianBackuper
+from obsidian_backuper.watch import ChangeWatcher, InotifyWatcher, PollingWatcher, VaultWatcher
+from obsidian_backuper.crypto import CryptoVault
+from obsidian_backuper.ignore import IgnoreRules
+from obsidian_backuper import compression
+
+
+class FakeWatcher(ChangeWatcher):
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.closed = False
+
+    def poll(self, timeout):
+        return self.batches.pop(0) if self.batches else set()
+
+    def close(self):
+        self.closed = True
+
+
+def archive_members(path, password):
+    with open(path, "rb") as f:
+        reader = CryptoVault(password).reader(f)
+        with tarfile.open(fileobj=compression.open_reader(reader, reader.metadata["codec"]), mode="r|") as tar:
+            return [member.name for member in tar]
+
+
+class TestVaultWatcher(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.vault_dir = os.path.join(self.test_dir, "vault")
+        os.makedirs(os.path.join(self.vault_dir, "Daily"))
+        for rel in ("index.md", "Daily/monday.md"):
+            with open(os.path.join(self.vault_dir, rel), "w") as f:
+                f.write(f"# {rel}")
+        self.password = "watchpassword"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, rel, text):
+        path = os.path.join(self.vault_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+
+    def test_debounce(self):
+        watcher = VaultWatcher(ObsidianBackuper(self.vault_dir), self.password, debounce=5, max_delay=20)
+        watcher.record({"a.md"}, now=100)
+        self.assertFalse(watcher.due(now=104))
+        watcher.record({"b.md"}, now=104)
+        self.assertFalse(watcher.due(now=108))
+        self.assertTrue(watcher.due(now=109))
+        for now in range(110, 120, 2):
+            watcher.record({"c.md"}, now=now)
+        self.assertTrue(watcher.due(now=120))
+        self.assertEqual(watcher.dirty, {"a.md", "b.md", "c.md"})
+
+    def test_snapshots_only_dirty_paths(self):
+        backups = []
+        watcher = VaultWatcher(ObsidianBackuper(self.vault_dir), self.password, debounce=0,
+                               watcher=FakeWatcher([]), on_backup=backups.append)
+        watcher.stop()
+        watcher.run()
+        self.assertEqual(len(backups), 1)
+        self.assertEqual(watcher.manifest.kind, "full")
+
+        self.write("Daily/tuesday.md", "new note")
+        self.write("index.md", "# index, edited")
+        shutil.rmtree(os.path.join(self.vault_dir, "Daily"))
+        self.write("Projects/plan.md", "plan")
+        watcher.record({"Daily", "index.md", "Projects"})
+        incremental = watcher.flush()
+
+        self.assertEqual(watcher.manifest.kind, "incremental")
+        self.assertEqual(watcher.manifest.parent, os.path.basename(backups[0]))
+        self.assertEqual(sorted(watcher.manifest.deleted), ["Daily", "Daily/monday.md"])
+        self.assertEqual(sorted(archive_members(incremental, self.password)),
+                         ["vault", "vault/Projects", "vault/Projects/plan.md", "vault/index.md"])
+
+        self.assertIsNone(watcher.flush())
+        watcher.record({"index.md"})
+        self.assertIsNone(watcher.flush())
+
+        restore_dir = os.path.join(self.test_dir, "restore")
+        restored = ObsidianBackuper(incremental, require_directory=False).restore_backup(
+            restore_dir, password=self.password
+        )
+        self.assertEqual(sorted(os.listdir(restored)), ["Projects", "index.md"])
+
+    def test_run_flushes_pending_changes_on_stop(self):
+        ObsidianBackuper(self.vault_dir).create_backup(encrypt=True, password=self.password)
+        self.write("index.md", "# changed")
+        fake = FakeWatcher([{"index.md"}])
+        watcher = VaultWatcher(ObsidianBackuper(self.vault_dir), self.password, debounce=60, watcher=fake)
+        fake.poll = lambda timeout: (watcher.stop(), FakeWatcher.poll(fake, timeout))[1]
+        watcher.run()
+        self.assertTrue(fake.closed)
+        self.assertEqual(watcher.manifest.kind, "incremental")
+        self.assertEqual(watcher.dirty, set())
+
+    def test_run_backs_up_changes_made_while_stopped(self):
+        backups = []
+        first = VaultWatcher(ObsidianBackuper(self.vault_dir), self.password, debounce=0,
+                             watcher=FakeWatcher([]), on_backup=backups.append)
+        first.stop()
+        first.run()
+        self.assertEqual(len(backups), 1)
+
+        self.write("index.md", "# edited while not watching")
+        fake = FakeWatcher([])
+        watcher = VaultWatcher(ObsidianBackuper(self.vault_dir), self.password, debounce=0,
+                               watcher=fake, on_backup=backups.append)
+        watcher.stop()
+        watcher.run()
+        self.assertEqual(len(backups), 2)
+        self.assertEqual(watcher.manifest.kind, "incremental")
+        self.assertEqual(watcher.manifest.parent, os.path.basename(backups[0]))
+        self.assertEqual(archive_members(backups[1], self.password), ["vault", "vault/index.md"])
+
+        # Nothing changed since: restarting writes no archive.
+        again = VaultWatcher(ObsidianBackuper(self.vault_dir), self.password, debounce=0,
+                             watcher=fake, on_backup=backups.append)
+        again.stop()
+        again.run()
+        self.assertEqual(len(backups), 2)
+
+
+@unittest.skipUnless(InotifyWatcher.available(), "inotify is Linux only")
+class TestInotifyWatcher(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.test_dir, "note.md"), "w") as f:
+            f.write("x")
+        self.watcher = InotifyWatcher(self.test_dir)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.test_dir)
+
+    def collect(self):
+        changed = set()
+        while True:
+            batch = self.watcher.poll(0.2)
+            if not batch:
+                return changed
+            changed |= batch
+
+    def test_ignored_directories_are_not_watched(self):
+        self.watcher.close()
+        os.makedirs(os.path.join(self.test_dir, "cache"))
+        self.watcher = InotifyWatcher(self.test_dir, IgnoreRules(["cache/", "tmp*/"]))
+        self.assertEqual(sorted(self.watcher._watches.values()), [""])
+
+        with open(os.path.join(self.test_dir, "cache", "entry"), "w") as f:
+            f.write("x")
+        self.assertEqual(self.collect(), set())
+
+        os.makedirs(os.path.join(self.test_dir, "tmp1"))
+        self.assertEqual(self.collect(), {"tmp1"})
+        with open(os.path.join(self.test_dir, "tmp1", "entry"), "w") as f:
+            f.write("x")
+        self.assertEqual(self.collect(), set())
+
+    def test_reports_changes_in_new_directories(self):
+        with open(os.path.join(self.test_dir, "note.md"), "a") as f:
+            f.write("y")
+        os.makedirs(os.path.join(self.test_dir, "new"))
+        self.assertEqual(self.collect(), {"note.md", "new"})
+
+        with open(os.path.join(self.test_dir, "new", "child.md"), "w") as f:
+            f.write("z")
+        os.unlink(os.path.join(self.test_dir, "note.md"))
+        self.assertEqual(self.collect(), {"new/child.md", "note.md"})
+
+
+class TestPollingWatcher(unittest.TestCase):
+    def test_reports_changes(self):
+        test_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(test_dir, "a.md"), "w") as f:
+                f.write("a")
+            watcher = PollingWatcher(test_dir, interval=0)
+            self.assertEqual(watcher.poll(0), set())
+            os.unlink(os.path.join(test_dir, "a.md"))
+            os.makedirs(os.path.join(test_dir, "sub"))
+            with open(os.path.join(test_dir, "sub", "b.md"), "w") as f:
+                f.write("b")
+            self.assertEqual(watcher.poll(0), {"a.md", "sub", "sub/b.md"})
+        finally:
+            shutil.rmtree(test_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()